@@ -0,0 +1,149 @@
+import io
+import wave
+import numpy as np
+from typing import Optional
+
+import av  # PyAV (vine cu faster-whisper) - decodare în proces, fără ffmpeg pornit per pachet
+
+from opus_relay import OpusClip
+
+TARGET_SAMPLE_RATE = 16000
+
+_WEBM_MAGIC = b"\x1a\x45\xdf\xa3"  # EBML (WebM / Matroska)
+_RIFF_MAGIC = b"RIFF"
+_OGG_MAGIC = b"OggS"
+
+
+def resample(samples: np.ndarray, src_rate: int, dst_rate: int = TARGET_SAMPLE_RATE) -> np.ndarray:
+    """Resampling vectorizat (float32 mono). 48k -> 16k: medie pe blocuri de 3 (anti-alias ieftin)."""
+    if src_rate == dst_rate or samples.size == 0:
+        return samples
+    if src_rate % dst_rate == 0:
+        factor = src_rate // dst_rate
+        usable = samples.size - samples.size % factor
+        return samples[:usable].reshape(-1, factor).mean(axis=1, dtype=np.float32)
+    duration = samples.size / src_rate
+    positions = np.arange(int(duration * dst_rate), dtype=np.float64) * (src_rate / dst_rate)
+    return np.interp(positions, np.arange(samples.size), samples).astype(np.float32)
+
+
+def to_mono_float32(frame_array: np.ndarray, fmt: str, channels: int) -> np.ndarray:
+    # PyAV: planar -> (canale, mostre), packed -> (1, mostre * canale)
+    if not fmt.endswith("p"):
+        frame_array = frame_array.reshape(-1, channels).T
+    if frame_array.dtype == np.int16:
+        frame_array = frame_array.astype(np.float32) / 32768.0
+    elif frame_array.dtype == np.int32:
+        frame_array = frame_array.astype(np.float32) / 2147483648.0
+    if channels > 1:
+        return frame_array.mean(axis=0, dtype=np.float32)
+    return frame_array[0].astype(np.float32, copy=False)
+
+
+def pcm16_to_float32(pcm: np.ndarray, channels: int, src_rate: int,
+                     dst_rate: int = TARGET_SAMPLE_RATE) -> np.ndarray:
+    """PCM s16 interleaved (ex. Discord: 48kHz stereo) -> float32 mono la dst_rate."""
+    frames = pcm[: len(pcm) - len(pcm) % channels].reshape(-1, channels)
+    if channels > 1:
+        mono = frames.mean(axis=1, dtype=np.float32) / 32768.0
+    else:
+        mono = frames[:, 0].astype(np.float32) / 32768.0
+    return resample(mono, src_rate, dst_rate)
+
+
+def float32_to_pcm16(samples: np.ndarray) -> np.ndarray:
+    return (np.clip(samples, -1.0, 1.0) * 32767.0).astype("<i2")
+
+
+class AudioDecoder:
+    """
+    Decodor persistent pe conexiune: WebM/Opus, Ogg, WAV sau pachete Opus brute
+    -> float32 mono 16kHz (Whisper) sau s16le (Vosk). Decoderul Opus e refolosit între mesaje.
+    """
+
+    def __init__(self, sample_rate: int = TARGET_SAMPLE_RATE):
+        self.sample_rate = sample_rate
+        self._opus: Optional[av.CodecContext] = None
+
+    def _opus_codec(self) -> av.CodecContext:
+        if self._opus is None:
+            self._opus = av.CodecContext.create("libopus", "r")
+            self._opus.sample_rate = 48000
+        return self._opus
+
+    def _frames_to_float32(self, frames) -> np.ndarray:
+        chunks = []
+        src_rate = self.sample_rate
+        for frame in frames:
+            src_rate = frame.sample_rate
+            chunks.append(to_mono_float32(frame.to_ndarray(), frame.format.name, len(frame.layout.channels)))
+        if not chunks:
+            return np.zeros(0, dtype=np.float32)
+        samples = chunks[0] if len(chunks) == 1 else np.concatenate(chunks)
+        return resample(samples, src_rate, self.sample_rate)
+
+    def _decode_wav(self, data: bytes) -> np.ndarray:
+        with wave.open(io.BytesIO(data), "rb") as wav:
+            channels, width, rate = wav.getnchannels(), wav.getsampwidth(), wav.getframerate()
+            raw = wav.readframes(wav.getnframes())
+        if width != 2:
+            raise ValueError(f"WAV cu {width * 8} biți nu e suportat (doar 16 biți)")
+        return pcm16_to_float32(np.frombuffer(raw, dtype="<i2"), channels, rate, self.sample_rate)
+
+    def _decode_container(self, data: bytes) -> np.ndarray:
+        # Demuxăm containerul (blob MediaRecorder); pachetele Opus trec prin decoderul persistent
+        with av.open(io.BytesIO(data), mode="r") as container:
+            stream = container.streams.audio[0]
+            if stream.codec_context.name == "opus":
+                codec = self._opus_codec()
+                # Blob nou = stream Opus nou: resetăm starea internă fără să recreăm decoderul
+                codec.flush_buffers()
+                # Pachetul gol de final (flush) ar închide decoderul persistent, deci îl sărim
+                frames = (f for packet in container.demux(stream) if packet.size
+                          for f in codec.decode(packet))
+                return self._frames_to_float32(frames)
+            return self._frames_to_float32(container.decode(stream))
+
+    def demux_opus(self, data: bytes) -> Optional[OpusClip]:
+        """Blob WebM / Ogg cu Opus -> pachetele brute, nedecodate (pt relay); None la alte formate."""
+        if data[:4] not in (_WEBM_MAGIC, _OGG_MAGIC):
+            return None
+        with av.open(io.BytesIO(data), mode="r") as container:
+            stream = container.streams.audio[0]
+            codec = stream.codec_context
+            if codec.name != "opus":
+                return None
+            clip = OpusClip(channels=len(codec.layout.channels), extradata=bytes(codec.extradata or b""))
+            for packet in container.demux(stream):
+                if packet.size:
+                    clip.append(bytes(packet))
+        return clip
+
+    def decode_clip(self, clip: OpusClip) -> np.ndarray:
+        """Pachetele unui clip (deja demuxate) prin decoderul persistent - un singur demux per blob."""
+        codec = self._opus_codec()
+        codec.flush_buffers()
+        return self._frames_to_float32(f for packet in clip.packets for f in codec.decode(av.Packet(packet)))
+
+    def decode_opus_packet(self, packet: bytes) -> np.ndarray:
+        """Un pachet Opus brut (mod streaming)."""
+        return self._frames_to_float32(self._opus_codec().decode(av.Packet(packet)))
+
+    def decode(self, data: bytes) -> np.ndarray:
+        """Orice blob primit pe websocket -> float32 mono 16kHz."""
+        if data[:4] == _RIFF_MAGIC:
+            return self._decode_wav(data)
+        if data[:4] in (_WEBM_MAGIC, _OGG_MAGIC):
+            return self._decode_container(data)
+        # Format necunoscut: lăsăm PyAV să ghicească
+        with av.open(io.BytesIO(data), mode="r") as container:
+            return self._frames_to_float32(container.decode(audio=0))
+
+    def decode_pcm16(self, data: bytes) -> bytes:
+        """Pentru Vosk: s16le mono 16kHz (cffi cere bytes, deci o singură copie la final)."""
+        if data[:4] == _RIFF_MAGIC:
+            with wave.open(io.BytesIO(data), "rb") as wav:
+                if (wav.getnchannels(), wav.getsampwidth(), wav.getframerate()) == (1, 2, self.sample_rate):
+                    # Deja în formatul Vosk -> trimitem cadrele așa cum sunt
+                    return wav.readframes(wav.getnframes())
+        return float32_to_pcm16(self.decode(data)).tobytes()
@@ -0,0 +1,299 @@
+import os
+import json
+import uuid
+import asyncio
+from typing import Awaitable, Callable, Dict, List, Optional, Set
+from urllib.parse import urlparse
+
+# --- CONFIGURARE ---
+# gol / memory:// = un singur proces; redis://host:port = mai multe procese/noduri pe aceeași magistrală
+BACKPLANE_URL = os.getenv('BACKPLANE_URL', 'memory://')
+BACKPLANE_PREFIX = os.getenv('BACKPLANE_PREFIX', 'toxicguard:room:')
+
+OnMessage = Callable[[str, bytes], Awaitable[None]]
+
+
+# ---------------- Plic (envelope) pe magistrală ----------------
+# header JSON pe o linie + payload brut (audio-ul nu trece prin base64)
+
+def pack(node: str, kind: str, payload: bytes = b"", **extra) -> bytes:
+    header = json.dumps({"node": node, "kind": kind, **extra}).encode()
+    return header + b"\n" + payload
+
+
+def unpack(data: bytes):
+    header, _, payload = data.partition(b"\n")
+    return json.loads(header), payload
+
+
+class Backplane:
+    """
+    Interfața comună: fiecare nod se abonează doar la camerele în care are clienți
+    și publică o singură dată per broadcast; magistrala livrează o dată per nod.
+    """
+
+    def __init__(self):
+        self.node_id = uuid.uuid4().hex[:12]
+        self.on_message: Optional[OnMessage] = None
+        self.published = 0
+        self.received = 0
+
+    async def start(self, on_message: OnMessage):
+        self.on_message = on_message
+
+    async def subscribe(self, room: str): ...
+
+    async def unsubscribe(self, room: str): ...
+
+    async def publish(self, room: str, data: bytes): ...
+
+    async def close(self): ...
+
+    def stats(self) -> dict:
+        return {"type": type(self).__name__, "node": self.node_id,
+                "published": self.published, "received": self.received}
+
+
+class InMemoryBus:
+    """Magistrala în proces (implicită; în teste mai multe 'noduri' pot împărți una)."""
+
+    def __init__(self):
+        self.subscribers: Dict[str, Set["InMemoryBackplane"]] = {}
+
+
+class InMemoryBackplane(Backplane):
+    def __init__(self, bus: Optional[InMemoryBus] = None):
+        super().__init__()
+        self.bus = bus or InMemoryBus()
+
+    async def subscribe(self, room: str):
+        self.bus.subscribers.setdefault(room, set()).add(self)
+
+    async def unsubscribe(self, room: str):
+        subs = self.bus.subscribers.get(room)
+        if subs:
+            subs.discard(self)
+            if not subs:
+                del self.bus.subscribers[room]
+
+    async def publish(self, room: str, data: bytes):
+        self.published += 1
+        for node in list(self.bus.subscribers.get(room, ())):
+            if node is not self:
+                node.received += 1
+                await node.on_message(room, data)
+
+    async def close(self):
+        for room in [r for r, subs in self.bus.subscribers.items() if self in subs]:
+            await self.unsubscribe(room)
+
+
+# ---------------- RESP (protocolul Redis), minimal ----------------
+
+def _bulk(part) -> bytes:
+    if isinstance(part, str):
+        part = part.encode()
+    return b"$%d\r\n%s\r\n" % (len(part), part)
+
+
+def encode_command(*parts) -> bytes:
+    return b"*%d\r\n" % len(parts) + b"".join(_bulk(part) for part in parts)
+
+
+async def read_reply(reader: asyncio.StreamReader):
+    line = await reader.readline()
+    if not line:
+        raise ConnectionError("conexiune închisă")
+    kind, rest = line[:1], line[1:-2]
+    if kind == b"+":
+        return rest.decode()
+    if kind == b"-":
+        raise RuntimeError(rest.decode())
+    if kind == b":":
+        return int(rest)
+    if kind == b"$":
+        size = int(rest)
+        if size < 0:
+            return None
+        data = await reader.readexactly(size + 2)
+        return data[:-2]
+    if kind == b"*":
+        size = int(rest)
+        return None if size < 0 else [await read_reply(reader) for _ in range(size)]
+    raise RuntimeError(f"răspuns RESP necunoscut: {line!r}")
+
+
+class RedisBackplane(Backplane):
+    """
+    Pub/sub compatibil Redis peste asyncio streams (fără client extern).
+    O conexiune pentru SUBSCRIBE (reconectare automată) și una pentru PUBLISH.
+    """
+
+    def __init__(self, url: str, prefix: str = BACKPLANE_PREFIX):
+        super().__init__()
+        parsed = urlparse(url)
+        self.host = parsed.hostname or "127.0.0.1"
+        self.port = parsed.port or 6379
+        self.prefix = prefix
+        self.rooms: Set[str] = set()
+        self._sub_writer: Optional[asyncio.StreamWriter] = None
+        self._pub: Optional[tuple] = None
+        self._pub_lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self._connected = asyncio.Event()
+        self.reconnects = 0
+
+    async def start(self, on_message: OnMessage):
+        await super().start(on_message)
+        self._task = asyncio.get_running_loop().create_task(self._subscriber())
+        await asyncio.wait_for(self._connected.wait(), timeout=5)
+
+    async def _subscriber(self):
+        delay = 0.5
+        while True:
+            try:
+                reader, writer = await asyncio.open_connection(self.host, self.port)
+                self._sub_writer = writer
+                if self.rooms:
+                    writer.write(encode_command("SUBSCRIBE", *[self.prefix + r for r in self.rooms]))
+                    await writer.drain()
+                self._connected.set()
+                delay = 0.5
+                while True:
+                    reply = await read_reply(reader)
+                    if isinstance(reply, list) and reply and reply[0] == b"message":
+                        room = reply[1].decode()[len(self.prefix):]
+                        self.received += 1
+                        try:
+                            await self.on_message(room, reply[2])
+                        except Exception as e:
+                            print(f"⚠️ Backplane: mesaj nelivrat în {room}: {e}")
+            except asyncio.CancelledError:
+                break
+            except (OSError, ConnectionError, asyncio.IncompleteReadError) as e:
+                self._connected.clear()
+                self._sub_writer = None
+                self.reconnects += 1
+                print(f"⚠️ Backplane {self.host}:{self.port} indisponibil ({e}), reîncerc în {delay:.1f}s")
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 10)
+
+    async def _send_sub(self, command: str, room: str):
+        if self._sub_writer is not None:
+            self._sub_writer.write(encode_command(command, self.prefix + room))
+            await self._sub_writer.drain()
+
+    async def subscribe(self, room: str):
+        if room not in self.rooms:
+            self.rooms.add(room)
+            await self._send_sub("SUBSCRIBE", room)
+
+    async def unsubscribe(self, room: str):
+        if room in self.rooms:
+            self.rooms.discard(room)
+            await self._send_sub("UNSUBSCRIBE", room)
+
+    async def publish(self, room: str, data: bytes):
+        async with self._pub_lock:
+            for attempt in range(2):
+                try:
+                    if self._pub is None:
+                        self._pub = await asyncio.open_connection(self.host, self.port)
+                    reader, writer = self._pub
+                    writer.write(encode_command("PUBLISH", self.prefix + room, data))
+                    await writer.drain()
+                    await read_reply(reader)
+                    self.published += 1
+                    return
+                except (OSError, ConnectionError, asyncio.IncompleteReadError) as e:
+                    self._pub = None
+                    if attempt:
+                        print(f"⚠️ Backplane: publish eșuat în {room}: {e}")
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+        for writer in (self._sub_writer, self._pub[1] if self._pub else None):
+            if writer is not None:
+                writer.close()
+
+    def stats(self) -> dict:
+        return {**super().stats(), "url": f"redis://{self.host}:{self.port}", "rooms": sorted(self.rooms),
+                "connected": self._connected.is_set(), "reconnects": self.reconnects}
+
+
+def make_backplane(url: str = BACKPLANE_URL) -> Backplane:
+    if not url or url.startswith("memory"):
+        return InMemoryBackplane()
+    if url.startswith("redis"):
+        return RedisBackplane(url)
+    raise ValueError(f"BACKPLANE_URL necunoscut: {url}")
+
+
+# ---------------- Broker local (stand-in pentru Redis) ----------------
+
+class LocalBroker:
+    """
+    Broker minimal care vorbește subsetul RESP folosit mai sus (SUBSCRIBE, UNSUBSCRIBE,
+    PUBLISH, PING). Pentru dev/teste: mai mulți workeri uvicorn fără un Redis instalat.
+    """
+
+    def __init__(self):
+        self.channels: Dict[str, Set[asyncio.StreamWriter]] = {}
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        subscribed: List[str] = []
+        try:
+            while True:
+                command = await read_reply(reader)
+                if not command:
+                    continue
+                name = command[0].decode().upper()
+                args = command[1:]
+                if name in ("SUBSCRIBE", "UNSUBSCRIBE"):
+                    for channel in (a.decode() for a in args):
+                        if name == "SUBSCRIBE":
+                            self.channels.setdefault(channel, set()).add(writer)
+                            subscribed.append(channel)
+                        else:
+                            self.channels.get(channel, set()).discard(writer)
+                            if channel in subscribed:
+                                subscribed.remove(channel)
+                        writer.write(b"*3\r\n" + _bulk(name.lower()) + _bulk(channel) +
+                                     b":%d\r\n" % len(subscribed))
+                elif name == "PUBLISH":
+                    channel, data = args[0].decode(), args[1]
+                    receivers = list(self.channels.get(channel, ()))
+                    message = encode_command("message", channel, data)
+                    for receiver in receivers:
+                        receiver.write(message)
+                    writer.write(b":%d\r\n" % len(receivers))
+                elif name == "PING":
+                    writer.write(b"+PONG\r\n")
+                else:
+                    writer.write(b"-ERR unknown command '%s'\r\n" % name.encode())
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError, OSError):
+            pass
+        finally:
+            for channel in subscribed:
+                self.channels.get(channel, set()).discard(writer)
+            writer.close()
+
+    async def serve(self, host: str = "127.0.0.1", port: int = 6379):
+        server = await asyncio.start_server(self.handle, host, port)
+        print(f"🚌 Broker backplane pe {host}:{port}")
+        return server
+
+
+if __name__ == "__main__":
+    # python backplane.py [port] -> BACKPLANE_URL=redis://127.0.0.1:<port>
+    import sys
+
+    async def main():
+        port = int(sys.argv[1]) if len(sys.argv) > 1 else 6379
+        server = await LocalBroker().serve(port=port)
+        async with server:
+            await server.serve_forever()
+
+    asyncio.run(main())
@@ -0,0 +1,599 @@
+import os
+import re
+import io
+import sys
+import csv
+import json
+import time
+import wave
+import shutil
+import random
+import asyncio
+import hashlib
+import argparse
+import platform
+import subprocess
+import tempfile
+from datetime import datetime
+from typing import Dict, List, Optional
+
+import numpy as np
+import aiohttp
+from aiohttp import web
+
+from audio_decode import AudioDecoder, float32_to_pcm16
+from verdict_cache import normalize_text
+
+# Benchmark end-to-end: audio pentru frazele din train_dataset.csv -> N clienți websocket -> verdict.
+#   python bench.py run --engine whisper --clients 8 --env WHISPER_MODEL=tiny.en
+#   python bench.py run --engine vosk --mode stream --clients 8
+#   python bench.py compare bench_results/<baseline>.json bench_results/<nou>.json
+
+# --- CONFIGURARE ---
+BENCH_DATASET = os.getenv('BENCH_DATASET', 'train_dataset.csv')
+BENCH_AUDIO_DIR = os.getenv('BENCH_AUDIO_DIR', 'bench_audio')        # wav-uri 16kHz mono, <id>.wav
+BENCH_RESULTS_DIR = os.getenv('BENCH_RESULTS_DIR', 'bench_results')  # un JSON per rulare
+BENCH_STUB_MATCH = float(os.getenv('BENCH_STUB_MATCH', '0.5'))       # similaritate minimă transcriere <-> frază
+SAMPLE_RATE = 16000
+STREAM_CHUNK_MS = 100
+RESULTS_VERSION = 1
+
+ENGINES = {
+    # engine (STT_ENGINE din server.py) -> variabilele de env cu modelele folosite și valorile implicite
+    "whisper": (("WHISPER_MODEL", "base.en"),),
+    "vosk": (("VOSK_MODEL_PATH", "model"),),
+    "cascade": (("VOSK_MODEL_PATH", "model"), ("WHISPER_MODEL", "base.en")),
+}
+
+
+# ---------------- Dataset + audio ----------------
+
+def load_dataset(path: str = BENCH_DATASET) -> List[dict]:
+    with open(path, newline="", encoding="utf-8") as f:
+        return [{"id": row["id"], "text": row["text"], "expected": row["expected_label"].strip().upper()}
+                for row in csv.DictReader(f)]
+
+
+def _tts_command(text: str, path: str) -> Optional[List[str]]:
+    # Primul TTS offline găsit în PATH
+    for tool in ("espeak-ng", "espeak"):
+        if shutil.which(tool):
+            return [tool, "-v", "en-us", "-s", "160", "-w", path, text]
+    if shutil.which("flite"):
+        return ["flite", "-t", text, "-o", path]
+    if shutil.which("say"):
+        return ["say", "--file-format=WAVE", "--data-format=LEI16@16000", "-o", path, text]
+    return None
+
+
+def synth_tone(text: str, sample_rate: int = SAMPLE_RATE) -> np.ndarray:
+    """Fără TTS: câte un "cuvânt" tonal per cuvânt din frază (doar pentru încărcare, nu acuratețe)."""
+    parts = []
+    for word in text.split():
+        pitch = 120 + int(hashlib.md5(word.encode()).hexdigest()[:4], 16) % 180
+        t = np.arange(int(sample_rate * (0.18 + 0.04 * len(word)))) / sample_rate
+        tone = sum(np.sin(2 * np.pi * pitch * k * t) / k for k in (1, 2, 3))
+        parts.append(0.25 * tone * np.hanning(len(t)))
+        parts.append(np.zeros(int(sample_rate * 0.06)))
+    return np.concatenate(parts).astype(np.float32) if parts else np.zeros(sample_rate, np.float32)
+
+
+def write_wav(path: str, samples: np.ndarray, sample_rate: int = SAMPLE_RATE):
+    with wave.open(path, "wb") as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(sample_rate)
+        wav.writeframes(float32_to_pcm16(samples).tobytes())
+
+
+def prepare_audio(dataset: List[dict], audio_dir: str = BENCH_AUDIO_DIR, synth: str = "auto",
+                  source_dir: Optional[str] = None) -> str:
+    """
+    Produce <audio_dir>/<id>.wav (16kHz mono s16) pentru fiecare frază:
+    replay din source_dir (înregistrări reale, orice format citit de AudioDecoder),
+    altfel TTS offline, altfel ton sintetic. Întoarce metoda folosită (intră în rezultate).
+    """
+    os.makedirs(audio_dir, exist_ok=True)
+    manifest_path = os.path.join(audio_dir, "manifest.json")
+    decoder = AudioDecoder(SAMPLE_RATE)
+    method = "replay" if source_dir else synth
+    if method == "auto":
+        method = "tts" if _tts_command("test", os.devnull) else "tone"
+    if method == "tts" and _tts_command("test", os.devnull) is None:
+        raise SystemExit("❌ Niciun TTS offline (espeak-ng / espeak / flite / say). Folosește --synth tone sau --source-dir.")
+
+    for item in dataset:
+        path = os.path.join(audio_dir, f"{item['id']}.wav")
+        if method == "replay":
+            matches = [f for f in os.listdir(source_dir) if os.path.splitext(f)[0] == item["id"]]
+            if not matches:
+                raise SystemExit(f"❌ Lipsește înregistrarea pentru id {item['id']} în {source_dir}")
+            with open(os.path.join(source_dir, matches[0]), "rb") as f:
+                samples = decoder.decode(f.read())
+        elif method == "tts":
+            with tempfile.TemporaryDirectory() as tmp:
+                raw = os.path.join(tmp, "tts.wav")
+                subprocess.run(_tts_command(item["text"], raw), check=True, capture_output=True)
+                with open(raw, "rb") as f:
+                    samples = decoder.decode(f.read())
+        else:
+            samples = synth_tone(item["text"])
+        # Puțină liniște la capete, ca la o frază reală (VAD-ul o taie)
+        pad = np.zeros(int(SAMPLE_RATE * 0.2), np.float32)
+        write_wav(path, np.concatenate([pad, samples, pad]))
+
+    with open(manifest_path, "w", encoding="utf-8") as f:
+        json.dump({"method": method, "count": len(dataset), "created": datetime.now().isoformat(timespec="seconds")}, f)
+    print(f"🎙️ {len(dataset)} fraze pregătite în {audio_dir} ({method})")
+    return method
+
+
+def load_audio(dataset: List[dict], audio_dir: str) -> Dict[str, bytes]:
+    audio = {}
+    for item in dataset:
+        with open(os.path.join(audio_dir, f"{item['id']}.wav"), "rb") as f:
+            audio[item["id"]] = f.read()
+    return audio
+
+
+def wav_pcm(data: bytes) -> bytes:
+    with wave.open(io.BytesIO(data), "rb") as wav:
+        return wav.readframes(wav.getnframes())
+
+
+# ---------------- Stub pentru serviciul de toxicitate ----------------
+
+class ToxicityStub:
+    """
+    Înlocuiește BERT-ul: latență configurabilă și verdict luat din dataset. Transcrierea e potrivită
+    (Jaccard pe cuvinte) cu cea mai apropiată frază; dacă aceea e TOXIC, răspundem toxic.
+    Așa acuratețea măsoară cât strică STT-ul, nu clasificatorul.
+    """
+
+    def __init__(self, dataset: List[dict], latency_ms: float = 50, jitter_ms: float = 0,
+                 match: float = BENCH_STUB_MATCH):
+        self.phrases = [(set(normalize_text(d["text"]).split()), d["expected"]) for d in dataset]
+        self.latency = latency_ms / 1000
+        self.jitter = jitter_ms / 1000
+        self.match = match
+        self.requests = 0
+        self.texts = 0
+
+    def verdict(self, text: str) -> List[dict]:
+        words = set(normalize_text(text).split())
+        if not words:
+            return []
+        score, label = max(((len(words & p) / len(words | p), label) for p, label in self.phrases), default=(0, "SAFE"))
+        return [{"label": "toxic", "score": round(score, 3)}] if score >= self.match and label == "TOXIC" else []
+
+    async def _sleep(self):
+        await asyncio.sleep(max(0.0, self.latency + random.uniform(-self.jitter, self.jitter)))
+
+    async def check(self, request):
+        data = await request.json()
+        self.requests += 1
+        self.texts += 1
+        await self._sleep()
+        return web.json_response({"toxic_labels": self.verdict(data.get("text", ""))})
+
+    async def check_batch(self, request):
+        data = await request.json()
+        self.requests += 1
+        self.texts += len(data.get("texts", []))
+        await self._sleep()
+        return web.json_response({"results": [self.verdict(t) for t in data.get("texts", [])]})
+
+    async def start(self, port: int = 0, host: str = "127.0.0.1") -> str:
+        app = web.Application()
+        app.router.add_post("/check", self.check)
+        app.router.add_post("/check_batch", self.check_batch)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        port = self._runner.addresses[0][1]
+        return f"http://{host}:{port}/check"
+
+    async def close(self):
+        await self._runner.cleanup()
+
+    def stats(self) -> dict:
+        return {"latency_ms": self.latency * 1000, "jitter_ms": self.jitter * 1000,
+                "requests": self.requests, "texts": self.texts}
+
+
+# ---------------- Serverul testat (subproces) ----------------
+
+def _free_port() -> int:
+    import socket
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+class ProcessCpu:
+    """CPU (user+sys) și memorie de vârf ale unui proces, din /proc (None pe alte sisteme)."""
+
+    def __init__(self, pid: int):
+        self.pid = pid
+        self.tick = os.sysconf("SC_CLK_TCK") if hasattr(os, "sysconf") else 100
+
+    def cpu_seconds(self) -> Optional[float]:
+        try:
+            with open(f"/proc/{self.pid}/stat") as f:
+                fields = f.read().rsplit(")", 1)[1].split()
+            return (int(fields[11]) + int(fields[12])) / self.tick
+        except (OSError, IndexError, ValueError):
+            return None
+
+    def peak_rss_mb(self) -> Optional[float]:
+        try:
+            with open(f"/proc/{self.pid}/status") as f:
+                for line in f:
+                    if line.startswith("VmHWM:"):
+                        return int(line.split()[1]) / 1024
+        except OSError:
+            pass
+        return None
+
+
+class ServerProcess:
+    def __init__(self, engine: str, env: Dict[str, str], toxicity_url: str, log_dir: str):
+        self.app = "server:app"
+        self.port = _free_port()
+        # Fără cache de verdicte (frazele se repetă între clienți) și fără prefilter (e antrenat
+        # pe aceleași fraze), dacă nu se cer explicit cu --env
+        self.env = {**os.environ, "TOXICITY_CACHE_SIZE": "0", "PREFILTER_ENABLED": "0", "STT_ENGINE": engine, "STT_PRELOAD": engine, **env,
+                    "TOXICITY_API_URL": toxicity_url,
+                    "TOXICITY_BATCH_URL": toxicity_url + "_batch",
+                    # Log-ul de interacțiuni al benchmark-ului nu se amestecă cu cel real
+                    "LOG_DIR": log_dir}
+        self.proc: Optional[subprocess.Popen] = None
+        self.url = f"http://127.0.0.1:{self.port}"
+
+    async def start(self, timeout: float = 600):
+        cmd = [sys.executable, "-m", "uvicorn", self.app, "--host", "127.0.0.1", "--port", str(self.port)]
+        self.log = open(os.path.join(self.env["LOG_DIR"], "server.log"), "w")
+        self.proc = subprocess.Popen(cmd, env=self.env, stdout=self.log, stderr=subprocess.STDOUT)
+        started = time.perf_counter()
+        # Modelele se încarcă pe fundal -> așteptăm /ready (200), nu doar HTTP
+        async with aiohttp.ClientSession() as session:
+            while time.perf_counter() - started < timeout:
+                if self.proc.poll() is not None:
+                    raise SystemExit(f"❌ Serverul s-a oprit (cod {self.proc.returncode}), vezi {self.log.name}")
+                try:
+                    async with session.get(self.url + "/ready") as resp:
+                        if resp.status == 200:
+                            self.load_seconds = time.perf_counter() - started
+                            return
+                except aiohttp.ClientError:
+                    pass
+                await asyncio.sleep(0.5)
+        raise SystemExit(f"❌ Serverul nu a pornit în {timeout:.0f}s")
+
+    def stop(self):
+        if self.proc is not None and self.proc.poll() is None:
+            self.proc.terminate()
+            try:
+                self.proc.wait(timeout=15)
+            except subprocess.TimeoutExpired:
+                self.proc.kill()
+        self.log.close()
+
+
+# ---------------- Clienți websocket simulați ----------------
+
+class BenchClient:
+    """Un user: trimite frazele pe rând și așteaptă verdictul pentru fiecare."""
+
+    def __init__(self, index: int, base_url: str, room: str, mode: str, timeout: float, gap: float, pace: bool):
+        self.username = f"bench{index}"
+        path = f"/ws/stream/{room}/{index}" if mode == "stream" else f"/ws/{room}/{index}"
+        self.url = base_url.replace("http", "ws", 1) + path + f"?username={self.username}"
+        self.mode = mode
+        self.timeout = timeout
+        self.gap = gap
+        self.pace = pace
+        self.events: asyncio.Queue = asyncio.Queue()
+        self.received_audio = 0
+
+    async def _reader(self, ws):
+        async for msg in ws:
+            if msg.type == aiohttp.WSMsgType.BINARY:
+                self.received_audio += 1
+                continue
+            if msg.type != aiohttp.WSMsgType.TEXT:
+                break
+            data = json.loads(msg.data)
+            # Verdictul pentru noi: speaking_start cu numele nostru (SAFE) sau status toxic / busy
+            if data.get("type") == "speaking_start" and data.get("user") == self.username:
+                self.events.put_nowait(("safe", time.perf_counter()))
+            elif data.get("type") == "status":
+                self.events.put_nowait((data.get("status", "status"), time.perf_counter()))
+
+    async def _send(self, ws, audio: bytes):
+        if self.mode == "blob":
+            await ws.send_bytes(audio)
+            return
+        pcm = wav_pcm(audio)
+        step = SAMPLE_RATE * 2 * STREAM_CHUNK_MS // 1000
+        for i in range(0, len(pcm), step):
+            await ws.send_bytes(pcm[i:i + step])
+            if self.pace:
+                await asyncio.sleep(STREAM_CHUNK_MS / 1000)
+        await ws.send_str(json.dumps({"type": "end"}))
+
+    async def run(self, session: aiohttp.ClientSession, items: List[dict], audio: Dict[str, bytes]) -> List[dict]:
+        rows = []
+        async with session.ws_connect(self.url, max_msg_size=0) as ws:
+            reader = asyncio.create_task(self._reader(ws))
+            await asyncio.sleep(0.2)  # user_list / system la conectare
+            for item in items:
+                while not self.events.empty():
+                    self.events.get_nowait()  # verdicte întârziate de la fraza anterioară
+                started = time.perf_counter()
+                await self._send(ws, audio[item["id"]])
+                sent = time.perf_counter()
+                try:
+                    outcome, at = await asyncio.wait_for(self.events.get(), self.timeout)
+                except asyncio.TimeoutError:
+                    outcome, at = "timeout", None
+                rows.append({
+                    "id": item["id"], "client": self.username, "expected": item["expected"], "outcome": outcome,
+                    # Latența = de la ultimul byte trimis la verdict (în streaming poate veni și mai devreme)
+                    "latency_ms": round(max(0.0, at - sent) * 1000, 2) if at else None,
+                    "early": bool(at and at < sent),
+                    "send_ms": round((sent - started) * 1000, 2),
+                    "audio_s": round(len(wav_pcm(audio[item["id"]])) / 2 / SAMPLE_RATE, 3),
+                })
+                await asyncio.sleep(self.gap)
+            await ws.close()
+            reader.cancel()
+        return rows
+
+
+# ---------------- Rezumat + rezultate ----------------
+
+def _pct(values, q):
+    return round(float(np.percentile(values, q)), 2) if values else None
+
+
+def summarize(rows: List[dict], wall_s: float, cpu_s: Optional[float]) -> dict:
+    answered = [r for r in rows if r["latency_ms"] is not None]
+    latency = [r["latency_ms"] for r in answered]
+    verdicts = [r for r in rows if r["outcome"] in ("safe", "toxic")]
+    confusion = {"tp": 0, "fp": 0, "tn": 0, "fn": 0}
+    for r in verdicts:
+        toxic, expected = r["outcome"] == "toxic", r["expected"] == "TOXIC"
+        confusion[("t" if toxic == expected else "f") + ("p" if toxic else "n")] += 1
+    tp, fp, fn = confusion["tp"], confusion["fp"], confusion["fn"]
+    outcomes: Dict[str, int] = {}
+    for r in rows:
+        outcomes[r["outcome"]] = outcomes.get(r["outcome"], 0) + 1
+    audio_s = sum(r["audio_s"] for r in rows)
+    return {
+        "utterances": len(rows),
+        "answered": len(answered),
+        "outcomes": outcomes,
+        "wall_s": round(wall_s, 2),
+        "throughput_per_s": round(len(answered) / wall_s, 3) if wall_s else None,
+        # Secunde de audio procesate per secundă reală (peste 1 = ține pasul)
+        "audio_per_wall": round(audio_s / wall_s, 3) if wall_s else None,
+        "latency_ms": {"p50": _pct(latency, 50), "p95": _pct(latency, 95), "p99": _pct(latency, 99),
+                       "avg": round(float(np.mean(latency)), 2) if latency else None,
+                       "max": round(max(latency), 2) if latency else None},
+        "cpu_s": round(cpu_s, 2) if cpu_s is not None else None,
+        "cpu_percent": round(cpu_s / wall_s * 100, 1) if cpu_s is not None and wall_s else None,
+        "accuracy": round((confusion["tp"] + confusion["tn"]) / len(verdicts), 4) if verdicts else None,
+        "precision": round(tp / (tp + fp), 4) if tp + fp else None,
+        "recall": round(tp / (tp + fn), 4) if tp + fn else None,
+        "confusion": confusion,
+    }
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def save_results(result: dict, directory: str = BENCH_RESULTS_DIR) -> str:
+    os.makedirs(directory, exist_ok=True)
+    run = result["run"]
+    label = re.sub(r"[^\w.-]+", "_", run["label"])
+    path = os.path.join(directory, f"{datetime.now().strftime('%Y%m%d-%H%M%S')}-{run['engine']}-{label}.json")
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(result, f, indent=1, ensure_ascii=False)
+    return path
+
+
+def print_summary(summary: dict):
+    lat = summary["latency_ms"]
+    print(f"📊 {summary['answered']}/{summary['utterances']} cu verdict, {summary['throughput_per_s']} fraze/s, "
+          f"audio x{summary['audio_per_wall']}")
+    print(f"⏱️ p50 {lat['p50']}ms | p95 {lat['p95']}ms | p99 {lat['p99']}ms | max {lat['max']}ms")
+    print(f"🖥️ CPU server: {summary['cpu_s']}s ({summary['cpu_percent']}%)")
+    print(f"🎯 Acuratețe {summary['accuracy']} (precision {summary['precision']}, recall {summary['recall']}), "
+          f"rezultate: {summary['outcomes']}")
+
+
+async def run_bench(args) -> dict:
+    dataset = load_dataset(args.dataset)
+    if args.limit:
+        dataset = dataset[:args.limit]
+    manifest = os.path.join(args.audio_dir, "manifest.json")
+    if not os.path.exists(manifest) or any(not os.path.exists(os.path.join(args.audio_dir, f"{d['id']}.wav"))
+                                           for d in dataset):
+        prepare_audio(dataset, args.audio_dir, args.synth, args.source_dir)
+    with open(manifest, encoding="utf-8") as f:
+        audio_method = json.load(f)["method"]
+    audio = load_audio(dataset, args.audio_dir)
+
+    env = dict(kv.split("=", 1) for kv in args.env)
+    model = "+".join(env.get(var, os.getenv(var, default)) for var, default in ENGINES[args.engine])
+
+    stub = ToxicityStub(dataset, args.stub_latency_ms, args.stub_jitter_ms)
+    toxicity_url = args.toxicity_url or await stub.start()
+    log_dir = tempfile.mkdtemp(prefix="bench-logs-")
+    server = None
+    base_url = args.server_url
+    if base_url is None:
+        server = ServerProcess(args.engine, env, toxicity_url, log_dir)
+        print(f"🚀 Pornesc {server.app} (STT_ENGINE={args.engine}, {model}) pe portul {server.port}...")
+        await server.start()
+        print(f"✅ Server gata în {server.load_seconds:.1f}s")
+        base_url = server.url
+
+    # Fiecare client primește frazele în altă ordine (aceeași pentru un seed dat)
+    rng = random.Random(args.seed)
+    plans = []
+    for _ in range(args.clients):
+        items = dataset * args.repeat
+        rng.shuffle(items)
+        plans.append(items)
+
+    try:
+        async with aiohttp.ClientSession() as session:
+            if args.warmup:
+                # O frază de încălzire (încărcări leneșe, cache-uri de kernel) - nu intră în rezultate
+                await BenchClient(args.clients, base_url, f"{args.room}-warmup", args.mode, args.timeout, 0,
+                                  False).run(session, dataset[:1], audio)
+            cpu = ProcessCpu(server.proc.pid) if server else None
+            cpu_before = cpu.cpu_seconds() if cpu else None
+            started = time.perf_counter()
+            clients = [BenchClient(i, base_url, args.room, args.mode, args.timeout, args.gap_ms / 1000, not args.no_pace)
+                       for i in range(args.clients)]
+            results = await asyncio.gather(*[c.run(session, plan, audio) for c, plan in zip(clients, plans)])
+            wall = time.perf_counter() - started
+            cpu_after = cpu.cpu_seconds() if cpu else None
+            peak_rss = cpu.peak_rss_mb() if cpu else None
+            try:
+                async with session.get(base_url + "/metrics/json") as resp:
+                    server_metrics = await resp.json() if resp.status == 200 else None
+            except aiohttp.ClientError:
+                server_metrics = None
+    finally:
+        if server is not None:
+            server.stop()
+        if not args.toxicity_url:
+            await stub.close()
+
+    rows = [row for client_rows in results for row in client_rows]
+    cpu_s = cpu_after - cpu_before if cpu_before is not None and cpu_after is not None else None
+    summary = summarize(rows, wall, cpu_s)
+    summary["server_peak_rss_mb"] = round(peak_rss, 1) if peak_rss else None
+    return {
+        "version": RESULTS_VERSION,
+        "run": {
+            "label": args.label or f"{model}-{args.mode}-c{args.clients}",
+            "engine": args.engine, "model": model, "mode": args.mode,
+            "clients": args.clients, "repeat": args.repeat, "seed": args.seed,
+            "dataset": args.dataset, "phrases": len(dataset), "audio": audio_method,
+            "toxicity": "external" if args.toxicity_url else stub.stats(),
+            "env": env, "server_load_s": round(server.load_seconds, 2) if server else None,
+            "commit": _git_commit(), "started": datetime.now().isoformat(timespec="seconds"),
+            "host": {"cpus": os.cpu_count(), "platform": platform.platform(), "python": platform.python_version()},
+        },
+        "summary": summary,
+        "server_metrics": server_metrics,
+        "utterances": rows,
+    }
+
+
+# ---------------- Comparare între rulări ----------------
+
+def compare(paths: List[str], max_latency_regression: float, max_accuracy_drop: float) -> int:
+    """Primul fișier e baseline-ul; întoarce 1 dacă o rulare e mai slabă peste praguri."""
+    runs = []
+    for path in paths:
+        with open(path, encoding="utf-8") as f:
+            runs.append((path, json.load(f)))
+    header = f"{'rulare':<40} {'engine':<8} {'cl':>3} {'n':>5} {'fr/s':>7} {'p50':>8} {'p95':>8} {'p99':>8} {'cpu%':>6} {'acc':>6}"
+    print(header)
+    print("-" * len(header))
+    base = runs[0][1]["summary"]
+    failed = 0
+    for path, result in runs:
+        run, s = result["run"], result["summary"]
+        lat = s["latency_ms"]
+        flags = []
+        if base["latency_ms"]["p95"] and lat["p95"] and lat["p95"] > base["latency_ms"]["p95"] * (1 + max_latency_regression):
+            flags.append("p95↑")
+        if base["accuracy"] is not None and s["accuracy"] is not None and s["accuracy"] < base["accuracy"] - max_accuracy_drop:
+            flags.append("acc↓")
+        if run.get("audio") == "tone":
+            flags.append("ton")
+        failed += bool(set(flags) - {"ton"})
+        name = run["label"][:40]
+        print(f"{name:<40} {run['engine']:<8} {run['clients']:>3} {s['answered']:>5} {s['throughput_per_s'] or 0:>7} "
+              f"{lat['p50'] or '-':>8} {lat['p95'] or '-':>8} {lat['p99'] or '-':>8} {s['cpu_percent'] or '-':>6} "
+              f"{s['accuracy'] if s['accuracy'] is not None else '-':>6} {' '.join(('⚠️ ' + f) for f in flags)}")
+    return 1 if failed else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark end-to-end pentru server.py (whisper / vosk / cascade)")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    prep = sub.add_parser("prepare", help="generează/convertește audio pentru frazele din dataset")
+    run = sub.add_parser("run", help="pornește serverul, rulează clienții, salvează rezultatul")
+    for p in (prep, run):
+        p.add_argument("--dataset", default=BENCH_DATASET)
+        p.add_argument("--audio-dir", default=BENCH_AUDIO_DIR)
+        p.add_argument("--synth", choices=("auto", "tts", "tone"), default="auto",
+                       help="tone = doar încărcare, transcrierile nu au sens")
+        p.add_argument("--source-dir", help="înregistrări reale <id>.wav/.webm de redat în loc de sinteză")
+        p.add_argument("--limit", type=int, default=0, help="doar primele N fraze")
+
+    run.add_argument("--engine", choices=sorted(ENGINES), default="whisper")
+    run.add_argument("--mode", choices=("blob", "stream"), default="blob")
+    run.add_argument("--clients", type=int, default=4)
+    run.add_argument("--repeat", type=int, default=1, help="de câte ori trece fiecare client prin dataset")
+    run.add_argument("--gap-ms", type=float, default=200, help="pauză între fraze, per client")
+    run.add_argument("--timeout", type=float, default=30, help="fără verdict după atât = timeout")
+    run.add_argument("--no-pace", action="store_true", help="stream: trimite chunk-urile fără ritm real")
+    run.add_argument("--no-warmup", dest="warmup", action="store_false")
+    run.add_argument("--room", default="bench")
+    run.add_argument("--seed", type=int, default=1)
+    run.add_argument("--env", action="append", default=[], metavar="KEY=VAL",
+                     help="config pentru server, ex. --env STT_WORKERS=2 --env WHISPER_MODEL=tiny.en")
+    run.add_argument("--stub-latency-ms", type=float, default=50)
+    run.add_argument("--stub-jitter-ms", type=float, default=10)
+    run.add_argument("--toxicity-url", help="serviciul real în loc de stub")
+    run.add_argument("--server-url", help="server deja pornit (fără CPU / env controlat)")
+    run.add_argument("--label")
+    run.add_argument("--results-dir", default=BENCH_RESULTS_DIR)
+
+    stub = sub.add_parser("stub", help="doar stub-ul de toxicitate (pt servere pornite manual)")
+    stub.add_argument("--dataset", default=BENCH_DATASET)
+    stub.add_argument("--port", type=int, default=8100)
+    stub.add_argument("--latency-ms", type=float, default=50)
+    stub.add_argument("--jitter-ms", type=float, default=10)
+
+    cmp_ = sub.add_parser("compare", help="tabel între rulări; primul fișier e baseline-ul")
+    cmp_.add_argument("results", nargs="+")
+    cmp_.add_argument("--max-latency-regression", type=float, default=0.10, help="p95 mai mare cu peste 10%%")
+    cmp_.add_argument("--max-accuracy-drop", type=float, default=0.02)
+
+    args = parser.parse_args()
+    if args.command == "prepare":
+        dataset = load_dataset(args.dataset)
+        prepare_audio(dataset[:args.limit] if args.limit else dataset, args.audio_dir, args.synth, args.source_dir)
+    elif args.command == "run":
+        result = asyncio.run(run_bench(args))
+        print_summary(result["summary"])
+        print(f"💾 {save_results(result, args.results_dir)}")
+    elif args.command == "stub":
+        async def serve():
+            stub_ = ToxicityStub(load_dataset(args.dataset), args.latency_ms, args.jitter_ms)
+            print(f"🧪 Stub toxicitate pe {await stub_.start(args.port)} (TOXICITY_API_URL)")
+            await asyncio.Event().wait()
+        asyncio.run(serve())
+    elif args.command == "compare":
+        sys.exit(compare(args.results, args.max_latency_regression, args.max_accuracy_drop))
+
+
+if __name__ == "__main__":
+    main()
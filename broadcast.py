@@ -0,0 +1,287 @@
+import os
+import json
+import time
+import asyncio
+from collections import deque
+from typing import Dict, List, Optional, Set
+
+from fastapi import WebSocket
+
+import metrics
+from backplane import Backplane, make_backplane, pack, unpack
+
+# --- CONFIGURARE ---
+BROADCAST_QUEUE_SIZE = int(os.getenv('BROADCAST_QUEUE_SIZE', '32'))         # mesaje în așteptare per conexiune
+BROADCAST_POLICY = os.getenv('BROADCAST_POLICY', 'drop_oldest').lower()    # drop_oldest | disconnect
+BROADCAST_SEND_TIMEOUT = float(os.getenv('BROADCAST_SEND_TIMEOUT', '5'))   # un send blocat mai mult = client mort
+DEFAULT_ROOM = os.getenv('DEFAULT_ROOM', 'lobby')                        # camera pentru /ws/{client_id}
+SLOW_CONSUMER_CLOSE_CODE = 1013  # "Try Again Later"
+
+
+class Outbound:
+    """
+    Coada de ieșire a unei conexiuni + task-ul care scrie în socket. Doar task-ul ăsta
+    trimite pe websocket, deci un client lent își umple doar propria coadă.
+    """
+
+    def __init__(self, websocket: WebSocket, username: str, on_dead, max_queue: int = BROADCAST_QUEUE_SIZE,
+                 policy: str = BROADCAST_POLICY, send_timeout: float = BROADCAST_SEND_TIMEOUT, opus: bool = False):
+        self.websocket = websocket
+        self.username = username
+        self.opus = opus  # clientul știe să redea cadre Opus (WebCodecs) -> primește clipul Opus, nu blob-ul
+        self.on_dead = on_dead
+        self.max_queue = max_queue
+        self.policy = policy
+        self.send_timeout = send_timeout
+        self.queue: deque = deque()
+        self._wake = asyncio.Event()
+        self.closed = False
+        self.sent = 0
+        self.dropped = 0
+        self.send_errors = 0
+        self.lag_ms = 0.0       # cât a stat la coadă ultimul mesaj trimis
+        self.max_lag_ms = 0.0
+        self.task = asyncio.get_running_loop().create_task(self._writer())
+
+    def offer(self, kind: str, payload) -> bool:
+        """kind: "bytes" (audio, se poate pierde) sau "text" (JSON deja serializat)."""
+        if self.closed:
+            return False
+        if len(self.queue) >= self.max_queue:
+            if self.policy == "disconnect":
+                self.dropped += 1
+                self.close(f"coadă plină ({len(self.queue)})")
+                return False
+            # Aruncăm cel mai vechi cadru audio; mesajele de control le păstrăm dacă se poate
+            victim = next((i for i, item in enumerate(self.queue) if item[0] == "bytes"), 0)
+            del self.queue[victim]
+            self.dropped += 1
+        self.queue.append((kind, payload, time.perf_counter()))
+        self._wake.set()
+        return True
+
+    async def _writer(self):
+        try:
+            while not self.closed:
+                if not self.queue:
+                    self._wake.clear()
+                    await self._wake.wait()
+                    continue
+                kind, payload, enqueued_at = self.queue.popleft()
+                self.lag_ms = (time.perf_counter() - enqueued_at) * 1000
+                self.max_lag_ms = max(self.max_lag_ms, self.lag_ms)
+                send = self.websocket.send_bytes(payload) if kind == "bytes" else self.websocket.send_text(payload)
+                await asyncio.wait_for(send, self.send_timeout)
+                self.sent += 1
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            self.send_errors += 1
+            self.close(f"{type(e).__name__}: {e}")
+
+    def close(self, reason: str):
+        if self.closed:
+            return
+        self.closed = True
+        self.queue.clear()
+        self._wake.set()
+        print(f"✂️ Conexiune {self.username} închisă de broadcast: {reason}")
+        self.on_dead(self)
+
+    def stats(self) -> dict:
+        return {
+            "user": self.username,
+            "relay": "opus" if self.opus else "blob",
+            "queued": len(self.queue),
+            "sent": self.sent,
+            "dropped": self.dropped,
+            "send_errors": self.send_errors,
+            "lag_ms": round(self.lag_ms, 2),
+            "max_lag_ms": round(self.max_lag_ms, 2),
+        }
+
+
+class ConnectionManager:
+    """
+    Broadcast fără blocaje, pe camere: fiecare conexiune are coada ei limitată și writer-ul ei.
+    Payload-ul (JSON sau audio) se codează o singură dată și se pune în toate cozile locale,
+    apoi trece o singură dată prin backplane spre celelalte noduri (workeri / mașini).
+    """
+
+    def __init__(self, policy: str = BROADCAST_POLICY, max_queue: int = BROADCAST_QUEUE_SIZE,
+                 backplane: Optional[Backplane] = None):
+        self.policy = policy
+        self.max_queue = max_queue
+        self.backplane = backplane or make_backplane()
+        self.rooms: Dict[str, Dict[WebSocket, Outbound]] = {}
+        self.room_of: Dict[WebSocket, str] = {}
+        # Userii din aceeași cameră conectați la alte noduri: room -> node -> [useri]
+        self.remote_users: Dict[str, Dict[str, List[str]]] = {}
+        self._started = False
+        self.kicked = 0
+        self._kicks: Set[asyncio.Task] = set()  # închideri de clienți lenți în curs
+
+    @property
+    def node_id(self) -> str:
+        return self.backplane.node_id
+
+    @property
+    def active_connections(self) -> Dict[WebSocket, str]:
+        return {ws: out.username for room in self.rooms.values() for ws, out in room.items()}
+
+    def room_users(self, room: str) -> List[str]:
+        local = [out.username for out in self.rooms.get(room, {}).values()]
+        remote = [user for users in self.remote_users.get(room, {}).values() for user in users]
+        return local + remote
+
+    async def _ensure_started(self):
+        if not self._started:
+            self._started = True
+            await self.backplane.start(self._on_bus_message)
+
+    async def connect(self, websocket: WebSocket, username: str, room: str = DEFAULT_ROOM, opus: bool = False):
+        # websocket.accept() e treaba endpoint-ului
+        await self._ensure_started()
+        if room not in self.rooms:
+            self.rooms[room] = {}
+            await self.backplane.subscribe(room)
+            # Cerem celorlalte noduri lista lor de useri din cameră
+            await self.backplane.publish(room, pack(self.node_id, "presence_query"))
+        self.rooms[room][websocket] = Outbound(websocket, username, self._on_dead,
+                                               max_queue=self.max_queue, policy=self.policy, opus=opus)
+        self.room_of[websocket] = room
+        await self.broadcast_user_list(room)
+        await self.broadcast_system(f"🔵 {username} s-a conectat.", room)
+
+    def _remove(self, websocket: WebSocket) -> Optional[Outbound]:
+        room = self.room_of.pop(websocket, None)
+        if room is None:
+            return None
+        out = self.rooms[room].pop(websocket, None)
+        if not self.rooms[room]:
+            del self.rooms[room]
+            self.remote_users.pop(room, None)
+            asyncio.get_running_loop().create_task(self.backplane.unsubscribe(room))
+        return out
+
+    def disconnect(self, websocket: WebSocket) -> Optional[str]:
+        """Username-ul scos sau None dacă socket-ul nu mai era în cameră (deja dat afară de _on_dead)."""
+        out = self._remove(websocket)
+        if out is None:
+            return None
+        out.closed = True
+        out.task.cancel()
+        return out.username
+
+    def _on_dead(self, out: Outbound):
+        # Client lent sau mort: îl scoatem din cameră și închidem socket-ul (receive-ul din endpoint iese singur)
+        room = self.room_of.get(out.websocket)
+        if room is not None and self.rooms[room].get(out.websocket) is out:
+            self._remove(out.websocket)
+            self.kicked += 1
+            task = asyncio.get_running_loop().create_task(self._kick(out, room))
+            self._kicks.add(task)
+            task.add_done_callback(self._kicks.discard)
+
+    async def _kick(self, out: Outbound, room: str):
+        # Endpoint-ul nu mai găsește socket-ul la disconnect, deci anunțul de ieșire îl facem aici, o dată
+        try:
+            await out.websocket.close(code=SLOW_CONSUMER_CLOSE_CODE)
+        except Exception:
+            pass  # deja închis
+        await self.broadcast_user_list(room)
+        await self.broadcast_system(f"🔴 {out.username} a ieșit (conexiune prea lentă).", room)
+
+    def _fanout(self, room: str, kind: str, payload, exclude: Optional[WebSocket] = None):
+        for websocket, out in list(self.rooms.get(room, {}).items()):
+            if websocket is not exclude:
+                out.offer(kind, payload)
+
+    def _fanout_audio(self, room: str, blob: bytes, opus: bytes, exclude: Optional[WebSocket] = None):
+        # Fiecare ascultător primește o singură variantă: cadrele Opus dacă le poate reda, altfel blob-ul
+        for websocket, out in list(self.rooms.get(room, {}).items()):
+            if websocket is exclude:
+                continue
+            payload, relay = (opus, "opus") if out.opus and opus else (blob, "blob")
+            if payload and out.offer("bytes", payload):
+                metrics.RELAYED_BYTES.inc(len(payload), relay=relay)
+
+    async def _publish(self, room: str, kind: str, payload, exclude: Optional[WebSocket] = None):
+        """Livrare locală imediată + o singură publicare pe magistrală pentru celelalte noduri."""
+        self._fanout(room, kind, payload, exclude)
+        data = payload.encode() if kind == "text" else payload
+        await self.backplane.publish(room, pack(self.node_id, kind, data))
+
+    async def _on_bus_message(self, room: str, data: bytes):
+        header, payload = unpack(data)
+        node, kind = header["node"], header["kind"]
+        if node == self.node_id or room not in self.rooms:
+            return
+        if kind == "presence":
+            users = json.loads(payload)
+            if users:
+                self.remote_users.setdefault(room, {})[node] = users
+            else:
+                self.remote_users.get(room, {}).pop(node, None)
+            self._fanout(room, "text", json.dumps({"type": "user_list", "users": self.room_users(room)}))
+        elif kind == "presence_query":
+            await self._publish_presence(room)
+        elif kind == "audio":
+            blob_len = header.get("blob_len", len(payload))
+            self._fanout_audio(room, payload[:blob_len], payload[blob_len:])
+        else:
+            self._fanout(room, kind, payload.decode() if kind == "text" else payload)
+
+    async def _publish_presence(self, room: str):
+        local = [out.username for out in self.rooms.get(room, {}).values()]
+        await self.backplane.publish(room, pack(self.node_id, "presence", json.dumps(local).encode()))
+
+    async def broadcast_json(self, data: dict, room: str, exclude: Optional[WebSocket] = None):
+        await self._publish(room, "text", json.dumps(data), exclude)
+
+    async def broadcast_user_list(self, room: str):
+        # Fiecare nod își publică userii locali; lista completă se compune la fiecare nod
+        self._fanout(room, "text", json.dumps({"type": "user_list", "users": self.room_users(room)}))
+        await self._publish_presence(room)
+
+    async def broadcast_audio(self, audio_data: bytes, sender: WebSocket, opus: Optional[bytes] = None):
+        room = self.room_of.get(sender, DEFAULT_ROOM)
+        out = self.rooms.get(room, {}).get(sender)
+        sender_name = out.username if out else "Anonim"
+        # Notificare că X vorbește (pt animație) - o dată per frază, la toată camera
+        await self.broadcast_json({"type": "speaking_start", "user": sender_name}, room)
+        # Audio la toți ceilalți din cameră (NU și la cel care vorbește). Cu opus (clip din opus_relay),
+        # ascultătorii cu WebCodecs primesc cadrele originale, restul blob-ul; pe magistrală merg amândouă o dată
+        audio_data, opus = audio_data or b"", opus or b""
+        self._fanout_audio(room, audio_data, opus, exclude=sender)
+        await self.backplane.publish(room, pack(self.node_id, "audio", audio_data + opus, blob_len=len(audio_data)))
+
+    async def broadcast_system(self, message: str, room: str):
+        await self.broadcast_json({"type": "system", "message": message}, room)
+
+    async def send_json(self, websocket: WebSocket, data: dict):
+        room = self.room_of.get(websocket)
+        out = self.rooms.get(room, {}).get(websocket)
+        if out is not None:
+            out.offer("text", json.dumps(data))
+
+    def queued(self) -> int:
+        return sum(len(out.queue) for conns in self.rooms.values() for out in conns.values())
+
+    async def close(self):
+        if self._kicks:
+            await asyncio.gather(*self._kicks, return_exceptions=True)
+        await self.backplane.close()
+
+    def stats(self) -> dict:
+        return {
+            "policy": self.policy,
+            "max_queue": self.max_queue,
+            "kicked": self.kicked,
+            "backplane": self.backplane.stats(),
+            "rooms": {
+                room: {"local": len(conns), "total": len(self.room_users(room)),
+                       "connections": [out.stats() for out in conns.values()]}
+                for room, conns in self.rooms.items()
+            },
+        }
@@ -0,0 +1,178 @@
+import os
+import time
+import threading
+import numpy as np
+from collections import deque
+from typing import Callable, Dict, List, Optional
+
+import discord
+from discord.sinks import Sink
+from discord.opus import Decoder as OpusDecoder
+
+from opus_relay import SILENCE_FRAME
+
+# --- CONFIGURARE ---
+CAPTURE_ENDPOINT_MS = int(os.getenv('CAPTURE_ENDPOINT_MS', '500'))        # liniște după care fraza se închide
+CAPTURE_MAX_UTTERANCE_MS = int(os.getenv('CAPTURE_MAX_UTTERANCE_MS', '8000'))
+CAPTURE_OVERLAP_MS = int(os.getenv('CAPTURE_OVERLAP_MS', '300'))          # suprapunere când tăiem o frază lungă
+CAPTURE_PREROLL_MS = int(os.getenv('CAPTURE_PREROLL_MS', '200'))          # context înainte de primul cadru cu voce
+CAPTURE_SPEECH_DB = float(os.getenv('CAPTURE_SPEECH_DB', '-40'))
+
+SAMPLE_RATE = OpusDecoder.SAMPLING_RATE
+CHANNELS = OpusDecoder.CHANNELS
+FRAME = SAMPLE_RATE // 50 * CHANNELS  # 20ms de int16 interleaved
+
+
+def _ms(ms: int) -> int:
+    return SAMPLE_RATE * ms // 1000 * CHANNELS
+
+
+class UserRing:
+    """Buffer circular prealocat pentru un user; pozițiile sunt absolute (cresc mereu)."""
+
+    def __init__(self, capacity: int):
+        self.buf = np.zeros(capacity, dtype="<i2")
+        self.capacity = capacity
+        self.written = 0            # câte mostre au intrat în total
+        self.segment_start: Optional[int] = None
+        self.last_voice = 0
+        self.last_write_at = 0.0
+        # Pachetele Opus originale: (start, end, pachet), aceleași poziții absolute ca PCM-ul
+        self.packets: deque = deque()
+
+    def append(self, samples: np.ndarray):
+        if len(samples) >= self.capacity:
+            self.written += len(samples) - self.capacity
+            samples = samples[-self.capacity:]
+        pos = self.written % self.capacity
+        first = min(len(samples), self.capacity - pos)
+        self.buf[pos:pos + first] = samples[:first]
+        self.buf[:len(samples) - first] = samples[first:]
+        self.written += len(samples)
+
+    def extract(self, start: int, end: int) -> bytes:
+        # Singura copie: fraza iese din ring ca să putem refolosi memoria
+        start = max(start, self.written - self.capacity)
+        a, b = start % self.capacity, end % self.capacity
+        if end - start <= 0:
+            return b""
+        if a < b:
+            return self.buf[a:b].tobytes()
+        return self.buf[a:].tobytes() + self.buf[:b].tobytes()
+
+
+class StreamingSink(Sink):
+    """
+    Sink care înregistrează continuu (fără start/stop la 2.2s). Fiecare user are un ring buffer
+    reutilizat; frazele se taie pe liniște (endpoint), iar cele prea lungi se taie cu suprapunere.
+    on_utterance(user_id, pcm_bytes, opus_frames) e chemat de pe thread-ul de decodare al py-cord;
+    opus_frames = pachetele originale ale frazei (doar cu OpusCaptureVoiceClient), altfel None.
+    """
+
+    def __init__(self, on_utterance: Callable[[int, bytes, Optional[List[bytes]]], None], *, filters=None):
+        super().__init__(filters=filters)
+        self.encoding = "pcm"
+        self.on_utterance = on_utterance
+        self.endpoint = _ms(CAPTURE_ENDPOINT_MS)
+        self.max_utterance = _ms(CAPTURE_MAX_UTTERANCE_MS)
+        self.overlap = _ms(CAPTURE_OVERLAP_MS)
+        self.preroll = _ms(CAPTURE_PREROLL_MS)
+        self.capacity = self.max_utterance + self.preroll + _ms(2000)
+        self.rings: Dict[int, UserRing] = {}
+        self._lock = threading.Lock()
+        self.utterances = 0
+        self.splits = 0
+        # (pachet, mostre) pentru write()-ul care urmează; setat de OpusCaptureVoiceClient pe același thread
+        self.next_opus = None
+
+    def write(self, data, user):
+        opus, self.next_opus = self.next_opus, None
+        if self.filtered_users and user not in self.filtered_users:
+            return
+        samples = np.frombuffer(data, dtype="<i2")
+        with self._lock:
+            ring = self.rings.get(user)
+            if ring is None:
+                ring = self.rings[user] = UserRing(self.capacity)
+            ring.last_write_at = time.monotonic()
+            if opus is not None:
+                # Cadrul decodat e la finalul chunk-ului (înainte e doar liniștea adăugată de py-cord)
+                packet, frame_samples = opus
+                end = ring.written + len(samples)
+                ring.packets.append((end - frame_samples, end, packet))
+                while ring.packets[0][1] <= end - ring.capacity:
+                    ring.packets.popleft()
+            # Energia pe cadre de 20ms, calculată o singură dată pentru tot chunk-ul
+            usable = len(samples) - len(samples) % FRAME
+            frames = samples[:usable].reshape(-1, FRAME)
+            power = np.mean(np.square(frames, dtype=np.float32), axis=1) / (32768.0 * 32768.0)
+            voiced = 10.0 * np.log10(power + 1e-10) > CAPTURE_SPEECH_DB
+            for index, is_voiced in enumerate(voiced):
+                ring.append(frames[index])
+                self._advance(user, ring, bool(is_voiced))
+            if usable < len(samples):
+                ring.append(samples[usable:])
+
+    def _advance(self, user, ring: UserRing, is_voiced: bool):
+        if is_voiced:
+            if ring.segment_start is None:
+                ring.segment_start = max(0, ring.written - FRAME - self.preroll)
+            ring.last_voice = ring.written
+        if ring.segment_start is None:
+            return
+        if ring.written - ring.last_voice >= self.endpoint:
+            self._emit(user, ring, ring.segment_start, ring.last_voice + self.endpoint // 2)
+            ring.segment_start = None
+        elif ring.written - ring.segment_start >= self.max_utterance:
+            # Frază prea lungă: tăiem aici, dar următoarea bucată începe puțin mai devreme
+            self._emit(user, ring, ring.segment_start, ring.written)
+            ring.segment_start = ring.written - self.overlap
+            self.splits += 1
+
+    def _emit(self, user, ring: UserRing, start: int, end: int):
+        end = min(end, ring.written)
+        pcm = ring.extract(start, end)
+        if pcm:
+            self.utterances += 1
+            self.on_utterance(user, pcm, self._opus_between(ring, start, end))
+
+    @staticmethod
+    def _opus_between(ring: UserRing, start: int, end: int) -> Optional[List[bytes]]:
+        """Pachetele originale ale frazei; golurile (umplute de py-cord cu zero în PCM) devin cadre de liniște Opus."""
+        frames: List[bytes] = []
+        cursor = None
+        for packet_start, packet_end, packet in ring.packets:
+            if packet_end <= start or packet_start >= end:
+                continue
+            if cursor is not None and packet_start - cursor >= FRAME:
+                frames.extend([SILENCE_FRAME] * ((packet_start - cursor) // FRAME))
+            frames.append(packet)
+            cursor = packet_end
+        return frames or None
+
+    def flush_idle(self, now: Optional[float] = None):
+        """Discord nu trimite pachete în liniște -> închidem frazele userilor care au tăcut."""
+        now = time.monotonic() if now is None else now
+        idle = CAPTURE_ENDPOINT_MS / 1000
+        with self._lock:
+            for user, ring in self.rings.items():
+                if ring.segment_start is not None and now - ring.last_write_at >= idle:
+                    self._emit(user, ring, ring.segment_start, ring.written)
+                    ring.segment_start = None
+
+    def cleanup(self):
+        self.flush_idle(now=float("inf"))
+        self.finished = True
+
+
+class OpusCaptureVoiceClient(discord.VoiceClient):
+    """
+    VoiceClient care dă sink-ului și pachetul Opus original al fiecărui cadru, nu doar PCM-ul decodat.
+    Frazele aprobate se redau apoi din pachetele astea (playback.OpusFramesAudio), fără re-encodare.
+    """
+
+    def _process_audio_packet(self, data):
+        # Rulează pe thread-ul de decodare al py-cord, chiar înainte de sink.write() pentru același cadru
+        if data.decrypted_data and hasattr(self.sink, "next_opus"):
+            self.sink.next_opus = (bytes(data.decrypted_data), len(data.decoded_data) // 2)
+        super()._process_audio_packet(data)
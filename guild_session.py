@@ -0,0 +1,238 @@
+import io
+import time
+import asyncio
+import numpy as np
+from collections import deque
+from typing import Dict, List, Optional
+
+import discord
+from discord.opus import Decoder as OpusDecoder
+
+import metrics
+from audio_decode import pcm16_to_float32
+from capture import StreamingSink
+from playback import Clip, PlaybackQueue
+from stt_engines import EngineRegistry, SttEngine, SttOverloaded
+from toxicity_client import check_toxicity
+from vad import VadGate
+
+MODES = ("REACTIVE", "PREVENTIVE")
+
+
+def _percentile(values, q: float) -> float:
+    return float(np.percentile(values, q)) if values else 0.0
+
+
+class GuildSession:
+    """
+    Tot ce ține de un guild: conexiunea de voce, bucla de înregistrare, modul și coada de redare.
+    Engine-urile STT (EngineRegistry) și clientul de toxicitate sunt comune tuturor sesiunilor;
+    cererile STT poartă guild_id-ul ca tenant, ca pool-ul Whisper să le servească pe rând.
+    """
+
+    def __init__(self, guild_id: int, voice_client: discord.VoiceClient, text_channel,
+                 mode: str, stt: SttEngine, vad: VadGate, *,
+                 loop: asyncio.AbstractEventLoop, mix: bool = False, gather_ms: int = 50):
+        self.guild_id = guild_id
+        self.voice_client = voice_client
+        self.text_channel = text_channel
+        self.mode = mode
+        self.stt = stt  # se poate schimba din mers (!engine)
+        self.vad = vad
+        self.loop = loop
+        self.gather = gather_ms / 1000
+        self.playback = PlaybackQueue(voice_client, loop, mix=mix)
+        self.recording = False
+        self._task: Optional[asyncio.Task] = None
+        self._queue: asyncio.Queue = asyncio.Queue()
+        self._last_window: Optional[asyncio.Task] = None  # ultima fereastră de fraze lansată
+        # --- Metrici per guild ---
+        self.in_flight = 0
+        self.counters = {"utterances": 0, "silence": 0, "approved": 0, "blocked": 0, "overloaded": 0, "errors": 0}
+        self.latency_ms = deque(maxlen=200)   # de la sfârșitul frazei până la verdict
+        self.stt_wait_ms = deque(maxlen=200)
+
+    # ---------------- Ciclu de viață ----------------
+
+    def start(self):
+        self.recording = True
+        self._task = self.loop.create_task(self._record_loop())
+        metrics.QUEUE_DEPTH.set_function(lambda: len(self.playback), queue="playback", guild=self.guild_id)
+
+    async def stop(self):
+        self.recording = False
+        self.playback.clear()
+        metrics.QUEUE_DEPTH.remove(queue="playback", guild=self.guild_id)
+        if self._task is not None:
+            await self._task
+            self._task = None
+
+    def _on_utterance(self, user_id: int, pcm: bytes, opus: Optional[List[bytes]] = None):
+        # Chemat de pe thread-ul de decodare al py-cord -> ne întoarcem în event loop
+        self.loop.call_soon_threadsafe(self._queue.put_nowait, (user_id, pcm, time.perf_counter(), opus))
+
+    async def _recording_finished(self, sink, channel):
+        print(f"⏹️ [{self.guild_id}] Înregistrare oprită ({sink.utterances} fraze, {sink.splits} tăiate cu suprapunere)")
+
+    async def _record_loop(self):
+        """Înregistrare continuă: frazele vin din sink pe măsură ce userii termină de vorbit."""
+        sink = StreamingSink(self._on_utterance)
+        self.voice_client.start_recording(sink, self._recording_finished, self.text_channel)
+
+        while self.recording and self.voice_client.is_connected():
+            try:
+                first = await asyncio.wait_for(self._queue.get(), timeout=0.1)
+            except asyncio.TimeoutError:
+                sink.flush_idle() # Închidem frazele userilor care au tăcut
+                continue
+            # Adunăm puțin și frazele altor useri, ca să intre în același batch Whisper
+            utterances = [first]
+            await asyncio.sleep(self.gather)
+            while not self._queue.empty():
+                utterances.append(self._queue.get_nowait())
+            # Ferestrele se procesează în paralel, dar ajung la redare în ordinea în care au fost adunate
+            self._last_window = self.loop.create_task(self.process_utterances(utterances, after=self._last_window))
+            sink.flush_idle()
+
+        if self.voice_client.recording:
+            self.voice_client.stop_recording()
+
+    # ---------------- Procesare ----------------
+
+    async def process_utterances(self, utterances, after: Optional[asyncio.Task] = None):
+        """Creierul care decide cine se aude și cine nu."""
+        self.in_flight += len(utterances)
+        try:
+            approved = await asyncio.gather(*[self._process_one(*u) for u in utterances])
+        finally:
+            self.in_flight -= len(utterances)
+        if after is not None:
+            # O fereastră mai veche încă e la STT/toxicitate: îi așteptăm rândul (fără să-i preluăm erorile)
+            await asyncio.wait({after})
+            after = None
+
+        # Redare în ordine (următorul clip pornește din callback-ul after= al player-ului)
+        if self.recording and self.voice_client.is_connected():
+            self.playback.enqueue(*[clip for clip in approved if clip is not None])
+
+    async def _process_one(self, user_id: int, pcm_bytes: bytes, ended_at: float,
+                           opus: Optional[List[bytes]] = None):
+        self.counters["utterances"] += 1
+        trace = metrics.trace("bot")
+        # Cât a stat fraza în coada de captură + fereastra de adunare
+        trace.add("capture", time.perf_counter() - ended_at)
+        metrics.RECEIVED_BYTES.inc(len(pcm_bytes), entry="bot")
+        # PCM-ul userului direct din memorie (view peste fraza scoasă din ring, fără copie)
+        with trace.span("decode"):
+            pcm = np.frombuffer(pcm_bytes, dtype="<i2")
+            samples = pcm16_to_float32(pcm, OpusDecoder.CHANNELS, OpusDecoder.SAMPLING_RATE)
+        with trace.span("vad"):
+            samples = self.vad.process(samples)
+        if samples is None:
+            self.counters["silence"] += 1
+            trace.finish("silence")
+            return None # Liniște = Gunoi
+
+        try:
+            with trace.span("stt"):
+                result = await self.stt.transcribe(samples, tenant=self.guild_id)
+        except SttOverloaded:
+            # Fără transcriere nu putem garanta nimic -> în PREVENTIVE fraza nu se redă
+            self.counters["overloaded"] += 1
+            trace.finish("busy")
+            print(f"⚠️ [{self.guild_id}] STT suprasolicitat, frază ignorată")
+            return None
+        except Exception as e:
+            self.counters["errors"] += 1
+            trace.finish("error")
+            print(f"Err STT ({self.stt.name}): {e}")
+            return None
+        trace.add("stt_queue", result.queue_wait_ms / 1000)
+        self.stt_wait_ms.append(result.queue_wait_ms)
+        self.vad.record_stt(len(samples) / self.vad.sample_rate, result.stt_ms / 1000 / result.batch_size)
+
+        try:
+            pcm_stream = await self.handle_user(user_id, result.text, io.BytesIO(pcm_bytes), trace)
+        except Exception:
+            trace.finish("error")
+            raise
+        self.latency_ms.append((time.perf_counter() - ended_at) * 1000)
+        # Pachetele Opus originale merg cu PCM-ul: redat singur, clipul nu mai e re-encodat
+        return Clip(pcm_stream, opus) if pcm_stream is not None else None
+
+    async def handle_user(self, user_id, text, pcm_stream, trace: Optional[metrics.Trace] = None):
+        """Verifică un user; întoarce audio-ul dacă trebuie redat (PREVENTIVE), altfel None."""
+        trace = trace or metrics.trace("bot")
+        if not text:
+            trace.finish("no_text")
+            return None
+
+        print(f"🗣️ [{self.guild_id}] User {user_id}: {text}")
+
+        with trace.span("toxicity"):
+            toxic_labels = await check_toxicity(text)
+        is_toxic = len(toxic_labels) > 0
+        trace.finish("toxic" if is_toxic else "safe")
+        self.counters["blocked" if is_toxic else "approved"] += 1
+        channel = self.text_channel
+
+        # ---------------- MOD REACTIVE (Simplu) ----------------
+        if self.mode == "REACTIVE":
+            if is_toxic:
+                reasons = ", ".join([l['label'] for l in toxic_labels])
+                await channel.send(f"🚨 **ALERTA (Reactive):** <@{user_id}>: \"{text}\"\nMotiv: `{reasons}`")
+            else:
+                await channel.send(f"✅ <@{user_id}>: {text}")
+
+        # ---------------- MOD PREVENTIVE (Relay/Nebunia) ----------------
+        elif self.mode == "PREVENTIVE":
+            if is_toxic:
+                # E TOXIC? -> NU REDĂM NIMIC.
+                print(f"🛑 BLOCAT mesaj toxic de la {user_id}")
+                await channel.send(f"🛡️ **Mesaj Blocat (Preventive):** <@{user_id}> a încercat să fie toxic!")
+            else:
+                # E CUMINTE? -> REDĂM AUDIO.
+                print(f"✅ Mesaj OK. Redare către ceilalți...")
+                return pcm_stream
+        return None
+
+    # ---------------- Metrici ----------------
+
+    def stats(self) -> dict:
+        latency = list(self.latency_ms)
+        waits = list(self.stt_wait_ms)
+        return {
+            "guild_id": self.guild_id,
+            "mode": self.mode,
+            "engine": self.stt.name,
+            "channel": getattr(self.voice_client.channel, "name", None),
+            # backlog = fraze încă neadunate + fraze în procesare + ce așteaptă la redare
+            "backlog": {
+                "capture": self._queue.qsize(),
+                "processing": self.in_flight,
+                "stt_queued": self.stt.tenant_depth(self.guild_id),
+                "playback": len(self.playback),
+            },
+            "played": self.playback.played,
+            "played_opus": self.playback.played_opus,
+            "latency_ms": {"p50": round(_percentile(latency, 50), 1), "p95": round(_percentile(latency, 95), 1),
+                           "max": round(max(latency, default=0.0), 1)},
+            "stt_wait_ms_p95": round(_percentile(waits, 95), 1),
+            **self.counters,
+        }
+
+
+def format_stats(sessions: Dict[int, GuildSession], engines: EngineRegistry) -> str:
+    """Rezumat text pentru comanda !stats (un rând per guild + starea engine-urilor comune)."""
+    lines = [f"📊 **{len(sessions)} guild-uri active**"]
+    for name, engine in engines.engines.items():
+        pool = engine.stats()
+        lines.append(f"🧠 `{name}` coadă: {pool['queue_depth']}, în lucru: {pool['in_flight']}, "
+                     f"respinse: {pool['rejected']}, degradate: {pool['degraded']}")
+    for session in sessions.values():
+        s = session.stats()
+        backlog = sum(s["backlog"].values())
+        lines.append(f"• `{s['guild_id']}` [{s['mode']}, {s['engine']}] #{s['channel']}: {s['utterances']} fraze, "
+                     f"backlog {backlog}, latență p50 {s['latency_ms']['p50']}ms / p95 {s['latency_ms']['p95']}ms, "
+                     f"blocate {s['blocked']}, redate {s['played']} ({s['played_opus']} Opus passthrough)")
+    return "\n".join(lines)
@@ -0,0 +1,343 @@
+import os
+import csv
+import glob
+import time
+import struct
+import asyncio
+import numpy as np
+from collections import deque
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional
+
+# --- CONFIGURARE ---
+LOG_DIR = os.getenv('LOG_DIR', 'logs')
+LOG_FLUSH_MS = float(os.getenv('LOG_FLUSH_MS', '1000'))                  # cât adunăm înainte de o scriere
+LOG_BATCH_ROWS = int(os.getenv('LOG_BATCH_ROWS', '512'))                 # sau mai devreme, la atâtea rânduri
+LOG_BUFFER_ROWS = int(os.getenv('LOG_BUFFER_ROWS', '50000'))             # peste atât aruncăm cele mai vechi
+LOG_SEGMENT_MAX_BYTES = int(os.getenv('LOG_SEGMENT_MAX_BYTES', str(64 * 1024 * 1024)))
+LOG_SEGMENT_MAX_SECONDS = float(os.getenv('LOG_SEGMENT_MAX_SECONDS', '86400'))
+
+CSV_HEADER = ["timestamp", "user", "text", "toxic_labels", "stt_time", "ai_time", "latency_ms", "user_count"]
+CSV_TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+# Format segment (.tgseg): blocuri lipite unul după altul, câte unul per flush.
+#   bloc   = MAGIC | u32 rânduri | u16 coloane | coloane...
+#   coloană = u8 len(nume) | nume | u8 tip | u32 len(date) | date
+# Tipuri: numerice = array numpy little-endian; "str" = offset-uri u32 + blob UTF-8;
+# "dict" = dicționar de stringuri (ca "str") + coduri u32 (pt user / etichete, care se repetă mult).
+MAGIC = b"TGB1"
+SEGMENT_EXT = ".tgseg"
+COLUMNS = [
+    ("timestamp", "f8"), ("user", "dict"), ("text", "str"), ("toxic_labels", "dict"),
+    ("stt_time", "f4"), ("ai_time", "f4"), ("latency_ms", "f4"), ("user_count", "u4"),
+]
+_TYPE_CODES = {"f8": 0, "f4": 1, "u4": 2, "str": 3, "dict": 4}
+_TYPE_NAMES = {code: name for name, code in _TYPE_CODES.items()}
+
+
+# ---------------- Codare / decodare coloane ----------------
+
+def _encode_strings(values: List[str]) -> bytes:
+    blobs = [v.encode("utf-8") for v in values]
+    offsets = np.zeros(len(blobs) + 1, dtype="<u4")
+    np.cumsum([len(b) for b in blobs], out=offsets[1:])
+    return offsets.tobytes() + b"".join(blobs)
+
+
+def _decode_strings(data: bytes, count: int) -> List[str]:
+    offsets = np.frombuffer(data, dtype="<u4", count=count + 1)
+    blob = data[(count + 1) * 4:]
+    return [blob[offsets[i]:offsets[i + 1]].decode("utf-8") for i in range(count)]
+
+
+def _encode_column(kind: str, values: list) -> bytes:
+    if kind == "str":
+        return _encode_strings(values)
+    if kind == "dict":
+        table: Dict[str, int] = {}
+        codes = np.fromiter((table.setdefault(v, len(table)) for v in values), dtype="<u4", count=len(values))
+        return struct.pack("<I", len(table)) + _encode_strings(list(table)) + codes.tobytes()
+    return np.asarray(values, dtype="<" + kind).tobytes()
+
+
+def _decode_column(kind: str, data: bytes, rows: int):
+    if kind == "str":
+        return _decode_strings(data, rows)
+    if kind == "dict":
+        (size,) = struct.unpack_from("<I", data)
+        table = _decode_strings(data[4:], size)
+        codes = np.frombuffer(data, dtype="<u4", count=rows, offset=len(data) - rows * 4)
+        return [table[c] for c in codes]
+    return np.frombuffer(data, dtype="<" + kind, count=rows)
+
+
+def encode_block(rows: List[tuple]) -> bytes:
+    """rows: tupluri în ordinea din COLUMNS."""
+    out = [MAGIC, struct.pack("<IH", len(rows), len(COLUMNS))]
+    for index, (name, kind) in enumerate(COLUMNS):
+        data = _encode_column(kind, [row[index] for row in rows])
+        out.append(struct.pack("<B", len(name)) + name.encode() + struct.pack("<BI", _TYPE_CODES[kind], len(data)))
+        out.append(data)
+    return b"".join(out)
+
+
+def read_blocks(path: str) -> Iterator[Dict[str, object]]:
+    """Blocurile unui segment, ca dict coloană -> valori. Un bloc scris pe jumătate (crash) e ignorat."""
+    with open(path, "rb") as f:
+        data = f.read()
+    pos = 0
+    while pos + 10 <= len(data) and data[pos:pos + 4] == MAGIC:
+        rows, ncols = struct.unpack_from("<IH", data, pos + 4)
+        pos += 10
+        block = {}
+        try:
+            for _ in range(ncols):
+                name_len = data[pos]
+                name = data[pos + 1:pos + 1 + name_len].decode()
+                kind_code, size = struct.unpack_from("<BI", data, pos + 1 + name_len)
+                pos += 1 + name_len + 5
+                if pos + size > len(data):
+                    return
+                block[name] = _decode_column(_TYPE_NAMES[kind_code], data[pos:pos + size], rows)
+                pos += size
+        except (struct.error, IndexError):
+            return
+        block["_rows"] = rows
+        yield block
+
+
+def list_segments(directory: str = LOG_DIR, prefix: str = "stats") -> List[str]:
+    return sorted(glob.glob(os.path.join(directory, f"{prefix}-*{SEGMENT_EXT}")))
+
+
+def iter_records(directory: str = LOG_DIR, prefix: str = "stats") -> Iterator[tuple]:
+    """Rânduri brute (tupluri în ordinea din COLUMNS), de la cel mai vechi la cel mai nou."""
+    for path in list_segments(directory, prefix):
+        for block in read_blocks(path):
+            columns = [block[name] for name, _ in COLUMNS]
+            for i in range(block["_rows"]):
+                yield tuple(column[i] for column in columns)
+
+
+def format_row(record: tuple) -> dict:
+    """Tuplu brut -> rând în formatul vechi din CSV (stringuri)."""
+    timestamp, user, text, labels, stt_time, ai_time, latency, user_count = record
+    return {
+        "timestamp": datetime.fromtimestamp(float(timestamp)).strftime(CSV_TIME_FORMAT),
+        "user": user,
+        "text": text,
+        "toxic_labels": labels,
+        "stt_time": f"{stt_time:.2f}",
+        "ai_time": f"{ai_time:.2f}",
+        "latency_ms": f"{latency:.2f}",
+        "user_count": str(int(user_count)),
+    }
+
+
+def iter_rows(directory: str = LOG_DIR, prefix: str = "stats") -> Iterator[dict]:
+    """Rânduri în formatul vechi din CSV (stringuri), de la cel mai vechi la cel mai nou."""
+    for record in iter_records(directory, prefix):
+        yield format_row(record)
+
+
+def labels_to_str(toxic_labels) -> str:
+    if toxic_labels and isinstance(toxic_labels, list):
+        return ";".join([l.get('label', 'TOXIC') for l in toxic_labels])
+    return "TOXIC" if toxic_labels else "SAFE"
+
+
+# ---------------- Writer asincron ----------------
+
+class InteractionLog:
+    """
+    log() doar pune rândul într-un buffer din memorie (O(1), fără I/O pe event loop).
+    Un task de fundal scrie periodic tot bufferul ca un singur bloc columnar, pe thread,
+    și rotește segmentul după mărime sau vechime.
+    """
+
+    def __init__(self, prefix: str, directory: str = LOG_DIR, flush_ms: float = LOG_FLUSH_MS,
+                 batch_rows: int = LOG_BATCH_ROWS, buffer_rows: int = LOG_BUFFER_ROWS,
+                 segment_max_bytes: int = LOG_SEGMENT_MAX_BYTES,
+                 segment_max_seconds: float = LOG_SEGMENT_MAX_SECONDS, legacy_csv: Optional[str] = None):
+        self.prefix = prefix
+        self.directory = directory
+        self.flush_interval = flush_ms / 1000
+        self.batch_rows = batch_rows
+        self.segment_max_bytes = segment_max_bytes
+        self.segment_max_seconds = segment_max_seconds
+        self.legacy_csv = legacy_csv
+        self._buffer: deque = deque(maxlen=buffer_rows)
+        self._wake: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._closing = False
+        self._flush_lock: Optional[asyncio.Lock] = None  # un singur bloc scris odată în segment
+        self._segment_path: Optional[str] = None
+        self._segment_opened_at = 0.0
+        self._segment_bytes = 0
+        self._seq = 0
+        self.logged = 0
+        self.written = 0
+        self.dropped = 0
+        self.flushes = 0
+        self.segments = 0
+        self.last_flush_ms = 0.0
+
+    # --- API folosit de servere ---
+
+    def log(self, username, text, toxic_labels, stt_time, ai_time, total_latency, user_count) -> tuple:
+        if len(self._buffer) == self._buffer.maxlen:
+            self.dropped += 1  # deque-ul aruncă singur rândul cel mai vechi
+        record = (time.time(), username, text, labels_to_str(toxic_labels),
+                  stt_time, ai_time, total_latency, user_count)
+        self._buffer.append(record)
+        self.logged += 1
+        if self._wake is not None and len(self._buffer) >= self.batch_rows:
+            self._wake.set()
+        return record
+
+    async def start(self):
+        os.makedirs(self.directory, exist_ok=True)
+        if self.legacy_csv and os.path.exists(self.legacy_csv) and not list_segments(self.directory, self.prefix):
+            # Prima pornire pe formatul nou: istoricul din CSV devine primul segment
+            imported = await asyncio.to_thread(import_csv, self.legacy_csv, self.directory, self.prefix)
+            print(f"📥 Importat {imported} rânduri din {self.legacy_csv}")
+        self._wake = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self._closing = False
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def close(self):
+        # Nu anulăm task-ul: un cancel în timpul to_thread ar lăsa scrierea pe thread în curs
+        # și flush-ul final ar scrie în paralel în același segment. Îl lăsăm să termine blocul.
+        if self._task is not None:
+            self._closing = True
+            self._wake.set()
+            await self._task
+            self._task = None
+        await self.flush()
+
+    # --- Fundal ---
+
+    async def _run(self):
+        while not self._closing:
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            if self._closing:
+                break
+            try:
+                await self.flush()
+            except Exception as e:
+                print(f"Eroare scriere log: {e}")
+
+    async def flush(self):
+        if self._flush_lock is None:
+            self._flush_lock = asyncio.Lock()
+        async with self._flush_lock:
+            if not self._buffer:
+                return
+            rows = list(self._buffer)
+            self._buffer.clear()
+            started = time.perf_counter()
+            await asyncio.to_thread(self._write_block, rows)
+            self.last_flush_ms = (time.perf_counter() - started) * 1000
+            self.written += len(rows)
+            self.flushes += 1
+
+    def _rotate_if_needed(self, now: float):
+        if (self._segment_path is None or self._segment_bytes >= self.segment_max_bytes
+                or now - self._segment_opened_at >= self.segment_max_seconds):
+            self._seq += 1
+            stamp = datetime.fromtimestamp(now).strftime("%Y%m%d-%H%M%S")
+            self._segment_path = os.path.join(self.directory, f"{self.prefix}-{stamp}-{os.getpid()}-{self._seq:04d}{SEGMENT_EXT}")
+            self._segment_opened_at = now
+            self._segment_bytes = 0
+            self.segments += 1
+
+    def _write_block(self, rows: List[tuple]):
+        self._rotate_if_needed(time.time())
+        block = encode_block(rows)
+        with open(self._segment_path, "ab") as f:
+            f.write(block)
+        self._segment_bytes += len(block)
+
+    def rows(self) -> Iterator[dict]:
+        return iter_rows(self.directory, self.prefix)
+
+    def records(self) -> Iterator[tuple]:
+        return iter_records(self.directory, self.prefix)
+
+    def stats(self) -> dict:
+        return {
+            "logged": self.logged,
+            "written": self.written,
+            "buffered": len(self._buffer),
+            "dropped": self.dropped,
+            "flushes": self.flushes,
+            "last_flush_ms": round(self.last_flush_ms, 2),
+            "segment": self._segment_path,
+            "segments_opened": self.segments,
+        }
+
+
+# ---------------- Conversie CSV <-> segmente ----------------
+
+def _parse_time(value: str) -> float:
+    try:
+        return datetime.strptime(value, CSV_TIME_FORMAT).timestamp()
+    except ValueError:
+        return float(value)
+
+
+def import_csv(csv_path: str, directory: str = LOG_DIR, prefix: str = "stats", batch_rows: int = 10000) -> int:
+    """Citește formatul vechi (stats.csv / stats_vosk.csv) și îl scrie ca segment."""
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"{prefix}-00000000-000000-0-0000{SEGMENT_EXT}")
+    total = 0
+    with open(csv_path, newline="", encoding="utf-8") as src, open(path, "ab") as dst:
+        rows = []
+        for row in csv.DictReader(src):
+            try:
+                rows.append((_parse_time(row["timestamp"]), row["user"], row["text"], row["toxic_labels"],
+                             float(row["stt_time"]), float(row["ai_time"]), float(row["latency_ms"]),
+                             int(row["user_count"])))
+            except (KeyError, ValueError, TypeError):
+                continue  # rând stricat în istoric
+            if len(rows) >= batch_rows:
+                dst.write(encode_block(rows))
+                total += len(rows)
+                rows = []
+        if rows:
+            dst.write(encode_block(rows))
+            total += len(rows)
+    return total
+
+
+def export_csv(csv_path: str, directory: str = LOG_DIR, prefix: str = "stats") -> int:
+    total = 0
+    with open(csv_path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=CSV_HEADER)
+        writer.writeheader()
+        for row in iter_rows(directory, prefix):
+            writer.writerow(row)
+            total += 1
+    return total
+
+
+if __name__ == "__main__":
+    # python interaction_log.py import stats.csv [prefix]  |  python interaction_log.py export out.csv [prefix]
+    import sys
+
+    if len(sys.argv) < 3 or sys.argv[1] not in ("import", "export"):
+        print("Folosire: python interaction_log.py import|export <fisier.csv> [prefix]")
+        sys.exit(1)
+    command, path = sys.argv[1], sys.argv[2]
+    # La import prefixul implicit vine din numele CSV-ului (stats / stats_vosk)
+    default_prefix = os.path.splitext(os.path.basename(path))[0] if command == "import" else "stats"
+    prefix = sys.argv[3] if len(sys.argv) > 3 else default_prefix
+    if command == "import":
+        print(f"✅ {import_csv(path, LOG_DIR, prefix)} rânduri importate în {LOG_DIR}/")
+    else:
+        print(f"✅ {export_csv(path, LOG_DIR, prefix)} rânduri exportate în {path}")
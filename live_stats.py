@@ -0,0 +1,167 @@
+import os
+import math
+from collections import Counter, OrderedDict, deque
+from typing import Dict, Iterable, Optional
+
+from interaction_log import format_row
+
+# --- CONFIGURARE ---
+STATS_RETENTION_MINUTES = int(os.getenv('STATS_RETENTION_MINUTES', '1440'))  # câte minute păstrăm în memorie
+STATS_RECENT_ROWS = int(os.getenv('STATS_RECENT_ROWS', '200'))               # rânduri pentru tabelul live
+STATS_SKETCH_ACCURACY = float(os.getenv('STATS_SKETCH_ACCURACY', '0.01'))    # eroare relativă a percentilelor
+
+
+class LatencySketch:
+    """
+    Sketch de percentile cu eroare relativă fixă (stil DDSketch): bucket-uri logaritmice,
+    memorie O(log(max/min)) indiferent de câte valori intră, și se pot combina între ele.
+    """
+
+    def __init__(self, relative_accuracy: float = STATS_SKETCH_ACCURACY):
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self.gamma)
+        self.bins: Dict[int, int] = {}
+        self.zeros = 0
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, value: float):
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+        if value <= 1e-6:
+            self.zeros += 1
+            return
+        index = math.ceil(math.log(value) / self._log_gamma)
+        self.bins[index] = self.bins.get(index, 0) + 1
+
+    def merge(self, other: "LatencySketch"):
+        for index, count in other.bins.items():
+            self.bins[index] = self.bins.get(index, 0) + count
+        self.zeros += other.zeros
+        self.count += other.count
+        self.total += other.total
+        self.max = max(self.max, other.max)
+
+    def quantile(self, q: float) -> float:
+        if not self.count:
+            return 0.0
+        rank = q * (self.count - 1)
+        seen = self.zeros
+        if rank < seen:
+            return 0.0
+        for index in sorted(self.bins):
+            seen += self.bins[index]
+            if seen > rank:
+                # Mijlocul bucket-ului (în sens relativ)
+                return 2 * self.gamma ** index / (self.gamma + 1)
+        return self.max
+
+    def summary(self) -> dict:
+        return {
+            "count": self.count,
+            "avg": round(self.total / self.count, 2) if self.count else 0.0,
+            "p50": round(self.quantile(0.50), 2),
+            "p95": round(self.quantile(0.95), 2),
+            "p99": round(self.quantile(0.99), 2),
+            "max": round(self.max, 2),
+        }
+
+
+class _Minute:
+    __slots__ = ("count", "toxic", "max_users", "latency", "seq")
+
+    def __init__(self):
+        self.count = 0
+        self.toxic = 0
+        self.max_users = 0
+        self.latency = LatencySketch()
+        self.seq = 0
+
+
+class LiveStats:
+    """
+    Agregate în memorie peste log-ul de interacțiuni: percentile de latență (sketch),
+    toxic/safe per user și per etichetă, bucket-uri pe minut și ultimele rânduri.
+    Fiecare rând primește un seq; delta(since) întoarce doar ce s-a schimbat după cursor.
+    Se folosește doar din event loop (seed-ul rulează înainte să pornească serverul).
+    """
+
+    def __init__(self, retention_minutes: int = STATS_RETENTION_MINUTES, recent_rows: int = STATS_RECENT_ROWS):
+        self.retention_minutes = retention_minutes
+        self.seq = 0
+        self.count = 0
+        self.toxic = 0
+        self.latency = {"total": LatencySketch(), "stt": LatencySketch(), "ai": LatencySketch()}
+        self.users: Dict[str, dict] = {}
+        self.labels: Counter = Counter()
+        self.labels_seq = 0
+        self.minutes: "OrderedDict[int, _Minute]" = OrderedDict()
+        self.recent: deque = deque(maxlen=recent_rows)
+
+    def record(self, record: tuple):
+        """record: tuplul din InteractionLog.log() (ordinea din interaction_log.COLUMNS)."""
+        timestamp, user, _text, labels, stt_time, ai_time, latency, user_count = record
+        self.seq += 1
+        is_toxic = labels not in ("SAFE", "")
+        self.count += 1
+        self.toxic += is_toxic
+        self.latency["total"].add(float(latency))
+        self.latency["stt"].add(float(stt_time))
+        self.latency["ai"].add(float(ai_time))
+
+        entry = self.users.get(user)
+        if entry is None:
+            entry = self.users[user] = {"toxic": 0, "safe": 0, "seq": 0}
+        entry["toxic" if is_toxic else "safe"] += 1
+        entry["seq"] = self.seq
+
+        if is_toxic:
+            self.labels.update(labels.split(";"))
+            self.labels_seq = self.seq
+
+        minute = int(timestamp // 60 * 60)
+        bucket = self.minutes.get(minute)
+        if bucket is None:
+            bucket = self.minutes[minute] = _Minute()
+            # Istoricul importat poate veni neordonat față de minutele deja existente
+            if len(self.minutes) > 1 and minute < next(reversed(self.minutes)):
+                self.minutes = OrderedDict(sorted(self.minutes.items()))
+            while len(self.minutes) > self.retention_minutes:
+                self.minutes.popitem(last=False)
+        bucket.count += 1
+        bucket.toxic += is_toxic
+        bucket.max_users = max(bucket.max_users, int(user_count))
+        bucket.latency.add(float(latency))
+        bucket.seq = self.seq
+
+        self.recent.append((self.seq, record))
+
+    def seed(self, records: Iterable[tuple]) -> int:
+        count = 0
+        for record in records:
+            self.record(record)
+            count += 1
+        return count
+
+    def delta(self, since: int = 0) -> dict:
+        """Tot ce s-a schimbat după cursorul `since` (0 = snapshot complet)."""
+        since = max(0, min(since, self.seq))
+        oldest_recent = self.recent[0][0] if self.recent else self.seq + 1
+        return {
+            "cursor": self.seq,
+            # Clientul a rămas prea în urmă pt tabelul live -> să-l refacă de la zero
+            "reset": since == 0 or since < oldest_recent - 1,
+            "totals": {"count": self.count, "toxic": self.toxic, "safe": self.count - self.toxic},
+            "latency_ms": {name: sketch.summary() for name, sketch in self.latency.items()},
+            "labels": dict(self.labels) if self.labels_seq > since else None,
+            "users": {user: {"toxic": e["toxic"], "safe": e["safe"]}
+                      for user, e in self.users.items() if e["seq"] > since},
+            "minutes": [
+                {"minute": minute, "count": b.count, "toxic": b.toxic, "max_users": b.max_users,
+                 "latency_p50": round(b.latency.quantile(0.5), 2), "latency_p95": round(b.latency.quantile(0.95), 2)}
+                for minute, b in self.minutes.items() if b.seq > since
+            ],
+            "rows": [dict(format_row(record), seq=seq) for seq, record in self.recent if seq > since],
+        }
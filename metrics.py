@@ -0,0 +1,301 @@
+import os
+import sys
+import time
+import bisect
+import threading
+import traceback
+from collections import Counter as _Counter, deque
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Callable, Dict, Optional, Tuple
+
+from live_stats import LatencySketch
+
+# --- CONFIGURARE ---
+METRICS_SLOW_MS = float(os.getenv('METRICS_SLOW_MS', '2000'))        # peste atât o frază e "lentă"
+METRICS_PROFILE = os.getenv('METRICS_PROFILE', '0') == '1'           # profiler cu eșantionare pt frazele lente
+METRICS_PROFILE_INTERVAL_MS = float(os.getenv('METRICS_PROFILE_INTERVAL_MS', '5'))
+METRICS_PROFILE_DIR = os.getenv('METRICS_PROFILE_DIR', 'profiles')
+METRICS_PORT = int(os.getenv('METRICS_PORT', '0'))                   # doar pt bot (serverele au /metrics)
+
+# Bucket-uri în secunde, de la 1ms la 30s (audio + STT pe CPU)
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+def _labels(labels: Dict[str, str]) -> Labels:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _fmt_labels(labels: Labels, extra: Optional[Tuple[str, str]] = None) -> str:
+    items = list(labels) + ([extra] if extra else [])
+    if not items:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in items) + "}"
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name: str, help: str):
+        self.name, self.help = name, help
+        self.values: Dict[Labels, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = _labels(labels)
+        self.values[key] = self.values.get(key, 0.0) + amount
+
+    def samples(self):
+        for key, value in self.values.items():
+            yield self.name, key, value
+
+
+class Gauge:
+    """Valoare setată direct sau citită la scrape dintr-o funcție (ex. adâncimea cozii)."""
+    kind = "gauge"
+
+    def __init__(self, name: str, help: str):
+        self.name, self.help = name, help
+        self.values: Dict[Labels, float] = {}
+        self.callbacks: Dict[Labels, Callable[[], float]] = {}
+
+    def set(self, value: float, **labels):
+        self.values[_labels(labels)] = value
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = _labels(labels)
+        self.values[key] = self.values.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, **labels):
+        self.inc(-amount, **labels)
+
+    def set_function(self, fn: Callable[[], float], **labels):
+        self.callbacks[_labels(labels)] = fn
+
+    def remove(self, **labels):
+        # Seria dispare din /metrics (ex. guild-ul din care botul a ieșit)
+        key = _labels(labels)
+        self.values.pop(key, None)
+        self.callbacks.pop(key, None)
+
+    def samples(self):
+        yield from ((self.name, key, value) for key, value in self.values.items())
+        for key, fn in self.callbacks.items():
+            try:
+                yield self.name, key, float(fn())
+            except Exception:
+                continue
+
+
+class Histogram:
+    """Histogramă Prometheus (bucket-uri cumulative) + sketch pentru percentile în JSON."""
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, buckets=DEFAULT_BUCKETS):
+        self.name, self.help = name, help
+        self.buckets = tuple(buckets)
+        self.series: Dict[Labels, dict] = {}
+
+    def observe(self, value: float, **labels):
+        key = _labels(labels)
+        series = self.series.get(key)
+        if series is None:
+            series = self.series[key] = {"counts": [0] * (len(self.buckets) + 1), "sum": 0.0,
+                                         "count": 0, "sketch": LatencySketch()}
+        series["counts"][bisect.bisect_left(self.buckets, value)] += 1
+        series["sum"] += value
+        series["count"] += 1
+        series["sketch"].add(value * 1000)  # percentilele le raportăm în ms
+
+    def samples(self):
+        for key, series in self.series.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets, series["counts"]):
+                cumulative += count
+                yield f"{self.name}_bucket", key + (("le", repr(bound)),), cumulative
+            yield f"{self.name}_bucket", key + (("le", "+Inf"),), series["count"]
+            yield f"{self.name}_sum", key, series["sum"]
+            yield f"{self.name}_count", key, series["count"]
+
+    def percentiles(self) -> dict:
+        return {_fmt_labels(key) or "all": series["sketch"].summary() for key, series in self.series.items()}
+
+
+class Registry:
+    def __init__(self):
+        self.metrics: Dict[str, object] = {}
+        self._lock = threading.Lock()
+
+    def _get(self, cls, name: str, help: str, **kwargs):
+        with self._lock:
+            metric = self.metrics.get(name)
+            if metric is None:
+                metric = self.metrics[name] = cls(name, help, **kwargs)
+            return metric
+
+    def counter(self, name: str, help: str = "") -> Counter:
+        return self._get(Counter, name, help)
+
+    def gauge(self, name: str, help: str = "") -> Gauge:
+        return self._get(Gauge, name, help)
+
+    def histogram(self, name: str, help: str = "", buckets=DEFAULT_BUCKETS) -> Histogram:
+        return self._get(Histogram, name, help, buckets=buckets)
+
+    def render(self) -> str:
+        """Formatul text Prometheus (exposition format 0.0.4)."""
+        lines = []
+        for metric in list(self.metrics.values()):
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for name, labels, value in metric.samples():
+                lines.append(f"{name}{_fmt_labels(labels)} {value:g}")
+        return "\n".join(lines) + "\n"
+
+    def percentiles(self) -> dict:
+        return {m.name: m.percentiles() for m in list(self.metrics.values()) if isinstance(m, Histogram)}
+
+
+REGISTRY = Registry()
+STAGE_SECONDS = REGISTRY.histogram("toxicguard_stage_seconds", "Durata fiecărei etape (decode, vad, stt, toxicity, ...)")
+UTTERANCE_SECONDS = REGISTRY.histogram("toxicguard_utterance_seconds", "Durata totală a unei fraze, pe punct de intrare")
+UTTERANCES = REGISTRY.counter("toxicguard_utterances_total", "Fraze procesate, pe punct de intrare și rezultat")
+SLOW_UTTERANCES = REGISTRY.counter("toxicguard_slow_utterances_total", "Fraze peste METRICS_SLOW_MS")
+IN_FLIGHT = REGISTRY.gauge("toxicguard_in_flight", "Fraze în procesare, pe punct de intrare")
+RECEIVED_BYTES = REGISTRY.counter("toxicguard_received_bytes_total", "Audio primit, pe punct de intrare")
+RELAYED_BYTES = REGISTRY.counter("toxicguard_relayed_bytes_total", "Audio trimis ascultătorilor web (opus = cadre originale, blob = WebM / WAV)")
+PLAYBACK_CLIPS = REGISTRY.counter("toxicguard_playback_clips_total", "Clipuri redate de bot (opus = passthrough, pcm / mix = re-encodate)")
+QUEUE_DEPTH = REGISTRY.gauge("toxicguard_queue_depth", "Adâncimea cozilor (stt, broadcast, log, playback)")
+
+
+# ---------------- Span-uri / trace per frază ----------------
+
+class Trace:
+    """
+    O frază de la intrare până la verdict. Fiecare `with trace.span("stt")` ajunge în
+    histograma pe etape; la final, dacă fraza a fost lentă, se loghează defalcarea
+    (și profilul eșantionat, dacă METRICS_PROFILE=1).
+    """
+
+    def __init__(self, entry: str):
+        self.entry = entry
+        self.started = time.perf_counter()
+        self.started_wall = time.time()
+        self.spans = []
+        self.outcome = "ok"
+        self.finished = False
+        IN_FLIGHT.inc(entry=entry)
+
+    @contextmanager
+    def span(self, stage: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(stage, time.perf_counter() - started)
+
+    def add(self, stage: str, seconds: float):
+        self.spans.append((stage, seconds))
+        STAGE_SECONDS.observe(seconds, stage=stage, entry=self.entry)
+
+    def finish(self, outcome: Optional[str] = None):
+        if self.finished:
+            return
+        self.finished = True
+        if outcome:
+            self.outcome = outcome
+        total = time.perf_counter() - self.started
+        IN_FLIGHT.dec(entry=self.entry)
+        UTTERANCE_SECONDS.observe(total, entry=self.entry)
+        UTTERANCES.inc(entry=self.entry, outcome=self.outcome)
+        if total * 1000 >= METRICS_SLOW_MS:
+            SLOW_UTTERANCES.inc(entry=self.entry)
+            breakdown = ", ".join(f"{stage} {seconds * 1000:.0f}ms" for stage, seconds in self.spans)
+            print(f"🐢 Frază lentă [{self.entry}] {total * 1000:.0f}ms: {breakdown}")
+            if PROFILER is not None:
+                PROFILER.dump(self.started_wall, self.started_wall + total, f"{self.entry}-{total * 1000:.0f}ms")
+
+
+def trace(entry: str) -> Trace:
+    return Trace(entry)
+
+
+# ---------------- Profiler cu eșantionare (opțional) ----------------
+
+class SamplingProfiler:
+    """
+    Thread care ia stack-urile tuturor thread-urilor la fiecare câteva ms, într-un ring buffer.
+    Costul e mic și constant; doar frazele lente își scriu eșantioanele pe disc, în formatul
+    "collapsed stacks" (merge direct în flamegraph.pl / speedscope).
+    """
+
+    def __init__(self, interval_ms: float = METRICS_PROFILE_INTERVAL_MS, seconds: float = 60.0,
+                 directory: str = METRICS_PROFILE_DIR):
+        self.interval = interval_ms / 1000
+        self.directory = directory
+        self.samples = deque(maxlen=int(seconds / self.interval))
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            names = {t.ident: t.name for t in threading.enumerate()}
+            now = time.time()
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                stack = [f"{fs.name} ({os.path.basename(fs.filename)}:{fs.lineno})"
+                         for fs in traceback.extract_stack(frame, limit=40)]
+                self.samples.append((now, names.get(ident, str(ident)), ";".join(stack)))
+
+    def dump(self, start: float, end: float, tag: str) -> Optional[str]:
+        counts = _Counter(f"{thread};{stack}" for ts, thread, stack in list(self.samples) if start <= ts <= end)
+        if not counts:
+            return None
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, f"slow-{datetime.now().strftime('%Y%m%d-%H%M%S')}-{tag}.txt")
+        with open(path, "w", encoding="utf-8") as f:
+            for stack, count in counts.most_common():
+                f.write(f"{stack} {count}\n")
+        print(f"🔬 Profil frază lentă: {path}")
+        return path
+
+    def stop(self):
+        self._stop.set()
+
+
+PROFILER: Optional[SamplingProfiler] = SamplingProfiler() if METRICS_PROFILE else None
+
+
+# ---------------- Expunere ----------------
+
+def render() -> str:
+    return REGISTRY.render()
+
+
+async def start_http_server(port: int = METRICS_PORT, host: str = "0.0.0.0"):
+    """Pentru procesele fără FastAPI (bot.py): /metrics, /metrics/json și /ready pe un aiohttp mic."""
+    from aiohttp import web
+
+    async def handle_metrics(request):
+        return web.Response(text=render(), content_type="text/plain", charset="utf-8")
+
+    async def handle_json(request):
+        return web.json_response(REGISTRY.percentiles())
+
+    async def handle_ready(request):
+        from model_registry import MODELS
+        return web.json_response(MODELS.status(), status=200 if MODELS.ready() else 503)
+
+    app = web.Application()
+    app.router.add_get("/metrics", handle_metrics)
+    app.router.add_get("/metrics/json", handle_json)
+    app.router.add_get("/ready", handle_ready)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    print(f"📏 Metrici pe http://{host}:{port}/metrics")
+    return runner
@@ -0,0 +1,210 @@
+import os
+import mmap
+import time
+import asyncio
+import threading
+import traceback
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+# --- CONFIGURARE ---
+MODEL_PREFETCH = os.getenv('MODEL_PREFETCH', '1') == '1'  # fișierele modelelor în page cache, comun tuturor workerilor
+MODEL_WARMUP = os.getenv('MODEL_WARMUP', '1') == '1'      # o inferență de probă după încărcare (prima frază nu plătește)
+
+
+def process_started_at() -> float:
+    """Momentul (epoch) în care a pornit procesul, din /proc; altfel momentul importului."""
+    try:
+        with open("/proc/self/stat") as f:
+            start_ticks = int(f.read().rsplit(")", 1)[1].split()[19])
+        with open("/proc/uptime") as f:
+            uptime = float(f.read().split()[0])
+        # btime din /proc/stat e rotunjit la secundă; vârsta procesului din uptime e la ~10 ms
+        return time.time() - (uptime - start_ticks / os.sysconf("SC_CLK_TCK"))
+    except (OSError, ValueError, IndexError):
+        return time.time()
+
+
+PROCESS_STARTED = process_started_at()
+
+
+def memory_mb(pid="self") -> Dict[str, float]:
+    """RSS / PSS / partajat (MB). PSS împarte paginile comune între procese -> costul real per worker."""
+    fields = {"Rss": "rss_mb", "Pss": "pss_mb", "Shared_Clean": "shared_mb", "Private_Dirty": "private_mb"}
+    data = {}
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as f:
+            for line in f:
+                key, _, value = line.partition(":")
+                if key in fields:
+                    data[fields[key]] = round(int(value.split()[0]) / 1024, 1)
+    except (OSError, ValueError):
+        pass
+    return data
+
+
+def prefetch(paths: Iterable[str]) -> int:
+    """
+    Mapează read-only fișierele modelelor și cere kernel-ului să le citească în avans (MADV_WILLNEED).
+    Page cache-ul e comun: workerii următori (reload, --workers N) încarcă din RAM, nu de pe disc.
+    """
+    total = 0
+    for root in paths:
+        files = [root] if os.path.isfile(root) else [
+            os.path.join(d, name) for d, _, names in os.walk(root) for name in names]
+        for path in files:
+            try:
+                with open(path, "rb") as f:
+                    size = os.fstat(f.fileno()).st_size
+                    if size == 0:
+                        continue
+                    with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                        if hasattr(mapped, "madvise"):
+                            mapped.madvise(mmap.MADV_WILLNEED)
+                    total += size
+            except (OSError, ValueError):
+                continue
+    return total
+
+
+class ModelEntry:
+    def __init__(self, name: str, loader: Callable[[], Any], warmup: Optional[Callable[[Any], Any]],
+                 files: Optional[Callable[[], List[str]]]):
+        self.name = name
+        self.loader = loader
+        self.warmup = warmup
+        self.files = files
+        self.state = "idle"  # idle -> loading -> warming -> ready (sau failed, se reîncearcă la cerere)
+        self.model: Any = None
+        self.error: Optional[str] = None
+        self.load_ms: Optional[float] = None
+        self.warmup_ms: Optional[float] = None
+        self.rss_delta_mb: Optional[float] = None
+        self.ready_at: Optional[float] = None
+        self.lock = threading.Lock()
+
+    def status(self) -> dict:
+        data = {"state": self.state, "load_ms": self.load_ms, "warmup_ms": self.warmup_ms,
+                "rss_delta_mb": self.rss_delta_mb}
+        if self.ready_at is not None:
+            data["ready_after_start_ms"] = round((self.ready_at - PROCESS_STARTED) * 1000, 1)
+        if self.error:
+            data["error"] = self.error
+        return data
+
+
+class ModelRegistry:
+    """
+    Modelele mari (Whisper, Vosk, BERT ONNX) se încarcă o singură dată per proces, leneș:
+    importul modulelor nu mai blochează, uvicorn / gateway-ul Discord pornesc imediat,
+    iar warm_up() le încarcă pe fundal. Cine cere un model încă neîncărcat îl așteaptă pe același.
+    """
+
+    def __init__(self, prefetch_files: bool = MODEL_PREFETCH, run_warmup: bool = MODEL_WARMUP):
+        self.prefetch_files = prefetch_files
+        self.run_warmup = run_warmup
+        self._entries: Dict[str, ModelEntry] = {}
+        self._wanted: List[str] = []  # ce trebuie să fie gata pentru /ready
+        self._lock = threading.Lock()
+        self._threads: List[threading.Thread] = []
+
+    def register(self, name: str, loader: Callable[[], Any], *, warmup: Optional[Callable[[Any], Any]] = None,
+                 files: Optional[Callable[[], List[str]]] = None):
+        with self._lock:
+            entry = self._entries.get(name)
+            if entry is not None and entry.state != "idle":
+                return  # deja încărcat (sau pe cale) - nu schimbăm loader-ul din mers
+            self._entries[name] = ModelEntry(name, loader, warmup, files)
+
+    def is_loaded(self, name: str) -> bool:
+        entry = self._entries.get(name)
+        return entry is not None and entry.state == "ready"
+
+    def load(self, name: str) -> Any:
+        """Sincron, thread-safe; un singur thread încarcă, ceilalți îl așteaptă pe lock."""
+        entry = self._entries[name]
+        if entry.state == "ready":
+            return entry.model
+        with entry.lock:
+            if entry.state == "ready":
+                return entry.model
+            entry.state, entry.error = "loading", None
+            rss_before = memory_mb().get("rss_mb")
+            started = time.perf_counter()
+            try:
+                model = entry.loader()
+                entry.load_ms = round((time.perf_counter() - started) * 1000, 1)
+                if self.run_warmup and entry.warmup is not None:
+                    entry.state = "warming"
+                    started = time.perf_counter()
+                    entry.warmup(model)
+                    entry.warmup_ms = round((time.perf_counter() - started) * 1000, 1)
+            except Exception as e:
+                # Model lipsă / corupt: apare în status (/ready), iar apelantul primește excepția
+                entry.state, entry.error = "failed", f"{type(e).__name__}: {e}"
+                print(f"❌ Modelul '{name}' nu s-a putut încărca: {entry.error}")
+                raise
+            rss_after = memory_mb().get("rss_mb")
+            if rss_before is not None and rss_after is not None:
+                entry.rss_delta_mb = round(rss_after - rss_before, 1)
+            entry.model, entry.state, entry.ready_at = model, "ready", time.time()
+            print(f"✅ Model '{name}' gata în {entry.load_ms:.0f} ms"
+                  + (f" (+{entry.warmup_ms:.0f} ms warm-up)" if entry.warmup_ms is not None else ""))
+            return model
+
+    async def get(self, name: str) -> Any:
+        entry = self._entries[name]
+        if entry.state == "ready":
+            return entry.model
+        # Încărcarea (secunde) pe thread, event loop-ul merge mai departe
+        return await asyncio.to_thread(self.load, name)
+
+    def warm_up(self, names: Iterable[str]) -> threading.Thread:
+        """Încarcă pe fundal (thread daemon) și marchează modelele ca necesare pentru /ready."""
+        names = [n for n in names if n in self._entries]
+        with self._lock:
+            self._wanted.extend(n for n in names if n not in self._wanted)
+
+        def run():
+            if self.prefetch_files:
+                for name in names:
+                    entry = self._entries[name]
+                    if entry.files is not None and entry.state == "idle":
+                        try:
+                            mb = prefetch(entry.files()) / 1024 / 1024
+                            print(f"📀 Prefetch '{name}': {mb:.0f} MB în page cache")
+                        except Exception as e:
+                            print(f"⚠️ Prefetch '{name}' eșuat: {e}")
+            for name in names:
+                try:
+                    self.load(name)
+                except Exception:
+                    traceback.print_exc()
+
+        thread = threading.Thread(target=run, name="model-warmup", daemon=True)
+        thread.start()
+        self._threads.append(thread)
+        return thread
+
+    def ready(self) -> bool:
+        return all(self._entries[name].state == "ready" for name in self._wanted)
+
+    def time_to_ready_ms(self) -> Optional[float]:
+        # De la pornirea procesului (nu de la import) până la ultimul model necesar
+        if not self.ready():
+            return None
+        ready_at = max((self._entries[name].ready_at for name in self._wanted), default=PROCESS_STARTED)
+        return round((ready_at - PROCESS_STARTED) * 1000, 1)
+
+    def status(self) -> dict:
+        return {
+            "ready": self.ready(),
+            "pid": os.getpid(),
+            "uptime_ms": round((time.time() - PROCESS_STARTED) * 1000, 1),
+            "time_to_ready_ms": self.time_to_ready_ms(),
+            "required": list(self._wanted),
+            "models": {name: entry.status() for name, entry in self._entries.items()},
+            "memory": memory_mb(),
+        }
+
+
+MODELS = ModelRegistry()
@@ -0,0 +1,71 @@
+import os
+import struct
+from dataclasses import dataclass, field
+from typing import List
+
+# --- CONFIGURARE ---
+OPUS_PASSTHROUGH = os.getenv('OPUS_PASSTHROUGH', '1') == '1'  # audio aprobat = cadrele Opus originale, fără re-encodare
+
+# Format relay (un singur mesaj binar websocket per frază, cadrele sunt exact cele primite):
+#   MAGIC | u8 versiune | u8 canale | u32 sample rate | u16 len(extradata) | extradata | u32 cadre
+#   cadru = u16 len | pachet Opus
+# extradata = OpusHead din WebM (poate lipsi: pachetele din WebCodecs / Discord nu au nevoie de el)
+MAGIC = b"OPUS"
+VERSION = 1
+SILENCE_FRAME = b"\xf8\xff\xfe"  # 20ms de liniște Opus (același cadru pe care îl trimite Discord)
+
+_HEADER = struct.Struct("<4sBBIH")
+
+
+@dataclass
+class OpusClip:
+    """O frază ca pachete Opus brute; decodăm doar pentru STT, iar la relay trimitem bytes-ii originali."""
+    packets: List[bytes] = field(default_factory=list)
+    sample_rate: int = 48000
+    channels: int = 1
+    extradata: bytes = b""
+
+    def append(self, packet: bytes):
+        self.packets.append(bytes(packet))
+
+    def clear(self):
+        self.packets.clear()
+
+    @property
+    def size(self) -> int:
+        return sum(len(p) for p in self.packets)
+
+    def __bool__(self):
+        return bool(self.packets)
+
+    def pack(self) -> bytes:
+        out = [_HEADER.pack(MAGIC, VERSION, self.channels, self.sample_rate, len(self.extradata)),
+               self.extradata, struct.pack("<I", len(self.packets))]
+        for packet in self.packets:
+            out.append(struct.pack("<H", len(packet)))
+            out.append(packet)
+        return b"".join(out)
+
+
+def is_packed(data: bytes) -> bool:
+    return data[:4] == MAGIC
+
+
+def unpack(data: bytes) -> OpusClip:
+    try:
+        magic, version, channels, sample_rate, extra_len = _HEADER.unpack_from(data)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"nu e un clip Opus v{VERSION}")
+        pos = _HEADER.size
+        extradata = data[pos:pos + extra_len]
+        pos += extra_len
+        (count,) = struct.unpack_from("<I", data, pos)
+        pos += 4
+        packets = []
+        for _ in range(count):
+            (size,) = struct.unpack_from("<H", data, pos)
+            packets.append(data[pos + 2:pos + 2 + size])
+            pos += 2 + size
+    except struct.error as e:
+        raise ValueError(f"clip Opus trunchiat: {e}") from None
+    return OpusClip(packets, sample_rate, channels, extradata)
@@ -0,0 +1,122 @@
+import asyncio
+import io
+import numpy as np
+from collections import deque
+from dataclasses import dataclass
+from typing import List, Optional
+
+import discord
+from discord.opus import Encoder as OpusEncoder
+
+import metrics
+from opus_relay import OPUS_PASSTHROUGH
+
+
+@dataclass
+class Clip:
+    """O frază aprobată: PCM-ul (pt mix / fallback) și, dacă le avem, pachetele Opus originale."""
+    pcm: io.BufferedIOBase
+    opus: Optional[List[bytes]] = None
+
+
+class OpusFramesAudio(discord.AudioSource):
+    """Cadrele Opus ale vorbitorului (20ms, 48kHz stereo, exact cum au venit) trimise byte cu byte."""
+
+    def __init__(self, frames: List[bytes]):
+        self.frames = frames
+        self._next = 0
+
+    def read(self) -> bytes:
+        if self._next >= len(self.frames):
+            return b""
+        self._next += 1
+        return self.frames[self._next - 1]
+
+    def is_opus(self) -> bool:
+        # py-cord nu mai trece cadrele prin encoder (send_audio_packet(encode=False))
+        return True
+
+
+class MixedPCMAudio(discord.AudioSource):
+    """Mai multe clipuri PCM (48kHz stereo s16le) redate peste olaltă, mixate cadru cu cadru."""
+
+    def __init__(self, streams: List[io.BufferedIOBase]):
+        self.streams = list(streams)
+
+    def read(self) -> bytes:
+        mix = None
+        for stream in list(self.streams):
+            frame = stream.read(OpusEncoder.FRAME_SIZE)
+            if len(frame) < OpusEncoder.FRAME_SIZE:
+                self.streams.remove(stream)
+                if not frame:
+                    continue
+                frame = frame.ljust(OpusEncoder.FRAME_SIZE, b"\x00")
+            samples = np.frombuffer(frame, dtype="<i2").astype(np.int32)
+            mix = samples if mix is None else mix + samples
+        if mix is None:
+            return b""
+        return np.clip(mix, -32768, 32767).astype("<i2").tobytes()
+
+
+class PlaybackQueue:
+    """
+    Coadă ordonată de clipuri aprobate. Următorul clip pornește din callback-ul `after=`
+    al player-ului (fără polling pe is_playing). În modul mix, tot ce s-a adunat cât
+    timp canalul era ocupat se redă împreună. Un clip redat singur cu pachetele Opus originale
+    nu mai trece prin decodare + re-encodare (mixul are nevoie de PCM, deci acolo re-encodăm).
+    """
+
+    def __init__(self, voice_client: discord.VoiceClient, loop: asyncio.AbstractEventLoop, mix: bool = False,
+                 passthrough: bool = OPUS_PASSTHROUGH):
+        self.voice_client = voice_client
+        self.loop = loop
+        self.mix = mix
+        self.passthrough = passthrough
+        self._pending: deque = deque()
+        self._playing = False
+        self.played = 0
+        self.played_opus = 0
+
+    def enqueue(self, *clips):
+        # Clipurile din aceeași fereastră intră împreună (și se pot mixa între ele); acceptă și stream-uri PCM simple
+        for clip in clips:
+            if not isinstance(clip, Clip):
+                clip = Clip(clip)
+            clip.pcm.seek(0)
+            self._pending.append(clip)
+        if self._pending and not self._playing:
+            self._play_next()
+
+    def _play_next(self):
+        if not self._pending or not self.voice_client.is_connected():
+            self._playing = False
+            return
+        if self.mix and len(self._pending) > 1:
+            streams = [clip.pcm for clip in self._pending]
+            self._pending.clear()
+            source, path, count = MixedPCMAudio(streams), "mix", len(streams)
+        else:
+            clip = self._pending.popleft()
+            if self.passthrough and clip.opus:
+                source, path = OpusFramesAudio(clip.opus), "opus"
+                self.played_opus += 1
+            else:
+                source, path = discord.PCMAudio(clip.pcm), "pcm"
+            count = 1
+        self.played += count
+        metrics.PLAYBACK_CLIPS.inc(count, path=path)
+        self._playing = True
+        self.voice_client.play(source, after=self._after)
+
+    def _after(self, error):
+        # Rulează pe thread-ul player-ului -> ne întoarcem în event loop
+        if error:
+            print(f"⚠️ Eroare redare: {error}")
+        self.loop.call_soon_threadsafe(self._play_next)
+
+    def clear(self):
+        self._pending.clear()
+
+    def __len__(self):
+        return len(self._pending)
@@ -0,0 +1,391 @@
+import os
+import csv
+import json
+import math
+import sys
+import time
+import zlib
+import argparse
+from collections import deque
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from verdict_cache import normalize_text
+
+# --- CONFIGURARE ---
+PREFILTER_ENABLED = os.getenv('PREFILTER_ENABLED', '0') == '1'  # opt-in: verdicte locale doar la pragul implicit
+PREFILTER_LEXICON = os.getenv('PREFILTER_LEXICON', 'prefilter_lexicon.txt')  # termeni toxici (vezi fișierul)
+PREFILTER_MODEL = os.getenv('PREFILTER_MODEL', 'prefilter_model.json')       # greutăți; lipsă = antrenăm la pornire
+PREFILTER_DATASET = os.getenv('PREFILTER_DATASET', 'train_dataset.csv')
+# Benzile sunt provizorii: calibrate (eval, 5-fold) pe cele 100 de rânduri din train_dataset.csv.
+# Pe traficul real recalibrează cu `python prefilter.py eval --dataset <ieșirea rescore.py>`.
+PREFILTER_SAFE_BELOW = float(os.getenv('PREFILTER_SAFE_BELOW', '0.3'))       # p(toxic) sub asta -> SAFE local
+PREFILTER_TOXIC_ABOVE = float(os.getenv('PREFILTER_TOXIC_ABOVE', '0.95'))    # p(toxic) peste asta -> TOXIC local
+
+HASH_BUCKETS = 4096
+_LEXICON_FEATURE = HASH_BUCKETS  # ultima coloană = suma greutăților din lexicon
+
+
+class AhoCorasick:
+    """Automat multi-pattern: toți termenii găsiți într-o singură trecere prin text."""
+
+    def __init__(self, patterns: Dict[str, object]):
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._out: List[List[object]] = [[]]
+        for pattern, value in patterns.items():
+            node = 0
+            for ch in pattern:
+                nxt = self._goto[node].get(ch)
+                if nxt is None:
+                    nxt = len(self._goto)
+                    self._goto[node][ch] = nxt
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._out.append([])
+                node = nxt
+            self._out[node].append(value)
+
+        # BFS pentru legăturile de eșec; ieșirile se moștenesc din nodul de fail
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for ch, nxt in self._goto[node].items():
+                queue.append(nxt)
+                fail = self._fail[node]
+                while fail and ch not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[nxt] = self._goto[fail].get(ch, 0)
+                self._out[nxt] = self._out[nxt] + self._out[self._fail[nxt]]
+
+    def find(self, text: str) -> List[object]:
+        goto, fail, out = self._goto, self._fail, self._out
+        node, found = 0, []
+        for ch in text:
+            while node and ch not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(ch, 0)
+            if out[node]:
+                found.extend(out[node])
+        return found
+
+
+class Lexicon:
+    """Termenii din PREFILTER_LEXICON compilați într-un singur automat (pe text normalizat)."""
+
+    def __init__(self, entries: List[Tuple[str, float, bool]]):
+        self.entries = entries
+        patterns = {}
+        for term, weight, severe in entries:
+            prefix = term.endswith('*')
+            term = normalize_text(term.rstrip('*'))
+            if not term:
+                continue
+            # Spațiile din jur = granițe de cuvânt ("idiot" nu se potrivește în "idiotic");
+            # "stupid*" rămâne deschis la dreapta
+            key = f" {term}" if prefix else f" {term} "
+            patterns[key] = (term, weight, severe)
+        self.matcher = AhoCorasick(patterns)
+
+    @classmethod
+    def load(cls, path: str = PREFILTER_LEXICON) -> "Lexicon":
+        entries = []
+        if path and os.path.exists(path):
+            with open(path, encoding='utf-8') as f:
+                for line in f:
+                    line = line.strip()
+                    if not line or line.startswith('#'):
+                        continue
+                    severe = line.startswith('!')
+                    term, weight = line.lstrip('!'), 1.0
+                    parts = term.rsplit(None, 1)
+                    if len(parts) == 2:
+                        try:
+                            term, weight = parts[0], float(parts[1])
+                        except ValueError:
+                            pass
+                    entries.append((term.strip(), weight, severe))
+        else:
+            print(f"⚠️ Prefilter: lexiconul {path} lipsește, merg doar cu modelul liniar")
+        return cls(entries)
+
+    def hits(self, normalized: str) -> List[Tuple[str, float, bool]]:
+        return self.matcher.find(f" {normalized} ")
+
+
+def _features(normalized: str) -> List[int]:
+    # Unigrame + bigrame, hash stabil (crc32) -> aceleași coloane la antrenare și în producție
+    words = normalized.split()
+    grams = words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+    return [zlib.crc32(g.encode('utf-8')) % HASH_BUCKETS for g in grams]
+
+
+class LinearModel:
+    """Regresie logistică pe bag-of-words (hashing trick) + scorul din lexicon."""
+
+    def __init__(self, weights: np.ndarray, bias: float, rows: int = 0):
+        self.weights = weights
+        self.bias = bias
+        self.rows = rows
+        # La inferență: listă de float-uri Python (scalarii numpy sunt de ~10x mai lenți)
+        self._w = weights.tolist()
+
+    def probability(self, features: List[int], lexicon_score: float) -> float:
+        w = self._w
+        z = self.bias + lexicon_score * w[_LEXICON_FEATURE]
+        for idx in features:
+            z += w[idx]
+        return 1.0 / (1.0 + math.exp(-z))
+
+    @classmethod
+    def train(cls, texts: List[str], labels: List[int], lexicon: Lexicon,
+              l2: float = 0.01, epochs: int = 400, lr: float = 0.5) -> "LinearModel":
+        x = np.zeros((len(texts), HASH_BUCKETS + 1), dtype=np.float32)
+        for row, text in enumerate(texts):
+            normalized = normalize_text(text)
+            for idx in _features(normalized):
+                x[row, idx] += 1.0
+            x[row, _LEXICON_FEATURE] = sum(w for _, w, _ in lexicon.hits(normalized))
+        y = np.asarray(labels, dtype=np.float32)
+        w = np.zeros(HASH_BUCKETS + 1, dtype=np.float32)
+        b = 0.0
+        # Gradient descent pe tot setul (100 de rânduri -> câteva milisecunde)
+        for _ in range(epochs):
+            p = 1.0 / (1.0 + np.exp(-(x @ w + b)))
+            err = p - y
+            w -= lr * (x.T @ err / len(y) + l2 * w)
+            b -= lr * float(err.mean())
+        return cls(w, b, rows=len(y))
+
+    def save(self, path: str):
+        nonzero = {int(i): round(float(self.weights[i]), 6) for i in np.flatnonzero(self.weights)}
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({"buckets": HASH_BUCKETS, "bias": self.bias, "rows": self.rows,
+                       "weights": nonzero}, f)
+
+    @classmethod
+    def load(cls, path: str) -> Optional["LinearModel"]:
+        try:
+            with open(path, encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if data.get("buckets") != HASH_BUCKETS:
+            print(f"⚠️ Prefilter: {path} e pentru alt număr de bucket-uri, reantrenez")
+            return None
+        weights = np.zeros(HASH_BUCKETS + 1, dtype=np.float32)
+        for idx, value in data["weights"].items():
+            weights[int(idx)] = value
+        return cls(weights, float(data["bias"]), rows=int(data.get("rows", 0)))
+
+
+def load_dataset(path: str = PREFILTER_DATASET) -> Tuple[List[str], List[int]]:
+    """text + expected_label (TOXIC / SAFE) sau ieșirea rescore.py (text + score de la BERT)."""
+    texts, labels = [], []
+    with open(path, newline='', encoding='utf-8') as f:
+        for row in csv.DictReader(f):
+            if row.get('expected_label'):
+                labels.append(1 if row['expected_label'].strip().upper() == 'TOXIC' else 0)
+            elif row.get('score'):
+                # Verdictul BERT la pragul implicit (DEFAULT_THRESHOLD din toxicity_client)
+                labels.append(1 if float(row['score']) >= 0.5 else 0)
+            else:
+                continue
+            texts.append(row['text'])
+    return texts, labels
+
+
+def _band_verdict(p: float, hits, safe_below: float, toxic_above: float) -> Optional[bool]:
+    if p >= toxic_above or any(severe for _, _, severe in hits):
+        return True
+    # Un termen din lexicon nu se declară niciodată SAFE local, oricât de mic e p
+    if p <= safe_below and not hits:
+        return False
+    return None
+
+
+class Prefilter:
+    """Prima treaptă, în proces: cazurile clare se decid în microsecunde, restul merg la BERT."""
+
+    def __init__(self, lexicon: Lexicon, model: Optional[LinearModel],
+                 safe_below: float = PREFILTER_SAFE_BELOW, toxic_above: float = PREFILTER_TOXIC_ABOVE):
+        self.lexicon = lexicon
+        self.model = model
+        self.safe_below = safe_below
+        self.toxic_above = toxic_above
+        self.decided_safe = 0
+        self.decided_toxic = 0
+        self.forwarded = 0
+        self.total_us = 0.0
+
+    @classmethod
+    def load(cls, lexicon_path: str = PREFILTER_LEXICON, model_path: str = PREFILTER_MODEL,
+             dataset_path: str = PREFILTER_DATASET) -> "Prefilter":
+        lexicon = Lexicon.load(lexicon_path)
+        model = LinearModel.load(model_path) if model_path else None
+        if model is None and dataset_path and os.path.exists(dataset_path):
+            model = LinearModel.train(*load_dataset(dataset_path), lexicon)
+            print(f"🧮 Prefilter: model antrenat din {dataset_path} ({model.rows} rânduri)")
+        print(f"🧹 Prefilter: {len(lexicon.entries)} termeni, benzi SAFE<{PREFILTER_SAFE_BELOW} "
+              f"TOXIC>{PREFILTER_TOXIC_ABOVE}")
+        return cls(lexicon, model)
+
+    def score(self, text: str) -> Tuple[float, List[Tuple[str, float, bool]]]:
+        normalized = normalize_text(text)
+        hits = self.lexicon.hits(normalized)
+        if self.model is None:
+            return (1.0 if hits else 0.5), hits
+        lexicon_score = sum(w for _, w, _ in hits)
+        return self.model.probability(_features(normalized), lexicon_score), hits
+
+    def classify(self, text: str) -> Tuple[Optional[bool], float, str]:
+        """(True = toxic / False = safe / None = nesigur -> BERT, p(toxic), motiv)."""
+        p, hits = self.score(text)
+        verdict = _band_verdict(p, hits, self.safe_below, self.toxic_above)
+        if verdict and any(severe for _, _, severe in hits):
+            return True, 1.0, "lexicon:" + ",".join(t for t, _, severe in hits if severe)
+        return verdict, p, ("uncertain" if verdict is None else "model")
+
+    def decide(self, text: str, threshold: float = 0.5) -> Optional[List[dict]]:
+        """Labels ca de la API ([] = safe) sau None dacă textul trebuie trimis la BERT."""
+        start = time.perf_counter()
+        verdict, p, reason = self.classify(text)
+        self.total_us += (time.perf_counter() - start) * 1e6
+        if verdict and p < threshold:
+            # Un prag cerut mai sus decât scorul nostru: hotărăște BERT, nu noi
+            verdict = None
+        if verdict is None:
+            self.forwarded += 1
+            return None
+        if verdict:
+            self.decided_toxic += 1
+            return [{"label": "toxic", "score": round(float(p), 4), "source": f"prefilter/{reason}"}]
+        self.decided_safe += 1
+        return []
+
+    def stats(self) -> dict:
+        total = self.decided_safe + self.decided_toxic + self.forwarded
+        avoided = self.decided_safe + self.decided_toxic
+        return {
+            "decided_safe": self.decided_safe,
+            "decided_toxic": self.decided_toxic,
+            "forwarded": self.forwarded,
+            "avoided_calls": avoided,
+            "avoided_ratio": round(avoided / total, 4) if total else 0.0,
+            "avg_us": round(self.total_us / total, 2) if total else 0.0,
+            "bands": {"safe_below": self.safe_below, "toxic_above": self.toxic_above},
+        }
+
+
+# ---------------------------------------------------------------------------
+# CLI: python prefilter.py train | check "text" | eval
+# ---------------------------------------------------------------------------
+
+def _evaluate(texts, labels, lexicon, folds, bands):
+    """Cross-validation: fiecare rând e judecat de un model care nu l-a văzut la antrenare."""
+    order = np.random.default_rng(0).permutation(len(texts))
+    scored = []  # (p, hits, expected)
+    for fold in range(folds):
+        test = set(order[fold::folds].tolist())
+        train_idx = [i for i in range(len(texts)) if i not in test]
+        model = LinearModel.train([texts[i] for i in train_idx], [labels[i] for i in train_idx], lexicon)
+        pf = Prefilter(lexicon, model)
+        for i in sorted(test):
+            p, hits = pf.score(texts[i])
+            scored.append((texts[i], p, hits, labels[i]))
+
+    rows = []
+    for safe_below, toxic_above in bands:
+        confusion = {"tp": 0, "fp": 0, "tn": 0, "fn": 0}
+        mistakes = []
+        for text, p, hits, expected in scored:
+            verdict = _band_verdict(p, hits, safe_below, toxic_above)
+            if verdict is None:
+                continue
+            key = ("tp" if expected else "fp") if verdict else ("fn" if expected else "tn")
+            confusion[key] += 1
+            if key in ("fp", "fn"):
+                mistakes.append((key, round(float(p), 3), text))
+        decided = sum(confusion.values())
+        correct = confusion["tp"] + confusion["tn"]
+        rows.append({
+            "safe_below": safe_below, "toxic_above": toxic_above,
+            "decided": decided, "forwarded": len(scored) - decided,
+            "avoided_ratio": round(decided / len(scored), 3) if scored else 0.0,
+            "local_accuracy": round(correct / decided, 3) if decided else None,
+            "confusion": confusion, "mistakes": mistakes,
+        })
+    return rows
+
+
+def _parse_bands(value: str) -> List[Tuple[float, float]]:
+    bands = []
+    for part in value.split(','):
+        low, high = part.split(':')
+        bands.append((float(low), float(high)))
+    return bands
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pre-filtru lexical local pentru verdictele de toxicitate")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+
+    p_train = sub.add_parser("train", help="antrenează modelul liniar și îl scrie în PREFILTER_MODEL")
+    p_train.add_argument("--dataset", default=PREFILTER_DATASET)
+    p_train.add_argument("--out", default=PREFILTER_MODEL)
+
+    p_check = sub.add_parser("check", help="verdictul local pentru un text")
+    p_check.add_argument("text")
+
+    p_eval = sub.add_parser("eval", help="acuratețea verdictelor locale față de expected_label")
+    p_eval.add_argument("--dataset", default=PREFILTER_DATASET)
+    p_eval.add_argument("--folds", type=int, default=5)
+    p_eval.add_argument("--bands", default=f"{PREFILTER_SAFE_BELOW}:{PREFILTER_TOXIC_ABOVE},"
+                                            "0.1:0.95,0.2:0.9,0.3:0.8",
+                        help="listă safe_below:toxic_above, separate prin virgulă")
+    p_eval.add_argument("--json", action="store_true")
+    p_eval.add_argument("--show-mistakes", action="store_true")
+
+    args = parser.parse_args()
+    lexicon = Lexicon.load(PREFILTER_LEXICON)
+
+    if args.cmd == "train":
+        model = LinearModel.train(*load_dataset(args.dataset), lexicon)
+        model.save(args.out)
+        print(f"✅ Model salvat în {args.out} ({model.rows} rânduri)")
+        return
+
+    if args.cmd == "check":
+        pf = Prefilter.load()
+        start = time.perf_counter()
+        verdict, p, reason = pf.classify(args.text)
+        us = (time.perf_counter() - start) * 1e6
+        label = {True: "TOXIC", False: "SAFE", None: "-> BERT"}[verdict]
+        hits = [t for t, _, _ in pf.lexicon.hits(normalize_text(args.text))]
+        print(f"{label}  p={p:.3f}  motiv={reason}  lexicon={hits}  ({us:.0f} µs)")
+        return
+
+    texts, labels = load_dataset(args.dataset)
+    rows = _evaluate(texts, labels, lexicon, max(2, args.folds), _parse_bands(args.bands))
+    if args.json:
+        json.dump(rows, sys.stdout, indent=2, ensure_ascii=False)
+        print()
+        return
+    # Modelul liniar e validat încrucișat; lexiconul e fix, deci trebuie scris independent de setul de evaluare
+    with_hits = sum(1 for text in texts if lexicon.hits(normalize_text(text)))
+    print(f"📊 {len(texts)} rânduri, {args.folds}-fold cross-validation "
+          f"({with_hits} cu termeni din lexicon, {PREFILTER_LEXICON})")
+    print(f"{'SAFE<':>6} {'TOXIC>':>7} {'local':>6} {'->BERT':>7} {'evitat':>7} {'acuratețe':>10}   tp/fp/tn/fn")
+    for r in rows:
+        c = r["confusion"]
+        acc = "-" if r["local_accuracy"] is None else f"{r['local_accuracy']:.1%}"
+        print(f"{r['safe_below']:>6} {r['toxic_above']:>7} {r['decided']:>6} {r['forwarded']:>7} "
+              f"{r['avoided_ratio']:>7.1%} {acc:>10}   {c['tp']}/{c['fp']}/{c['tn']}/{c['fn']}")
+        if args.show_mistakes:
+            for kind, p, text in r["mistakes"]:
+                print(f"      {kind} p={p}: {text}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,417 @@
+import os
+import csv
+import json
+import time
+import asyncio
+import sqlite3
+import argparse
+import itertools
+from typing import Dict, Iterator, List, Optional
+
+from interaction_log import CSV_HEADER, LOG_DIR, iter_rows, labels_to_str
+from toxicity_client import TOXICITY_API_URL, DEFAULT_THRESHOLD, ToxicityClient
+from verdict_cache import normalize_text
+
+# Re-scorare offline a istoricului (stats.csv, stats_vosk.csv, log:<prefix>) și a dataset-ului:
+#   python rescore.py run stats_vosk.csv train_dataset.csv --url inprocess
+#   python rescore.py run log:stats --thresholds 0.3,0.5,0.7      (segmentele din logs/)
+#   python rescore.py report                                      (rapoartele deja scrise)
+# Fiecare text unic (normalizat ca în VerdictCache) e scorat o singură dată, la threshold 0, iar scorurile
+# stau în SQLite -> orice threshold se evaluează fără alt apel. Oprită oricând, comanda se reia din checkpoint.
+
+# --- CONFIGURARE ---
+RESCORE_DIR = os.getenv('RESCORE_DIR', 'rescore')                     # scores.sqlite, CSV-uri re-etichetate, rapoarte
+RESCORE_BATCH_SIZE = int(os.getenv('RESCORE_BATCH_SIZE', '256'))      # texte per cerere /check_batch
+RESCORE_CONCURRENCY = int(os.getenv('RESCORE_CONCURRENCY', '8'))      # cereri batch în zbor
+RESCORE_CHUNK_ROWS = int(os.getenv('RESCORE_CHUNK_ROWS', '20000'))    # rânduri în memorie odată = un checkpoint
+RESCORE_TIMEOUT = float(os.getenv('RESCORE_TIMEOUT', '120'))          # un batch mare pe CPU durează
+RESCORE_RETRIES = int(os.getenv('RESCORE_RETRIES', '3'))
+RESCORE_THRESHOLDS = os.getenv('RESCORE_THRESHOLDS', '0.1,0.2,0.3,0.4,0.5,0.6,0.7,0.8,0.9')
+
+EXTRA_COLUMNS = ["score", "rescored_labels", "differs"]
+_TRUE = {"toxic", "1", "true", "yes"}
+_FALSE = {"safe", "0", "false", "no"}
+_SQL_VARS = 500  # chei per SELECT ... IN (...)
+
+
+class ScoreStore:
+    """
+    SQLite pe disc: scorul fiecărui text unic (cheie = textul normalizat) + checkpoint-ul fiecărei surse.
+    Memoria rămâne mică indiferent câte milioane de rânduri trec prin job.
+    """
+
+    def __init__(self, path: str, model: str, reset_scores: bool = False):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.db = sqlite3.connect(path)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.executescript("""
+            CREATE TABLE IF NOT EXISTS scores (key TEXT PRIMARY KEY, labels TEXT NOT NULL) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS progress (source TEXT PRIMARY KEY, rows INTEGER NOT NULL,
+                                                 out_bytes INTEGER NOT NULL, counts TEXT NOT NULL, done INTEGER NOT NULL);
+            CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+        """)
+        row = self.db.execute("SELECT value FROM meta WHERE key = 'model'").fetchone()
+        if reset_scores:
+            self.db.execute("DELETE FROM scores")
+            self.db.execute("DELETE FROM progress")
+        elif row is not None and row[0] != model:
+            raise SystemExit(f"❌ {path} are scoruri de la '{row[0]}', nu de la '{model}'. "
+                             f"Folosește alt --db sau --reset-scores.")
+        self.db.execute("INSERT OR REPLACE INTO meta VALUES ('model', ?)", (model,))
+        self.db.commit()
+
+    def lookup(self, keys: List[str]) -> Dict[str, Dict[str, float]]:
+        found = {}
+        for i in range(0, len(keys), _SQL_VARS):
+            part = keys[i:i + _SQL_VARS]
+            query = f"SELECT key, labels FROM scores WHERE key IN ({','.join('?' * len(part))})"
+            for key, labels in self.db.execute(query, part):
+                found[key] = json.loads(labels)
+        return found
+
+    def put(self, scored: Dict[str, Dict[str, float]]):
+        self.db.executemany("INSERT OR REPLACE INTO scores VALUES (?, ?)",
+                            [(key, json.dumps(labels, separators=(",", ":"))) for key, labels in scored.items()])
+
+    def progress(self, source: str) -> Optional[dict]:
+        row = self.db.execute("SELECT rows, out_bytes, counts, done FROM progress WHERE source = ?", (source,)).fetchone()
+        if row is None:
+            return None
+        return {"rows": row[0], "out_bytes": row[1], "counts": json.loads(row[2]), "done": bool(row[3])}
+
+    def checkpoint(self, source: str, rows: int, out_bytes: int, counts: dict, done: bool = False):
+        # Scorurile noi și poziția în sursă intră în aceeași tranzacție
+        self.db.execute("INSERT OR REPLACE INTO progress VALUES (?, ?, ?, ?, ?)",
+                        (source, rows, out_bytes, json.dumps(counts), int(done)))
+        self.db.commit()
+
+    def reset(self, source: str):
+        self.db.execute("DELETE FROM progress WHERE source = ?", (source,))
+        self.db.commit()
+
+    def __len__(self):
+        return self.db.execute("SELECT COUNT(*) FROM scores").fetchone()[0]
+
+    def close(self):
+        self.db.close()
+
+
+class Scorer:
+    """Batch-uri mari și concurente direct pe /check_batch (sau pe modelul din proces, cu --url inprocess)."""
+
+    def __init__(self, url: str = TOXICITY_API_URL, batch_size: int = RESCORE_BATCH_SIZE,
+                 concurrency: int = RESCORE_CONCURRENCY, timeout: float = RESCORE_TIMEOUT,
+                 retries: int = RESCORE_RETRIES):
+        # Fără cache / pre-filtru / micro-batching: vrem scorurile modelului, pe toate etichetele
+        self.client = ToxicityClient(url, timeout=timeout, connect_timeout=min(timeout, 5.0),
+                                     batch_url=url + "_batch", batch_window_ms=0)
+        self.batch_url = url + "_batch"
+        self.batch_size = batch_size
+        self.concurrency = concurrency
+        self.retries = retries
+        self.batch_supported = True
+        self.calls = 0
+        self.scored = 0
+        self.retried = 0
+        self.busy_s = 0.0
+
+    @property
+    def model(self) -> str:
+        if self.client.local is not None:
+            from toxicity_server import TOXICITY_MODEL_DIR, TOXICITY_MODEL_FILE
+            return f"inprocess:{os.path.join(TOXICITY_MODEL_DIR, TOXICITY_MODEL_FILE)}"
+        return self.client.url
+
+    async def _request(self, texts: List[str]) -> Optional[List[Optional[List[dict]]]]:
+        # threshold 0 -> toate etichetele cu scorul lor; threshold-urile se aplică după, offline
+        self.calls += 1
+        if self.client.local is not None:
+            return await self.client.local.check_batch(texts, 0.0)
+        if self.batch_supported:
+            async with self.client.get_session().post(self.batch_url, json={"texts": texts, "threshold": 0.0}) as resp:
+                if resp.status == 200:
+                    results = (await resp.json()).get("results")
+                    return results if isinstance(results, list) and len(results) == len(texts) else None
+                if resp.status not in (404, 405):
+                    return None
+                print(f"⚠️ {self.batch_url} nu suportă batch ({resp.status}), revin la cereri individuale.")
+                self.batch_supported = False
+        # Text cu text (API-ul vechi); None = eroare pe textul respectiv
+        return await asyncio.gather(*[self.client._post(text, 0.0) for text in texts])
+
+    async def _batch(self, texts: List[str], semaphore: asyncio.Semaphore) -> List[Optional[List[dict]]]:
+        results: List[Optional[List[dict]]] = [None] * len(texts)
+        pending = list(range(len(texts)))
+        for attempt in range(self.retries + 1):
+            if attempt:
+                self.retried += 1
+                await asyncio.sleep(0.5 * 2 ** (attempt - 1))
+            async with semaphore:
+                started = time.perf_counter()
+                try:
+                    answer = await self._request([texts[i] for i in pending])
+                except Exception as e:
+                    print(f"⚠️ Eroare batch ({len(pending)} texte): {type(e).__name__}: {e}")
+                    answer = None
+                self.busy_s += time.perf_counter() - started
+            if answer is not None:
+                for i, labels in zip(pending, answer):
+                    results[i] = labels
+            pending = [i for i in pending if results[i] is None]
+            if not pending:
+                break
+        return results
+
+    async def score(self, texts: List[str]) -> List[Optional[Dict[str, float]]]:
+        """Texte -> {etichetă: scor} (None = nu s-a putut scora nici după reîncercări)."""
+        semaphore = asyncio.Semaphore(self.concurrency)
+        batches = [texts[i:i + self.batch_size] for i in range(0, len(texts), self.batch_size)]
+        answers = await asyncio.gather(*[self._batch(batch, semaphore) for batch in batches])
+        out = []
+        for labels in itertools.chain.from_iterable(answers):
+            if labels is None:
+                out.append(None)
+                continue
+            self.scored += 1
+            out.append({l["label"]: round(float(l["score"]), 5) for l in labels})
+        return out
+
+    def stats(self) -> dict:
+        return {"calls": self.calls, "scored": self.scored, "retried": self.retried,
+                "avg_batch_ms": round(self.busy_s / self.calls * 1000, 1) if self.calls else None}
+
+    async def close(self):
+        await self.client.close()
+
+
+class Source:
+    """Un fișier CSV (stats*.csv, train_dataset.csv) sau log:<prefix> (segmentele din interaction_log)."""
+
+    def __init__(self, spec: str):
+        self.spec = spec
+        if spec.startswith("log:"):
+            self.prefix = spec[4:] or "stats"
+            self.name = f"log-{self.prefix}"
+            self.columns = list(CSV_HEADER)
+        else:
+            self.prefix = None
+            self.name = os.path.splitext(os.path.basename(spec))[0]
+            with open(spec, newline="", encoding="utf-8") as f:
+                self.columns = next(csv.reader(f), [])
+        if "text" not in self.columns:
+            raise SystemExit(f"❌ {spec}: lipsește coloana 'text'")
+        # Referința pentru matrice: eticheta din dataset sau verdictul logat atunci
+        self.truth = "expected_label" if "expected_label" in self.columns else \
+            "toxic_labels" if "toxic_labels" in self.columns else None
+
+    def rows(self, skip: int = 0) -> Iterator[dict]:
+        if self.prefix is not None:
+            yield from itertools.islice(iter_rows(LOG_DIR, self.prefix), skip, None)
+            return
+        with open(self.spec, newline="", encoding="utf-8") as f:
+            yield from itertools.islice(csv.DictReader(f), skip, None)
+
+    def truth_of(self, row: dict) -> Optional[bool]:
+        value = (row.get(self.truth) or "").strip().lower() if self.truth else ""
+        if self.truth == "toxic_labels":
+            return None if not value else value != "safe"
+        if value in _TRUE:
+            return True
+        if value in _FALSE:
+            return False
+        return None
+
+
+def _chunks(rows: Iterator[dict], size: int) -> Iterator[List[dict]]:
+    while True:
+        chunk = list(itertools.islice(rows, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _new_counts(thresholds: List[float], reference: Optional[str]) -> dict:
+    return {"reference": reference, "rows": 0, "empty": 0, "deduplicated": 0, "new_texts": 0, "with_truth": 0, "changed": 0,
+            "confusion": {f"{t:g}": {"tp": 0, "fp": 0, "tn": 0, "fn": 0} for t in thresholds}}
+
+
+def _rescored(labels: Dict[str, float], threshold: float) -> str:
+    return labels_to_str([{"label": label} for label, score in labels.items() if score >= threshold])
+
+
+async def rescore_source(source: Source, store: ScoreStore, scorer: Scorer, out_dir: str,
+                         thresholds: List[float], threshold: float, chunk_rows: int) -> Optional[dict]:
+    out_path = os.path.join(out_dir, f"{source.name}.rescored.csv")
+    state = store.progress(source.name)
+    if state is not None and state["done"]:
+        print(f"✅ {source.name}: deja procesat ({state['rows']} rânduri); --reset ca să reiei de la zero")
+        return build_report(source.name, state["counts"], threshold)
+
+    fieldnames = source.columns + [c for c in EXTRA_COLUMNS if c not in source.columns]
+    if state is None or not os.path.exists(out_path):
+        state = {"rows": 0, "out_bytes": 0, "counts": _new_counts(thresholds, source.truth)}
+        out = open(out_path, "w", newline="", encoding="utf-8")
+        csv.DictWriter(out, fieldnames=fieldnames).writeheader()
+    else:
+        # Ce s-a scris după ultimul checkpoint se aruncă și se refac acele rânduri
+        print(f"⏯️ {source.name}: reiau de la rândul {state['rows']}")
+        out = open(out_path, "r+", newline="", encoding="utf-8")
+        out.truncate(state["out_bytes"])
+        out.seek(state["out_bytes"])
+    writer = csv.DictWriter(out, fieldnames=fieldnames, extrasaction="ignore")
+
+    counts = state["counts"]
+    for t in thresholds:
+        counts["confusion"].setdefault(f"{t:g}", {"tp": 0, "fp": 0, "tn": 0, "fn": 0})
+    rows_done = state["rows"]
+    started, started_rows = time.perf_counter(), rows_done
+    try:
+        for chunk in _chunks(source.rows(skip=rows_done), chunk_rows):
+            keys = [normalize_text(row.get("text") or "") for row in chunk]
+            unique: Dict[str, str] = {}
+            for key, row in zip(keys, chunk):
+                if key and key not in unique:
+                    unique[key] = row["text"]
+            known = store.lookup(list(unique))
+            missing = [key for key in unique if key not in known]
+            if missing:
+                scored = await scorer.score([unique[key] for key in missing])
+                fresh = {key: labels for key, labels in zip(missing, scored) if labels is not None}
+                store.put(fresh)
+                known.update(fresh)
+                if len(fresh) < len(missing):
+                    # Checkpoint-ul rămâne la chunk-ul anterior; scorurile reușite sunt deja salvate
+                    store.db.commit()
+                    raise RuntimeError(f"{len(missing) - len(fresh)} texte nescorate după {scorer.retries} reîncercări")
+                counts["new_texts"] += len(fresh)
+
+            for key, row in zip(keys, chunk):
+                labels = known.get(key, {}) if key else {}
+                score = max(labels.values(), default=0.0)
+                truth = source.truth_of(row)
+                counts["rows"] += 1
+                counts["empty"] += 0 if key else 1
+                predicted = score >= threshold
+                row["score"] = f"{score:.4f}"
+                row["rescored_labels"] = _rescored(labels, threshold)
+                row["differs"] = "" if truth is None else str(int(predicted != truth))
+                writer.writerow(row)
+                if truth is None:
+                    continue
+                counts["with_truth"] += 1
+                counts["changed"] += int(predicted != truth)
+                for t_key, matrix in counts["confusion"].items():
+                    hit = score >= float(t_key)
+                    matrix[("tp" if truth else "fp") if hit else ("fn" if truth else "tn")] += 1
+            counts["deduplicated"] = counts["rows"] - counts["empty"] - counts["new_texts"]
+
+            rows_done += len(chunk)
+            out.flush()
+            store.checkpoint(source.name, rows_done, out.tell(), counts)
+            rate = (rows_done - started_rows) / max(time.perf_counter() - started, 1e-9)
+            print(f"⏩ {source.name}: {rows_done} rânduri ({counts['new_texts']} texte scorate, "
+                  f"{counts['deduplicated']} din cache), {rate:.0f} rânduri/s")
+    except Exception as e:
+        # Ctrl+C nu ajunge aici, dar nici nu strică nimic: checkpoint-ul e mereu la un chunk întreg
+        print(f"⏸️ {source.name}: oprit la rândul {rows_done} ({type(e).__name__}: {e}). "
+              f"Rulează aceeași comandă ca să reiei.")
+        return None
+    finally:
+        out.close()
+
+    store.checkpoint(source.name, rows_done, os.path.getsize(out_path), counts, done=True)
+    report = build_report(source.name, counts, threshold)
+    with open(os.path.join(out_dir, f"{source.name}.report.json"), "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    return report
+
+
+def build_report(name: str, counts: dict, threshold: float) -> dict:
+    table = []
+    for t_key, m in sorted(counts["confusion"].items(), key=lambda item: float(item[0])):
+        tp, fp, tn, fn = m["tp"], m["fp"], m["tn"], m["fn"]
+        precision = tp / (tp + fp) if tp + fp else None
+        recall = tp / (tp + fn) if tp + fn else None
+        f1 = 2 * precision * recall / (precision + recall) if precision and recall else None
+        total = tp + fp + tn + fn
+        table.append({"threshold": float(t_key), **m,
+                      "precision": round(precision, 4) if precision is not None else None,
+                      "recall": round(recall, 4) if recall is not None else None,
+                      "f1": round(f1, 4) if f1 is not None else None,
+                      "accuracy": round((tp + tn) / total, 4) if total else None})
+    best = max((row for row in table if row["f1"] is not None), key=lambda row: row["f1"], default=None)
+    return {"source": name, "threshold": threshold,
+            **{k: counts.get(k) for k in ("reference", "rows", "empty", "deduplicated", "new_texts", "with_truth", "changed")},
+            "best_f1_threshold": best["threshold"] if best else None, "thresholds": table}
+
+
+def print_report(report: dict):
+    print(f"\n📊 {report['source']}: {report['rows']} rânduri, {report['new_texts']} texte scorate, "
+          f"{report['deduplicated']} deduplicate, {report['changed']}/{report['with_truth']} "
+          f"diferă de {report['reference'] or 'referință'} la threshold {report['threshold']}")
+    print(f"{'thr':>5} {'tp':>7} {'fp':>7} {'tn':>7} {'fn':>7} {'prec':>7} {'recall':>7} {'f1':>7} {'acc':>7}")
+    fmt = lambda v: f"{v:7.3f}" if v is not None else f"{'-':>7}"
+    for row in report["thresholds"]:
+        mark = " ⭐" if row["threshold"] == report["best_f1_threshold"] else ""
+        print(f"{row['threshold']:5.2f} {row['tp']:7d} {row['fp']:7d} {row['tn']:7d} {row['fn']:7d} "
+              f"{fmt(row['precision'])} {fmt(row['recall'])} {fmt(row['f1'])} {fmt(row['accuracy'])}{mark}")
+
+
+async def run(args):
+    thresholds = sorted({float(t) for t in args.thresholds.split(",")} | {args.threshold})
+    sources = [Source(spec) for spec in args.sources]
+    os.makedirs(args.out, exist_ok=True)
+    scorer = Scorer(args.url, args.batch_size, args.concurrency)
+    store = ScoreStore(args.db or os.path.join(args.out, "scores.sqlite"), scorer.model, args.reset_scores)
+    if args.reset:
+        for source in sources:
+            store.reset(source.name)
+    print(f"🔁 Re-scorare {', '.join(s.name for s in sources)} cu {scorer.model} "
+          f"(batch {scorer.batch_size} x {scorer.concurrency}, {len(store)} texte deja scorate)")
+    try:
+        for source in sources:
+            report = await rescore_source(source, store, scorer, args.out, thresholds, args.threshold, args.chunk_rows)
+            if report is None:
+                break
+            print_report(report)
+    finally:
+        await scorer.close()
+        store.close()
+    print(f"\n📈 Scorer: {json.dumps(scorer.stats())}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Re-scorare offline pentru istoric și dataset (threshold / model nou)")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+
+    p_run = sub.add_parser("run", help="scorează sursele (cu checkpoint) și scrie CSV-uri re-etichetate + rapoarte")
+    p_run.add_argument("sources", nargs="+", help="fișiere CSV cu coloana text, sau log:<prefix> pt segmentele din logs/")
+    p_run.add_argument("--url", default=TOXICITY_API_URL, help="endpoint /check (batch = <url>_batch) sau 'inprocess'")
+    p_run.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD, help="threshold-ul pt rescored_labels")
+    p_run.add_argument("--thresholds", default=RESCORE_THRESHOLDS, help="threshold-urile din matricele de confuzie")
+    p_run.add_argument("--batch-size", type=int, default=RESCORE_BATCH_SIZE)
+    p_run.add_argument("--concurrency", type=int, default=RESCORE_CONCURRENCY)
+    p_run.add_argument("--chunk-rows", type=int, default=RESCORE_CHUNK_ROWS)
+    p_run.add_argument("--out", default=RESCORE_DIR)
+    p_run.add_argument("--db", default="", help="implicit <out>/scores.sqlite")
+    p_run.add_argument("--reset", action="store_true", help="ignoră checkpoint-urile surselor (scorurile rămân)")
+    p_run.add_argument("--reset-scores", action="store_true", help="șterge și scorurile (model schimbat)")
+
+    p_report = sub.add_parser("report", help="afișează rapoartele deja scrise")
+    p_report.add_argument("--out", default=RESCORE_DIR)
+    args = parser.parse_args()
+
+    if args.cmd == "run":
+        asyncio.run(run(args))
+    else:
+        names = sorted(n for n in os.listdir(args.out) if n.endswith(".report.json")) if os.path.isdir(args.out) else []
+        if not names:
+            print(f"⚠️ Niciun raport în {args.out}/")
+        for name in names:
+            with open(os.path.join(args.out, name), encoding="utf-8") as f:
+                print_report(json.load(f))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,174 +1,434 @@
-import os
-import asyncio
-import aiohttp
-import io
-import time
-import csv
-from datetime import datetime
-from typing import Dict, List
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect
-from fastapi.responses import HTMLResponse, JSONResponse
-from faster_whisper import WhisperModel
-
-app = FastAPI()
-
-# --- CONFIGURARE ---
-TOXICITY_API_URL = "http://127.0.0.1:8000/check"
-CSV_FILE = "stats.csv"
-
-# Inițializăm CSV-ul dacă nu există
-if not os.path.exists(CSV_FILE):
-    with open(CSV_FILE, mode='w', newline='', encoding='utf-8') as f:
-        writer = csv.writer(f)
-        # Header-ul CSV-ului
-        writer.writerow(["timestamp", "user", "text", "toxic_labels", "stt_time", "ai_time", "latency_ms", "user_count"])
-
-WHISPER_TYPE = "base.en"
-print(f"🚀 Încărcare Whisper TURBO {WHISPER_TYPE}...")
-model = WhisperModel(WHISPER_TYPE, device="cpu", compute_type="int8", cpu_threads=4)
-
-print("✅ Whisper Gata!")
-
-# --- LOGARE ÎN CSV ---
-def log_interaction(username, text, toxic_labels, stt_time, ai_time, total_latency, user_count):
-    try:
-        with open(CSV_FILE, mode='a', newline='', encoding='utf-8') as f:
-            writer = csv.writer(f)
-            timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            labels_str = ";".join([l['label'] for l in toxic_labels]) if toxic_labels else "SAFE"
-            writer.writerow([timestamp, username, text, labels_str, f"{stt_time:.2f}", f"{ai_time:.2f}", f"{total_latency:.2f}", user_count])
-    except Exception as e:
-        print(f"Eroare scriere CSV: {e}")
-
-# --- MANAGER DE CONEXIUNI ---
-class ConnectionManager:
-    def __init__(self):
-        self.active_connections: Dict[WebSocket, str] = {}
-
-    async def connect(self, websocket: WebSocket, username: str):
-        await websocket.accept()
-        self.active_connections[websocket] = username
-        await self.broadcast_user_list()
-        await self.broadcast_system(f"🔵 {username} s-a conectat.")
-
-    def disconnect(self, websocket: WebSocket):
-        username = self.active_connections.get(websocket, "Unknown")
-        if websocket in self.active_connections:
-            del self.active_connections[websocket]
-        return username
-
-    async def broadcast_user_list(self):
-        users_list = list(self.active_connections.values())
-        for connection in self.active_connections:
-            try: await connection.send_json({"type": "user_list", "users": users_list})
-            except: pass
-
-    async def broadcast_audio(self, audio_data: bytes, sender: WebSocket):
-        sender_name = self.active_connections.get(sender, "Anonim")
-        # Trimitem notificare că X vorbește (pt animație)
-        for connection in self.active_connections:
-            try: await connection.send_json({"type": "speaking_start", "user": sender_name})
-            except: pass
-            
-            # Trimitem audio la toți ceilalți (NU și la cel care vorbește)
-            if connection != sender:
-                try: await connection.send_bytes(audio_data)
-                except: pass
-
-    async def broadcast_system(self, message: str):
-        for connection in self.active_connections:
-            try: await connection.send_json({"type": "system", "message": message})
-            except: pass
-
-    async def send_json(self, websocket: WebSocket, data: dict):
-        try: await websocket.send_json(data)
-        except: pass
-
-manager = ConnectionManager()
-
-async def check_toxicity(text):
-    async with aiohttp.ClientSession() as session:
-        try:
-            payload = {"text": text, "threshold": 0.5}
-            async with session.post(TOXICITY_API_URL, json=payload, timeout=2) as resp:
-                if resp.status == 200:
-                    data = await resp.json()
-                    return data.get("toxic_labels", [])
-        except: return []
-    return []
-
-# --- RUTELE WEB (AICI ERA PROBLEMA TA) ---
-
-@app.get("/")
-async def get_app():
-    # Asta deschide WALKIE TALKIE
-    with open("index.html", "r", encoding="utf-8") as f:
-        return HTMLResponse(f.read())
-
-@app.get("/dashboard")
-async def get_dashboard():
-    # Asta deschide GRAFICELE (trebuie să ai fișierul dashboard.html)
-    if os.path.exists("dashboard.html"):
-        with open("dashboard.html", "r", encoding="utf-8") as f:
-            return HTMLResponse(f.read())
-    else:
-        return HTMLResponse("<h1>Eroare: Nu gasesc dashboard.html</h1>")
-
-@app.get("/api/stats")
-async def get_stats():
-    # API-ul care citește CSV-ul pentru grafic
-    data = []
-    if os.path.exists(CSV_FILE):
-        with open(CSV_FILE, mode='r', encoding='utf-8') as f:
-            reader = csv.DictReader(f)
-            data = list(reader)
-    return JSONResponse(data)
-
-# --- WEBSOCKET ---
-
-@app.websocket("/ws/{client_id}")
-async def websocket_endpoint(websocket: WebSocket, client_id: int, username: str = "Anonim"):
-    await manager.connect(websocket, username)
-    try:
-        while True:
-            # Primire Audio
-
-            audio_data = await websocket.receive_bytes()
-            audio_file = io.BytesIO(audio_data)
-            t0 = time.time()
-
-			# Transcriere (Whisper)
-            segments, _ = await asyncio.to_thread(model.transcribe, audio_file, beam_size=1)
-            text = " ".join([s.text for s in segments]).strip()
-
-			# 2. Timp intermediar (După Whisper)
-            t1 = time.time()
-
-			# Predicție (BERT)
-            toxic_labels = await check_toxicity(text)
-
-			# 3. Stop Cronometru
-            t2 = time.time()
-
-			# Calcule
-            stt_time = (t1 - t0) * 1000
-            ai_time  = (t2 - t1) * 1000
-            total_latency = stt_time + ai_time
-            
-            user_count = len(manager.active_connections)
-            
-            # Salvăm în CSV
-            log_interaction(username, text, toxic_labels, stt_time, ai_time, total_latency, user_count)
-            print(f"🗣️ {username}: {text} ({total_latency:.0f}ms)")
-
-            # 3. Decizie
-            if toxic_labels:
-                reasons = ", ".join([l['label'] for l in toxic_labels])
-                await manager.send_json(websocket, {"type": "status", "status": "toxic", "message": f"BLOCAT: {reasons}"})
-            else:
-                await manager.broadcast_audio(audio_data, websocket)
-
-    except WebSocketDisconnect:
-        left_user = manager.disconnect(websocket)
-        await manager.broadcast_user_list()
-        await manager.broadcast_system(f"🔴 {left_user} a ieșit.")
\ No newline at end of file
+import os
+import io
+import json
+import wave
+import asyncio
+import itertools
+import time
+import csv
+from datetime import datetime
+from typing import Dict, List, Optional
+from fastapi import FastAPI, Request, WebSocket, WebSocketDisconnect
+from fastapi.responses import HTMLResponse, JSONResponse, PlainTextResponse, StreamingResponse
+from stt_engines import EngineRegistry, SttEngine, SttOverloaded, SttResult, pcm_bytes_to_float32
+from toxicity_client import check_toxicity, close_client, get_client
+from broadcast import ConnectionManager, DEFAULT_ROOM
+from interaction_log import InteractionLog
+from live_stats import LiveStats
+from audio_decode import AudioDecoder, float32_to_pcm16
+from opus_relay import OPUS_PASSTHROUGH, OpusClip
+from vad import VadGate
+from model_registry import MODELS
+import metrics
+
+app = FastAPI()
+
+# --- CONFIGURARE ---
+STATS_PREFIX = os.getenv('STATS_PREFIX', 'stats')   # stats (Whisper) / stats_vosk - log separat per deploy
+CSV_FILE = f"{STATS_PREFIX}.csv"
+
+# Engine-uri STT (whisper / vosk / cascade), alese per cameră sau per conexiune (?engine=)
+# Whisper: replici + coadă cu prioritate (STT_WORKERS, STT_QUEUE_SIZE, STT_SLO_MS în .env)
+# Nu încarcă nimic la import: STT_PRELOAD se încarcă pe fundal la startup (/ready spune când e gata)
+engines = EngineRegistry()
+# VAD înainte de STT: liniștea nu mai ajunge la model
+vad = VadGate()
+
+# --- LOGARE (asincron, segmente columnare în logs/) ---
+# Istoricul din stats.csv se importă la prima pornire; export: python interaction_log.py export out.csv
+interaction_log = InteractionLog(STATS_PREFIX, legacy_csv=CSV_FILE)
+# Agregate în memorie pentru dashboard (percentile, per user/etichetă, pe minut)
+live_stats = LiveStats()
+STATS_PUSH_MS = int(os.getenv('STATS_PUSH_MS', '1000'))
+
+def log_interaction(username, text, toxic_labels, stt_time, ai_time, total_latency, user_count):
+    # Doar pune rândul în buffer; scrierea pe disc o face task-ul de fundal
+    record = interaction_log.log(username, text, toxic_labels, stt_time, ai_time, total_latency, user_count)
+    live_stats.record(record)
+
+# --- MANAGER DE CONEXIUNI ---
+# Coadă + writer per conexiune; clienții lenți pierd cadre vechi sau sunt deconectați (BROADCAST_POLICY)
+manager = ConnectionManager()
+
+# --- METRICI (cozi citite la fiecare scrape; cozile STT le înregistrează EngineRegistry) ---
+metrics.QUEUE_DEPTH.set_function(lambda: manager.queued(), queue="broadcast")
+metrics.QUEUE_DEPTH.set_function(lambda: interaction_log.stats()["buffered"], queue="log")
+
+@app.on_event("startup")
+async def start_interaction_log():
+    # Modelele pe fundal (STT + BERT în proces), uvicorn acceptă conexiuni imediat
+    engines.warm_up()
+    get_client().warm_up()
+    await interaction_log.start()
+    # Agregatele pornesc din istoricul de pe disc (o singură citire, la pornire)
+    seeded = await asyncio.to_thread(live_stats.seed, interaction_log.records())
+    print(f"📈 Statistici live: {seeded} rânduri din istoric")
+
+@app.on_event("shutdown")
+async def shutdown_toxicity_client():
+    # Închidem pool-ul de conexiuni către BERT
+    await close_client()
+    await manager.close()
+    # Workerii STT (Whisper) se opresc curat, cererile rămase primesc eroare
+    await engines.close()
+    # Ce a rămas în buffer ajunge pe disc
+    await interaction_log.close()
+
+# --- RUTELE WEB (AICI ERA PROBLEMA TA) ---
+
+@app.get("/")
+async def get_app():
+    # Asta deschide WALKIE TALKIE
+    if os.path.exists("index.html"):
+        with open("index.html", "r", encoding="utf-8") as f:
+            return HTMLResponse(f.read())
+    return HTMLResponse("<h1>index.html lipsă</h1>")
+
+@app.get("/dashboard")
+async def get_dashboard():
+    # Asta deschide GRAFICELE (trebuie să ai fișierul dashboard.html)
+    if os.path.exists("dashboard.html"):
+        with open("dashboard.html", "r", encoding="utf-8") as f:
+            return HTMLResponse(f.read())
+    else:
+        return HTMLResponse("<h1>Eroare: Nu gasesc dashboard.html</h1>")
+
+@app.get("/api/stats")
+async def get_stats(offset: int = 0, limit: int = 1000):
+    # Export: rândurile brute din log, pe pagini (aceleași câmpuri ca în vechiul CSV)
+    limit = max(1, min(limit, 10000))
+    rows = await asyncio.to_thread(lambda: list(itertools.islice(interaction_log.rows(), offset, offset + limit + 1)))
+    next_offset = offset + limit if len(rows) > limit else None
+    return JSONResponse({"rows": rows[:limit], "offset": offset, "next_offset": next_offset})
+
+@app.get("/api/stats/live")
+async def get_live_stats(since: int = 0):
+    # Doar ce s-a schimbat după cursor (cursor-ul nou vine în răspuns)
+    return JSONResponse(live_stats.delta(since))
+
+@app.get("/api/stats/stream")
+async def stream_live_stats(request: Request, since: int = 0):
+    # Server-Sent Events: delta la fiecare STATS_PUSH_MS, doar când s-a schimbat ceva
+    cursor = int(request.headers.get("last-event-id", since) or 0)
+
+    async def events():
+        nonlocal cursor
+        idle, first = 0.0, True
+        while not await request.is_disconnected():
+            if live_stats.seq != cursor or first:
+                first = False
+                delta = live_stats.delta(cursor)
+                cursor = delta["cursor"]
+                yield f"id: {cursor}\ndata: {json.dumps(delta)}\n\n"
+                idle = 0.0
+            elif idle >= 15:
+                yield ": ping\n\n"  # ține conexiunea deschisă prin proxy-uri
+                idle = 0.0
+            await asyncio.sleep(STATS_PUSH_MS / 1000)
+            idle += STATS_PUSH_MS / 1000
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+@app.get("/ready")
+async def get_ready():
+    # 503 cât timp modelele din STT_PRELOAD (și BERT în proces) încă se încarcă
+    return JSONResponse(MODELS.status(), status_code=200 if MODELS.ready() else 503)
+
+@app.get("/api/toxicity/stats")
+async def get_toxicity_stats():
+    # Mărimea batch-urilor și timpul de așteptare la coadă (pt reglarea ferestrei)
+    return JSONResponse(get_client().stats())
+
+@app.get("/api/stt/stats")
+async def get_stt_stats():
+    # Per engine: adâncimea cozii, timpul de așteptare, cât a reverificat cascade-ul
+    return JSONResponse(engines.stats())
+
+@app.get("/api/vad/stats")
+async def get_vad_stats():
+    # Cât audio (și cât CPU estimat) a scutit VAD-ul
+    return JSONResponse(vad.stats())
+
+@app.get("/api/broadcast/stats")
+async def get_broadcast_stats():
+    # Pe conexiune: mesaje trimise, aruncate și cât stau la coadă
+    return JSONResponse(manager.stats())
+
+@app.get("/api/log/stats")
+async def get_log_stats():
+    # Rânduri în buffer, aruncate și durata ultimei scrieri
+    return JSONResponse(interaction_log.stats())
+
+@app.get("/metrics")
+async def get_metrics():
+    # Format Prometheus: span-uri pe etape, cozi, fraze în lucru
+    return PlainTextResponse(metrics.render())
+
+@app.get("/metrics/json")
+async def get_metrics_json():
+    # Aceleași histograme, ca percentile (ms)
+    return JSONResponse(metrics.REGISTRY.percentiles())
+
+
+# --- PIPELINE COMUN (același pentru orice engine STT) ---
+
+def pcm_to_wav(pcm: bytes, sample_rate: int = 16000) -> bytes:
+    # Ascultătorii (index.html) redau blob-uri, deci împachetăm PCM-ul în WAV
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(sample_rate)
+        wav.writeframes(pcm)
+    return buffer.getvalue()
+
+async def check_and_relay(websocket: WebSocket, username: str, stt: SttResult, stt_time: float,
+                          audio, trace, blocked_labels=None, opus: Optional[OpusClip] = None):
+    """Verdict (BERT, sau cel deja calculat de cascade) -> log -> status la vorbitor / audio la cameră."""
+    t1 = time.time()
+    toxic_labels = blocked_labels if blocked_labels is not None else stt.toxic_labels
+    if toxic_labels is None:
+        with trace.span("toxicity"):
+            toxic_labels = await check_toxicity(stt.text)
+    ai_time = (time.time() - t1) * 1000
+    total_latency = stt_time + ai_time
+
+    user_count = len(manager.room_users(manager.room_of.get(websocket, DEFAULT_ROOM)))
+    log_interaction(username, stt.text, toxic_labels, stt_time, ai_time, total_latency, user_count)
+    print(f"🗣️ {username}: {stt.text} ({total_latency:.0f}ms, coadă {stt.queue_depth} / {stt.queue_wait_ms:.0f}ms, {stt.model})")
+
+    with trace.span("broadcast"):
+        if toxic_labels:
+            # Blocat deja pe un rezultat parțial -> vorbitorul a primit statusul
+            if blocked_labels is None:
+                reasons = ", ".join([l['label'] for l in toxic_labels])
+                await manager.send_json(websocket, {"type": "status", "status": "toxic", "message": f"BLOCAT: {reasons}"})
+        elif audio or opus:
+            # Cadrele Opus pleacă exact cum au venit (fără re-encodare); blob-ul e pt clienții fără WebCodecs
+            await manager.broadcast_audio(audio, websocket, opus.pack() if opus else None)
+    trace.finish("toxic" if toxic_labels else "safe")
+
+async def send_busy(websocket: WebSocket):
+    await manager.send_json(websocket, {"type": "status", "status": "busy", "message": "Server ocupat, mai încearcă."})
+
+# --- WEBSOCKET (fraze întregi: blob WebM/Opus din browser sau WAV) ---
+
+# Camere: /ws/{room}/{client_id} (înregistrată la final); vechiul /ws/{client_id} intră în DEFAULT_ROOM
+@app.websocket("/ws/{client_id}")
+async def websocket_endpoint(websocket: WebSocket, client_id: int, username: str = "Anonim", room: str = DEFAULT_ROOM,
+                             engine: str = None, relay: str = "blob"):
+    await websocket.accept()
+    # ?relay=opus -> clientul redă singur cadrele Opus (WebCodecs + jitter buffer)
+    await manager.connect(websocket, username, room, opus=relay == "opus")
+    # Decoder persistent pe conexiune: WebM/Opus -> float32 16kHz direct în STT
+    decoder = AudioDecoder()
+    trace = None
+    try:
+        # În try: dacă nici engine-ul implicit nu se poate încărca, pică doar conexiunea asta
+        stt_engine = await engines.resolve(room, engine)
+        entry = f"ws_{stt_engine.name}"
+        while True:
+            # Primire Audio
+            audio_data = await websocket.receive_bytes()
+            t0 = time.time()
+            # Span-uri pe etape pentru fraza asta (ajung în /metrics)
+            trace = metrics.trace(entry)
+            metrics.RECEIVED_BYTES.inc(len(audio_data), entry=entry)
+
+            try:
+                with trace.span("decode"):
+                    # WebM/Opus: demux o dată; pachetele se decodează doar pt STT și se păstrează pt relay
+                    clip = decoder.demux_opus(audio_data) if OPUS_PASSTHROUGH else None
+                    samples = decoder.decode_clip(clip) if clip else decoder.decode(audio_data)
+            except Exception as e:
+                print(f"⚠️ Eroare conversie audio: {e}")
+                trace.finish("decode_error")
+                continue
+
+            with trace.span("vad"):
+                samples = vad.process(samples)
+            if samples is None:
+                trace.finish("silence")
+                continue # Liniște - nu chemăm STT-ul
+
+            # Transcriere (cascade: Vosk + reverificare Whisper doar pt frazele suspecte)
+            try:
+                with trace.span("stt"):
+                    stt = await stt_engine.transcribe(samples)
+            except SttOverloaded:
+                trace.finish("busy")
+                await send_busy(websocket)
+                continue
+            trace.add("stt_queue", stt.queue_wait_ms / 1000)
+            vad.record_stt(len(samples) / 16000, stt.stt_ms / 1000)
+            if not stt.text:
+                trace.finish("no_text")
+                continue # Nimic inteligibil - nu verificăm, nu redăm
+
+            await check_and_relay(websocket, username, stt, (time.time() - t0) * 1000, audio_data, trace, opus=clip)
+
+    except WebSocketDisconnect:
+        if trace: trace.finish("disconnected")
+        # None = broadcast-ul l-a dat deja afară (client lent) și a anunțat singur ieșirea
+        if manager.disconnect(websocket) is not None:
+            await manager.broadcast_user_list(room)
+            await manager.broadcast_system(f"🔴 {username} a ieșit.", room)
+    except Exception as e:
+        # Ex: conexiune închisă de broadcast pentru că era prea lentă
+        print(f"Eroare WS: {e}")
+        if trace: trace.finish("error")
+        if manager.disconnect(websocket) is not None:
+            await manager.broadcast_user_list(room)
+
+# --- STREAMING (chunk-uri mici PCM / Opus, verdict pe rezultate parțiale unde engine-ul le are) ---
+
+class StreamingUtterance:
+    """Starea frazei curente: stream-ul engine-ului rămâne viu, partial-urile sunt verificate din mers."""
+
+    def __init__(self, websocket: WebSocket, username: str, engine: SttEngine, keep_opus: bool = False):
+        self.websocket = websocket
+        self.keep_opus = keep_opus  # codec=opus: păstrăm pachetele primite, relay-ul le trimite neatinse
+        self.username = username
+        self.engine = engine
+        self.entry = f"ws_{engine.name}_stream"
+        self.stream = engine.open_stream()
+        self.reset()
+
+    def reset(self):
+        self.pcm = bytearray()
+        self.opus = OpusClip() if self.keep_opus else None
+        self.started_at = None
+        self.blocked_labels = None
+        self.blocked_at = None
+        self.checked_partial = ""
+        self.pending_partial = ""
+        self.partial_task = None
+        self.trace = None
+        self.decode_time = 0.0
+
+    async def feed(self, pcm: bytes, packet: Optional[bytes] = None):
+        if self.started_at is None:
+            self.started_at = time.time()
+            self.trace = metrics.trace(self.entry)
+        if self.blocked_labels is None:
+            self.pcm += pcm
+            if packet is not None and self.opus is not None:
+                self.opus.append(packet)
+        stt = await self.stream.feed(pcm)
+        if stt is not None:
+            return stt
+        partial = self.stream.partial
+        if partial and self.engine.partial_verdicts and self.blocked_labels is None:
+            self.pending_partial = partial
+            if self.partial_task is None or self.partial_task.done():
+                self.partial_task = asyncio.create_task(self._check_partials())
+        return None
+
+    async def flush(self) -> SttResult:
+        # Clientul a dat drumul la buton -> forțăm rezultatul final
+        return await self.stream.flush(bytes(self.pcm))
+
+    async def _check_partials(self):
+        # Un singur check în zbor per conexiune; verificăm mereu cel mai nou partial
+        while self.pending_partial and self.pending_partial != self.checked_partial:
+            text = self.pending_partial
+            self.checked_partial = text
+            started = time.perf_counter()
+            toxic_labels = await check_toxicity(text)
+            if self.trace is not None:
+                self.trace.add("toxicity_partial", time.perf_counter() - started)
+            if toxic_labels and self.blocked_labels is None:
+                self.blocked_labels = toxic_labels
+                self.blocked_at = time.time()
+                self.pcm = bytearray()  # nu mai păstrăm audio pentru relay
+                self.opus = None
+                reasons = ", ".join([l['label'] for l in toxic_labels])
+                await manager.send_json(self.websocket, {"type": "status", "status": "toxic", "message": f"BLOCAT: {reasons}"})
+                print(f"🛑 {self.username} ({self.engine.name} stream): blocat pe parțial '{text}'")
+                return
+
+    async def finish(self, stt: SttResult):
+        if self.partial_task is not None and not self.partial_task.done():
+            await self.partial_task
+        trace = self.trace
+        if trace is not None:
+            # receive = cât a durat upload-ul frazei (primul chunk -> endpoint / "end")
+            trace.add("receive", time.time() - self.started_at)
+            trace.add("decode", self.decode_time)
+            trace.add("stt", stt.stt_ms / 1000)
+        if stt.text and trace is not None:
+            if self.blocked_labels is None and self.pcm and self.engine.rechecks:
+                with trace.span("recheck"):
+                    stt = await self.engine.refine(stt, pcm_bytes_to_float32(bytes(self.pcm)))
+            if self.blocked_at is not None:
+                print(f"🛑 {self.username}: blocat după {(self.blocked_at - self.started_at) * 1000:.0f}ms")
+            audio = pcm_to_wav(bytes(self.pcm)) if self.pcm else None
+            await check_and_relay(self.websocket, self.username, stt, stt.stt_ms, audio, trace, self.blocked_labels,
+                                  opus=self.opus)
+        elif trace is not None:
+            trace.finish("no_text")
+        self.reset()
+
+
+@app.websocket("/ws/stream/{room}/{client_id}")
+@app.websocket("/ws/stream/{client_id}")
+async def websocket_stream_endpoint(websocket: WebSocket, client_id: int, username: str = "Anonim", codec: str = "pcm",
+                                    room: str = DEFAULT_ROOM, engine: str = None, relay: str = "blob"):
+    """
+    Mod streaming: clientul trimite chunk-uri mici (PCM s16le 16kHz mono sau pachete Opus)
+    și un mesaj text {"type": "end"} când se termină fraza.
+    Cu codec=opus, pachetele aprobate ajung la ascultătorii cu ?relay=opus exact cum au fost trimise.
+    """
+    await websocket.accept()
+    await manager.connect(websocket, username, room, opus=relay == "opus")
+    decoder = AudioDecoder() if codec == "opus" else None
+    utterance = None
+
+    try:
+        utterance = StreamingUtterance(websocket, username, await engines.resolve(room, engine),
+                                       keep_opus=decoder is not None and OPUS_PASSTHROUGH)
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                raise WebSocketDisconnect(message.get("code", 1000))
+
+            try:
+                if message.get("bytes"):
+                    chunk = message["bytes"]
+                    metrics.RECEIVED_BYTES.inc(len(chunk), entry=utterance.entry)
+                    try:
+                        started = time.perf_counter()
+                        pcm = float32_to_pcm16(decoder.decode_opus_packet(chunk)).tobytes() if decoder else chunk
+                        utterance.decode_time += time.perf_counter() - started
+                    except Exception as e:
+                        print(f"⚠️ Eroare decodare chunk: {e}")
+                        continue
+                    # Endpoint detectat de engine (Vosk: rule1-rule4 din model.conf)
+                    stt = await utterance.feed(pcm, chunk if decoder else None)
+                    if stt is not None:
+                        await utterance.finish(stt)
+                elif message.get("text"):
+                    try:
+                        data = json.loads(message["text"])
+                    except ValueError:
+                        continue
+                    if data.get("type") == "end":
+                        await utterance.finish(await utterance.flush())
+            except SttOverloaded:
+                if utterance.trace: utterance.trace.finish("busy")
+                utterance.reset()
+                await send_busy(websocket)
+
+    except WebSocketDisconnect:
+        if utterance and utterance.trace: utterance.trace.finish("disconnected")
+        if manager.disconnect(websocket) is not None:
+            await manager.broadcast_user_list(room)
+            await manager.broadcast_system(f"🔴 {username} a ieșit.", room)
+    except Exception as e:
+        print(f"Eroare WS Stream: {e}")
+        if utterance and utterance.trace: utterance.trace.finish("error")
+        if manager.disconnect(websocket) is not None:
+            await manager.broadcast_user_list(room)
+
+# Camere: /ws/{room}/{client_id}. Înregistrată ultima, ca /ws/stream/... să nu fie luat drept cameră
+app.add_api_websocket_route("/ws/{room}/{client_id}", websocket_endpoint)
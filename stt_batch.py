@@ -0,0 +1,61 @@
+import time
+import bisect
+import numpy as np
+from dataclasses import dataclass
+from typing import List, Sequence, Tuple
+
+from faster_whisper import BatchedInferencePipeline
+
+SAMPLE_RATE = 16000
+# Whisper vede maxim 30s per fereastră; frazele mai lungi se taie în mai multe clipuri
+MAX_CLIP_SECONDS = 30.0
+
+
+@dataclass
+class BatchStats:
+    size: int
+    audio_seconds: float
+    wall_seconds: float
+
+    @property
+    def rtf(self) -> float:
+        """Real-time factor: secunde de procesare per secundă de audio (mai mic = mai bine)."""
+        return self.wall_seconds / self.audio_seconds if self.audio_seconds else 0.0
+
+
+def _layout(utterances: Sequence[np.ndarray]) -> Tuple[np.ndarray, List[dict], List[int]]:
+    """Lipim frazele într-un singur buffer; fiecare frază (sau bucată de 30s) devine un clip separat."""
+    clips, owners = [], []
+    offset = 0
+    max_clip = int(MAX_CLIP_SECONDS * SAMPLE_RATE)
+    for index, samples in enumerate(utterances):
+        for start in range(0, len(samples), max_clip):
+            end = min(start + max_clip, len(samples))
+            clips.append({"start": (offset + start) / SAMPLE_RATE, "end": (offset + end) / SAMPLE_RATE})
+            owners.append(index)
+        offset += len(samples)
+    audio = np.concatenate(utterances).astype(np.float32, copy=False) if utterances else np.zeros(0, np.float32)
+    return audio, clips, owners
+
+
+def transcribe_batch(pipeline: BatchedInferencePipeline, utterances: Sequence[np.ndarray],
+                     beam_size: int = 1, batch_size: int = 8) -> Tuple[List[str], BatchStats]:
+    """
+    Transcrie frazele mai multor vorbitori într-o singură trecere prin pipeline-ul batched
+    din faster-whisper. Întoarce textele în aceeași ordine ca intrarea.
+    """
+    started = time.perf_counter()
+    texts: List[List[str]] = [[] for _ in utterances]
+    non_empty = [i for i, u in enumerate(utterances) if len(u)]
+    if non_empty:
+        audio, clips, owners = _layout([utterances[i] for i in non_empty])
+        clip_starts = [c["start"] for c in clips]
+        segments, _ = pipeline.transcribe(audio, beam_size=beam_size, batch_size=batch_size,
+                                          clip_timestamps=clips, vad_filter=False)
+        for segment in segments:
+            # Segmentele au timpul global din buffer -> găsim clipul (și vorbitorul) de care aparțin
+            clip = max(0, bisect.bisect_right(clip_starts, segment.start + 1e-3) - 1)
+            texts[non_empty[owners[clip]]].append(segment.text)
+    audio_seconds = sum(len(u) for u in utterances) / SAMPLE_RATE
+    stats = BatchStats(len(utterances), audio_seconds, time.perf_counter() - started)
+    return [" ".join(t).strip() for t in texts], stats
@@ -0,0 +1,480 @@
+import os
+import json
+import time
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+import numpy as np
+
+import metrics
+from model_registry import MODELS
+from audio_decode import pcm16_to_float32, float32_to_pcm16
+from toxicity_client import check_toxicity, DEFAULT_THRESHOLD
+
+# --- CONFIGURARE ---
+STT_ENGINE = os.getenv('STT_ENGINE', 'whisper')                  # whisper | vosk | cascade
+STT_PRELOAD = os.getenv('STT_PRELOAD', STT_ENGINE)               # încărcate pe fundal la pornire, restul la prima cerere
+ROOM_ENGINES = os.getenv('ROOM_ENGINES', '')                     # ex. "lobby=cascade,rapid=vosk"
+WHISPER_MODEL = os.getenv('WHISPER_MODEL', 'base.en')            # tiny.en / base.en / small.en ...
+VOSK_MODEL_PATH = os.getenv('VOSK_MODEL_PATH', 'model')
+VOSK_WORKERS = int(os.getenv('VOSK_WORKERS', '2'))
+VOSK_QUEUE_SIZE = int(os.getenv('VOSK_QUEUE_SIZE', '32'))
+# Cascade: Whisper reverifică doar ce Vosk a transcris "suspect"
+CASCADE_RECHECK_SCORE = float(os.getenv('CASCADE_RECHECK_SCORE', '0.2'))    # scor toxic peste care reverificăm
+CASCADE_MIN_CONFIDENCE = float(os.getenv('CASCADE_MIN_CONFIDENCE', '0.6'))  # încredere Vosk sub care reverificăm
+SAMPLE_RATE = 16000
+
+
+class SttOverloaded(Exception):
+    """Coada e plină - cererea e respinsă (backpressure)."""
+
+
+@dataclass
+class SttResult:
+    text: str
+    model: str
+    queue_wait_ms: float
+    queue_depth: int
+    stt_ms: float
+    degraded: bool
+    batch_size: int = 1
+    rtf: float = 0.0
+    confidence: Optional[float] = None        # media pe cuvinte (Vosk); Whisper nu o dă
+    toxic_labels: Optional[List[dict]] = None  # verdict deja calculat de cascade (None = nu s-a verificat)
+
+
+def pcm_bytes_to_float32(pcm: bytes) -> np.ndarray:
+    return pcm16_to_float32(np.frombuffer(pcm, dtype="<i2"), 1, SAMPLE_RATE)
+
+
+# ---------------- Interfața ----------------
+
+class SttStream:
+    """
+    Fraza curentă a unei conexiuni de streaming. feed() primește PCM s16le 16kHz și întoarce
+    rezultatul când engine-ul detectează singur sfârșitul frazei; flush() la "end" de la client
+    (primește tot PCM-ul frazei, pt engine-urile care n-au stare proprie).
+    """
+
+    def __init__(self):
+        self.partial = ""
+        self.stt_ms = 0.0
+
+    async def feed(self, pcm: bytes) -> Optional[SttResult]:
+        return None
+
+    async def flush(self, pcm: bytes) -> SttResult:
+        raise NotImplementedError
+
+
+class SttEngine:
+    """
+    Pasul STT al pipeline-ului, comun pentru server și bot: transcribe() pe o frază întreagă
+    (float32 mono 16kHz), open_stream() pentru chunk-uri, refine() după transcriere (cascade).
+    """
+
+    name = "base"
+    partial_verdicts = False  # verdict pe rezultatele parțiale din streaming (blocare devreme)
+    rechecks = False          # refine() face ceva (cascade)
+
+    async def transcribe(self, samples: np.ndarray, *, priority: int = 1, tenant=None) -> SttResult:
+        raise NotImplementedError
+
+    def open_stream(self) -> SttStream:
+        return BufferedStream(self)
+
+    async def refine(self, result: SttResult, samples: np.ndarray) -> SttResult:
+        return result
+
+    def warmup(self):
+        """O transcriere de probă (sincronă, pe thread-ul care încarcă modelul)."""
+
+    async def close(self):
+        """Oprește task-urile de fundal ale engine-ului (la shutdown)."""
+
+    @property
+    def depth(self) -> int:
+        return 0
+
+    @property
+    def in_flight(self) -> int:
+        return 0
+
+    def tenant_depth(self, tenant) -> int:
+        return 0
+
+    def stats(self) -> dict:
+        return {"engine": self.name, "queue_depth": self.depth, "in_flight": self.in_flight,
+                "rejected": 0, "degraded": 0}
+
+
+class BufferedStream(SttStream):
+    """Engine fără streaming nativ (Whisper): fraza se transcrie întreagă la "end"."""
+
+    def __init__(self, engine: SttEngine):
+        super().__init__()
+        self.engine = engine
+
+    async def flush(self, pcm: bytes) -> SttResult:
+        if not pcm:
+            return SttResult("", self.engine.name, 0.0, 0, 0.0, False)
+        return await self.engine.transcribe(pcm_bytes_to_float32(pcm))
+
+
+# ---------------- Whisper ----------------
+
+class WhisperEngine(SttEngine):
+    name = "whisper"
+
+    def __init__(self, model_name: str = WHISPER_MODEL, beam_size: int = 1, **pool_options):
+        # Import aici: un deploy doar cu Vosk nu are nevoie de faster-whisper
+        from stt_pool import WhisperPool
+        self.pool = WhisperPool(model_name, **pool_options)
+        self.beam_size = beam_size
+        print(f"✅ Whisper {model_name} gata!")
+
+    async def transcribe(self, samples, *, priority: int = 1, tenant=None) -> SttResult:
+        return await self.pool.transcribe(samples, beam_size=self.beam_size, priority=priority, tenant=tenant)
+
+    def warmup(self):
+        # Prima rulare CTranslate2 alocă buffere și încarcă kernel-urile - o plătim acum, nu la prima frază
+        self.pool._run(self.pool.model, np.zeros(SAMPLE_RATE, dtype=np.float32), 1)
+
+    async def close(self):
+        await self.pool.close()
+
+    @property
+    def depth(self) -> int:
+        return self.pool.depth
+
+    @property
+    def in_flight(self) -> int:
+        return self.pool.in_flight
+
+    def tenant_depth(self, tenant) -> int:
+        return self.pool.tenant_depth(tenant)
+
+    def stats(self) -> dict:
+        return {"engine": self.name, **self.pool.stats()}
+
+
+# ---------------- Vosk ----------------
+
+def load_endpoint_rules(path: str) -> Dict[str, float]:
+    """Citește --endpoint.ruleN.* din model.conf (Vosk le aplică singur în AcceptWaveform)."""
+    rules = {}
+    if os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if line.startswith("--endpoint.rule") and "=" in line:
+                    key, value = line[2:].split("=", 1)
+                    rules[key] = float(value)
+    return rules
+
+
+def _vosk_words(result: dict, parts: List[str], confidences: List[float]):
+    text = result.get("text", "").strip()
+    if text:
+        parts.append(text)
+    confidences.extend(word.get("conf", 1.0) for word in result.get("result", []))
+
+
+class VoskStream(SttStream):
+    """Recognizer-ul rămâne viu pe toată conexiunea; endpointing-ul îl face Vosk (model.conf)."""
+
+    def __init__(self, engine: "VoskEngine"):
+        super().__init__()
+        self.engine = engine
+        self.rec = engine.recognizer()
+
+    async def feed(self, pcm: bytes) -> Optional[SttResult]:
+        # AcceptWaveform pe executorul Vosk: event loop-ul e împărțit cu Whisper, broadcast-ul și SSE.
+        # Chunk-urile unei conexiuni vin pe rând (await), deci recognizer-ul nu e folosit din două thread-uri odată
+        return await asyncio.get_running_loop().run_in_executor(self.engine._executor, self._feed, pcm)
+
+    def _feed(self, pcm: bytes) -> Optional[SttResult]:
+        t0 = time.perf_counter()
+        is_final = self.rec.AcceptWaveform(pcm)
+        self.stt_ms += (time.perf_counter() - t0) * 1000
+        if is_final:
+            return self._final(self.rec.Result())
+        self.partial = json.loads(self.rec.PartialResult()).get("partial", "").strip()
+        return None
+
+    def _final(self, raw: str) -> SttResult:
+        parts, confidences = [], []
+        _vosk_words(json.loads(raw), parts, confidences)
+        confidence = sum(confidences) / len(confidences) if confidences else None
+        # stt_ms = timpul de recunoaștere adunat pe toate chunk-urile frazei
+        result = SttResult(" ".join(parts), "vosk", 0.0, 0, self.stt_ms, False, confidence=confidence)
+        self.partial = ""
+        self.stt_ms = 0.0
+        return result
+
+    async def flush(self, pcm: bytes) -> SttResult:
+        # Clientul a dat drumul la buton -> forțăm rezultatul final
+        return await asyncio.get_running_loop().run_in_executor(self.engine._executor, self._flush)
+
+    def _flush(self) -> SttResult:
+        result = self._final(self.rec.FinalResult())
+        self.rec.Reset()
+        return result
+
+
+class VoskEngine(SttEngine):
+    name = "vosk"
+    partial_verdicts = True
+
+    def __init__(self, model_path: str = VOSK_MODEL_PATH, workers: int = VOSK_WORKERS,
+                 queue_size: int = VOSK_QUEUE_SIZE):
+        from vosk import Model, KaldiRecognizer
+        if not os.path.exists(model_path):
+            # Nu SystemExit: engine-ul se încarcă la cerere (?engine=vosk, !engine vosk), în procesul serverului / botului
+            raise FileNotFoundError(f"Nu găsesc folderul '{model_path}'. Descarcă un model Vosk și dezarhivează-l aici!")
+        print(f"🚀 Încărcare VOSK Model din '{model_path}'...")
+        self.model = Model(model_path)
+        self._recognizer_cls = KaldiRecognizer
+        self.endpoint_rules = load_endpoint_rules(os.path.join(model_path, "conf", "model.conf"))
+        print(f"🎚️ Endpointing din model.conf: {self.endpoint_rules}")
+        self.workers = workers
+        self.queue_size = queue_size
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="vosk")
+        self._in_flight = 0
+        self.rejected = 0
+        print("✅ Vosk Gata!")
+
+    def warmup(self):
+        self._run(bytes(SAMPLE_RATE * 2), time.perf_counter())
+
+    def recognizer(self):
+        rec = self._recognizer_cls(self.model, SAMPLE_RATE)
+        rec.SetWords(True)  # încrederea pe cuvinte (pt cascade)
+        return rec
+
+    def _run(self, pcm: bytes, enqueued_at: float):
+        started = time.perf_counter()
+        rec = self.recognizer()
+        parts, confidences = [], []
+        # Bucăți de 0.5s: dacă Vosk găsește un endpoint la mijloc, nu pierdem prima parte
+        step = SAMPLE_RATE  # 0.5s de s16
+        for i in range(0, len(pcm), step):
+            if rec.AcceptWaveform(pcm[i:i + step]):
+                _vosk_words(json.loads(rec.Result()), parts, confidences)
+        _vosk_words(json.loads(rec.FinalResult()), parts, confidences)
+        confidence = sum(confidences) / len(confidences) if confidences else None
+        return " ".join(parts), confidence, started, time.perf_counter()
+
+    async def transcribe(self, samples, *, priority: int = 1, tenant=None) -> SttResult:
+        if self._in_flight >= self.workers + self.queue_size:
+            self.rejected += 1
+            raise SttOverloaded(f"coada Vosk e plină ({self._in_flight})")
+        depth = max(0, self._in_flight - self.workers)
+        pcm = float32_to_pcm16(samples).tobytes()
+        enqueued_at = time.perf_counter()
+        self._in_flight += 1
+        try:
+            text, confidence, started, done = await asyncio.get_running_loop().run_in_executor(
+                self._executor, self._run, pcm, enqueued_at)
+        finally:
+            self._in_flight -= 1
+        stt_ms = (done - started) * 1000
+        audio_s = len(samples) / SAMPLE_RATE
+        return SttResult(text, "vosk", (started - enqueued_at) * 1000, depth, stt_ms, False,
+                         rtf=stt_ms / 1000 / audio_s if audio_s else 0.0, confidence=confidence)
+
+    def open_stream(self) -> SttStream:
+        return VoskStream(self)
+
+    @property
+    def depth(self) -> int:
+        return max(0, self._in_flight - self.workers)
+
+    @property
+    def in_flight(self) -> int:
+        return min(self._in_flight, self.workers)
+
+    def stats(self) -> dict:
+        return {"engine": self.name, "workers": self.workers, "queue_depth": self.depth,
+                "in_flight": self.in_flight, "rejected": self.rejected, "degraded": 0,
+                "endpoint_rules": self.endpoint_rules}
+
+
+# ---------------- Cascade (Vosk rapid, Whisper doar unde contează) ----------------
+
+class CascadeEngine(SttEngine):
+    """
+    Vosk transcrie tot; Whisper reia doar frazele suspecte: scor toxic >= CASCADE_RECHECK_SCORE
+    (toxice sau la limită) sau încredere Vosk sub CASCADE_MIN_CONFIDENCE. Pentru restul,
+    verdictul calculat aici merge mai departe (fără al doilea apel la BERT).
+    """
+
+    name = "cascade"
+    rechecks = True
+
+    def __init__(self, fast: SttEngine, accurate: SttEngine, recheck_score: float = CASCADE_RECHECK_SCORE,
+                 min_confidence: float = CASCADE_MIN_CONFIDENCE):
+        self.fast = fast
+        self.accurate = accurate
+        self.recheck_score = recheck_score
+        self.min_confidence = min_confidence
+        self.counters = {"fast_only": 0, "rechecked": 0, "low_confidence": 0, "text_changed": 0}
+
+    async def transcribe(self, samples, *, priority: int = 1, tenant=None) -> SttResult:
+        result = await self.fast.transcribe(samples, priority=priority, tenant=tenant)
+        return await self.refine(result, samples, priority=priority, tenant=tenant)
+
+    async def refine(self, result: SttResult, samples, *, priority: int = 1, tenant=None) -> SttResult:
+        if not result.text:
+            return result
+        labels = await check_toxicity(result.text, threshold=self.recheck_score)
+        low_confidence = result.confidence is not None and result.confidence < self.min_confidence
+        if not labels and not low_confidence:
+            self.counters["fast_only"] += 1
+            result.toxic_labels = []
+            return result
+
+        # Suspect -> Whisper pe același audio (prioritate mai mare: userul așteaptă deja)
+        self.counters["rechecked"] += 1
+        self.counters["low_confidence"] += low_confidence
+        try:
+            accurate = await self.accurate.transcribe(samples, priority=max(0, priority - 1), tenant=tenant)
+        except SttOverloaded:
+            # Whisper ocupat: rămânem la verdictul pe textul Vosk, cu pragul normal
+            result.toxic_labels = [l for l in labels if l.get("score", 1.0) >= DEFAULT_THRESHOLD]
+            return result
+        if accurate.text.casefold() != result.text.casefold():
+            self.counters["text_changed"] += 1
+        accurate.model = f"{result.model}→{accurate.model}"
+        accurate.stt_ms += result.stt_ms
+        accurate.queue_wait_ms += result.queue_wait_ms
+        return accurate
+
+    def open_stream(self) -> SttStream:
+        return self.fast.open_stream()
+
+    @property
+    def depth(self) -> int:
+        return self.fast.depth + self.accurate.depth
+
+    @property
+    def in_flight(self) -> int:
+        return self.fast.in_flight + self.accurate.in_flight
+
+    def tenant_depth(self, tenant) -> int:
+        return self.fast.tenant_depth(tenant) + self.accurate.tenant_depth(tenant)
+
+    def stats(self) -> dict:
+        fast, accurate = self.fast.stats(), self.accurate.stats()
+        return {"engine": self.name, "queue_depth": self.depth, "in_flight": self.in_flight,
+                "rejected": fast["rejected"] + accurate["rejected"],
+                "degraded": fast["degraded"] + accurate["degraded"],
+                **self.counters, "recheck_score": self.recheck_score, "min_confidence": self.min_confidence}
+
+
+# ---------------- Registru: ce engine pentru ce cameră / cerere ----------------
+
+def _parse_room_engines(spec: str) -> Dict[str, str]:
+    pairs = (item.split("=", 1) for item in spec.split(",") if "=" in item)
+    return {room.strip(): name.strip().lower() for room, name in pairs}
+
+
+class EngineRegistry:
+    """
+    Engine-urile se creează o singură dată (modelele sunt mari) și se împart între camere.
+    Alegerea: ?engine= din cerere > ROOM_ENGINES > STT_ENGINE.
+    Constructorul nu încarcă nimic: warm_up() pornește preload-ul pe fundal (vezi model_registry.py).
+    """
+
+    NAMES = ("whisper", "vosk", "cascade")
+
+    def __init__(self, default: str = STT_ENGINE, preload: str = STT_PRELOAD, room_engines: str = ROOM_ENGINES,
+                 whisper_options: Optional[dict] = None):
+        if default not in self.NAMES:
+            raise ValueError(f"STT_ENGINE necunoscut: {default} (opțiuni: {', '.join(self.NAMES)})")
+        self.default = default
+        self.room_engines = _parse_room_engines(room_engines)
+        self.whisper_options = whisper_options or {}
+        self.preload = [default, *(n for n in (p.strip().lower() for p in preload.split(","))
+                                   if n and n != default)]
+        self.engines: Dict[str, SttEngine] = {}
+        for name in self.NAMES:
+            MODELS.register(f"stt.{name}", lambda name=name: self._create(name),
+                            warmup=lambda engine: engine.warmup(), files=lambda name=name: self._files(name))
+
+    def _files(self, name: str) -> List[str]:
+        # Ce citește loader-ul de pe disc, pentru prefetch în page cache
+        files = []
+        if name in ("vosk", "cascade"):
+            files.append(VOSK_MODEL_PATH)
+        if name in ("whisper", "cascade"):
+            model = self.whisper_options.get("model_name", WHISPER_MODEL)
+            if os.path.isdir(model):
+                files.append(model)
+            else:
+                try:
+                    from faster_whisper.utils import download_model
+                    files.append(download_model(model, local_files_only=True))
+                except Exception:
+                    pass  # nedescărcat încă - WhisperModel îl descarcă la încărcare
+        return files
+
+    def _create(self, name: str) -> SttEngine:
+        if name == "whisper":
+            engine = WhisperEngine(**self.whisper_options)
+        elif name == "vosk":
+            engine = VoskEngine()
+        elif name == "cascade":
+            engine = CascadeEngine(MODELS.load("stt.vosk"), MODELS.load("stt.whisper"))
+        else:
+            raise KeyError(name)
+        self.engines[name] = engine
+        if name != "cascade":  # cascade n-are coadă proprie
+            metrics.QUEUE_DEPTH.set_function(lambda: engine.depth, queue="stt", engine=name)
+            metrics.IN_FLIGHT.set_function(lambda: engine.in_flight, entry=f"stt_{name}")
+        return engine
+
+    def is_loaded(self, name: str) -> bool:
+        return MODELS.is_loaded(f"stt.{name}")
+
+    def warm_up(self):
+        """Preload pe fundal; importul modulului și pornirea serverului / botului nu mai așteaptă."""
+        print(f"⏳ STT pe fundal: {', '.join(self.preload)}")
+        MODELS.warm_up(f"stt.{name}" for name in self.preload)
+
+    def choose(self, room: Optional[str] = None, requested: Optional[str] = None) -> str:
+        for name in (requested, self.room_engines.get(room)):
+            if name:
+                name = name.lower()
+                if name in self.NAMES:
+                    return name
+                print(f"⚠️ Engine STT necunoscut '{name}', folosesc {self.default}")
+        return self.default
+
+    async def get(self, name: str) -> SttEngine:
+        if MODELS.is_loaded(f"stt.{name}"):
+            return self.engines[name]
+        # Încă se încarcă (warm-up) sau n-a fost cerut la pornire: așteptăm pe thread, nu în event loop
+        return await MODELS.get(f"stt.{name}")
+
+    async def resolve(self, room: Optional[str] = None, requested: Optional[str] = None) -> SttEngine:
+        name = self.choose(room, requested)
+        try:
+            return await self.get(name)
+        except Exception as e:
+            if name == self.default:
+                raise
+            # Ex. ?engine=vosk fără model Vosk pe disc: clientul merge mai departe pe engine-ul implicit
+            print(f"⚠️ Engine STT '{name}' indisponibil ({e}), folosesc {self.default}")
+            return await self.get(self.default)
+
+    async def close(self):
+        # Cascade n-are task-uri proprii, folosește engine-urile whisper / vosk de mai sus
+        for engine in list(self.engines.values()):
+            await engine.close()
+
+    def stats(self) -> dict:
+        return {"default": self.default, "rooms": self.room_engines,
+                "engines": {name: engine.stats() for name, engine in self.engines.items()}}
@@ -0,0 +1,239 @@
+import os
+import time
+import asyncio
+import itertools
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import List, Optional
+
+from faster_whisper import WhisperModel, BatchedInferencePipeline
+from stt_batch import transcribe_batch
+from stt_engines import SttOverloaded, SttResult
+
+# --- CONFIGURARE ---
+STT_WORKERS = int(os.getenv('STT_WORKERS', '2'))
+STT_CPU_THREADS = int(os.getenv('STT_CPU_THREADS', '4'))
+STT_QUEUE_SIZE = int(os.getenv('STT_QUEUE_SIZE', '32'))
+STT_SLO_MS = float(os.getenv('STT_SLO_MS', '1500'))
+STT_FALLBACK_MODEL = os.getenv('STT_FALLBACK_MODEL', 'tiny.en')
+# Batching între useri: câte fraze intră într-o trecere (1 = dezactivat) și cât așteptăm după ele
+STT_BATCH_SIZE = int(os.getenv('STT_BATCH_SIZE', '1'))
+STT_BATCH_WINDOW_MS = float(os.getenv('STT_BATCH_WINDOW_MS', '20'))
+
+
+@dataclass
+class _Job:
+    samples: object
+    beam_size: int
+    enqueued_at: float
+    depth: int
+    future: asyncio.Future
+    tenant: object = None
+
+
+class WhisperPool:
+    """
+    N replici Whisper ca thread-uri peste aceleași greutăți int8 (num_workers din CTranslate2),
+    în spatele unei cozi cu prioritate limitate. Dacă așteptarea depășește SLO-ul,
+    cererea trece pe modelul mic (tiny.en) în loc să întârzie pe toată lumea.
+    """
+
+    def __init__(self, model_name: str, workers: int = STT_WORKERS, cpu_threads: int = STT_CPU_THREADS,
+                 queue_size: int = STT_QUEUE_SIZE, slo_ms: float = STT_SLO_MS,
+                 fallback_model: Optional[str] = STT_FALLBACK_MODEL,
+                 batch_size: int = STT_BATCH_SIZE, batch_window_ms: float = STT_BATCH_WINDOW_MS):
+        self.model_name = model_name
+        self.workers = workers
+        self.cpu_threads = cpu_threads
+        self.slo_ms = slo_ms
+        self.fallback_name = fallback_model
+        print(f"🚀 Încărcare Whisper {model_name} ({workers} replici x {max(1, cpu_threads // workers)} thread-uri)...")
+        self.model = WhisperModel(model_name, device="cpu", compute_type="int8",
+                                  cpu_threads=max(1, cpu_threads // workers), num_workers=workers)
+        self.batch_size = batch_size
+        self.batch_window = batch_window_ms / 1000
+        self._pipelines = {}
+        self.batches = deque(maxlen=200)
+        self._fallback: Optional[WhisperModel] = None
+        self._fallback_lock: Optional[asyncio.Lock] = None
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="stt")
+        self._queue: Optional[asyncio.PriorityQueue] = None
+        self._queue_size = queue_size
+        self._workers: List[asyncio.Task] = []  # referințe tari: loop-ul ține task-urile doar slab
+        self._counter = itertools.count()  # ordine FIFO la aceeași prioritate
+        self._tenant_queued = Counter()     # câte cereri are fiecare guild/client la coadă
+        self._service_ms = deque(maxlen=50)
+        self.in_flight = 0
+        self.rejected = 0
+        self.degraded = 0
+        self.recent = deque(maxlen=200)
+
+    async def _fallback_model(self) -> Optional[WhisperModel]:
+        # Modelul mic se încarcă doar la prima suprasolicitare, pe thread (nu blocăm event loop-ul)
+        if self._fallback is None and self.fallback_name:
+            async with self._fallback_lock:
+                if self._fallback is None:
+                    print(f"⏬ Încărcare model de rezervă {self.fallback_name}...")
+                    self._fallback = await asyncio.to_thread(
+                        WhisperModel, self.fallback_name, device="cpu", compute_type="int8",
+                        cpu_threads=max(1, self.cpu_threads // self.workers), num_workers=self.workers)
+        return self._fallback
+
+    def _ensure_workers(self):
+        if self._queue is None:
+            self._queue = asyncio.PriorityQueue(maxsize=self._queue_size)
+            self._fallback_lock = asyncio.Lock()
+        # Un worker căzut e înlocuit; coada (și cererile din ea) rămân
+        self._workers = [task for task in self._workers if not task.done()]
+        loop = asyncio.get_running_loop()
+        while len(self._workers) < self.workers:
+            self._workers.append(loop.create_task(self._worker()))
+
+    @property
+    def depth(self) -> int:
+        return self._queue.qsize() if self._queue is not None else 0
+
+    def estimated_wait_ms(self) -> float:
+        if not self._service_ms:
+            return 0.0
+        avg = sum(self._service_ms) / len(self._service_ms)
+        return (self.depth + self.in_flight) * avg / self.workers
+
+    async def transcribe(self, samples, beam_size: int = 1, priority: int = 1, tenant=None) -> SttResult:
+        """
+        priority: număr mai mic = servit mai repede.
+        tenant: cine a trimis cererea (ex. guild_id). La aceeași prioritate, a n-a cerere a unui
+        tenant trece după primele n-1 ale celorlalți -> un guild gălăgios nu-i blochează pe restul.
+        """
+        self._ensure_workers()
+        if self._queue.full():
+            self.rejected += 1
+            raise SttOverloaded(f"coada STT e plină ({self.depth})")
+        future = asyncio.get_running_loop().create_future()
+        job = _Job(samples, beam_size, time.perf_counter(), self.depth, future, tenant)
+        rank = 0
+        if tenant is not None:
+            rank = self._tenant_queued[tenant]
+            self._tenant_queued[tenant] += 1
+        self._queue.put_nowait((priority, rank, next(self._counter), job))
+        return await future
+
+    def _dequeued(self, job: _Job):
+        if job.tenant is not None:
+            self._tenant_queued[job.tenant] -= 1
+            if self._tenant_queued[job.tenant] <= 0:
+                del self._tenant_queued[job.tenant]
+
+    def tenant_depth(self, tenant) -> int:
+        return self._tenant_queued.get(tenant, 0)
+
+    def _run(self, model: WhisperModel, samples, beam_size: int) -> str:
+        segments, _ = model.transcribe(samples, beam_size=beam_size)
+        return " ".join([s.text for s in segments]).strip()
+
+    def _run_batch(self, model: WhisperModel, jobs):
+        pipeline = self._pipelines.get(id(model))
+        if pipeline is None:
+            pipeline = self._pipelines[id(model)] = BatchedInferencePipeline(model=model)
+        return transcribe_batch(pipeline, [job.samples for job in jobs],
+                                beam_size=jobs[0].beam_size, batch_size=self.batch_size)
+
+    async def _next_jobs(self):
+        """Prima cerere + ce mai apare în fereastra de batching (frazele altor useri)."""
+        loop = asyncio.get_running_loop()
+        jobs = []
+        while not jobs:
+            *_, job = await self._queue.get()
+            self._dequeued(job)
+            if not job.future.cancelled():
+                jobs.append(job)
+        deadline = loop.time() + self.batch_window
+        while len(jobs) < self.batch_size:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            try:
+                *_, job = await asyncio.wait_for(self._queue.get(), remaining)
+            except asyncio.TimeoutError:
+                break
+            self._dequeued(job)
+            if not job.future.cancelled():
+                jobs.append(job)
+        return jobs
+
+    async def _worker(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            jobs = await self._next_jobs()
+            now = time.perf_counter()
+            waits_ms = [(now - job.enqueued_at) * 1000 for job in jobs]
+            model, name, degraded = self.model, self.model_name, False
+            # Am stat prea mult la coadă sau coada încă e lungă -> modelul mic
+            if max(waits_ms) > self.slo_ms or max(waits_ms) + self.estimated_wait_ms() > self.slo_ms:
+                fallback = await self._fallback_model()
+                if fallback is not None:
+                    model, name, degraded = fallback, self.fallback_name, True
+                    self.degraded += len(jobs)
+            self.in_flight += len(jobs)
+            started = time.perf_counter()
+            try:
+                if len(jobs) == 1:
+                    texts = [await loop.run_in_executor(self._executor, self._run, model, jobs[0].samples, jobs[0].beam_size)]
+                    rtf = 0.0
+                else:
+                    texts, batch = await loop.run_in_executor(self._executor, self._run_batch, model, jobs)
+                    rtf = batch.rtf
+                    self.batches.append(batch)
+                stt_ms = (time.perf_counter() - started) * 1000
+                if not degraded:
+                    self._service_ms.append(stt_ms / len(jobs))
+                for job, text, waited_ms in zip(jobs, texts, waits_ms):
+                    result = SttResult(text, name, waited_ms, job.depth, stt_ms, degraded, len(jobs), rtf)
+                    self.recent.append(result)
+                    if not job.future.done():
+                        job.future.set_result(result)
+            except Exception as e:
+                for job in jobs:
+                    if not job.future.done():
+                        job.future.set_exception(e)
+            finally:
+                self.in_flight -= len(jobs)
+                # Anulat (close) în timpul transcrierii: apelanții nu rămân agățați
+                for job in jobs:
+                    if not job.future.done():
+                        job.future.set_exception(SttOverloaded("pool-ul STT s-a oprit"))
+
+    async def close(self):
+        """Oprește workerii; cererile rămase la coadă primesc eroare. Modelul rămâne încărcat."""
+        for task in self._workers:
+            task.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        while self._queue is not None and not self._queue.empty():
+            *_, job = self._queue.get_nowait()
+            self._dequeued(job)
+            if not job.future.done():
+                job.future.set_exception(SttOverloaded("pool-ul STT s-a oprit"))
+
+    def stats(self) -> dict:
+        recent = list(self.recent)
+        return {
+            "workers": self.workers,
+            "queue_depth": self.depth,
+            "in_flight": self.in_flight,
+            "estimated_wait_ms": round(self.estimated_wait_ms(), 2),
+            "rejected": self.rejected,
+            "degraded": self.degraded,
+            "queued_by_tenant": {str(t): n for t, n in self._tenant_queued.items()},
+            "batches": [
+                {"size": b.size, "audio_s": round(b.audio_seconds, 2), "wall_s": round(b.wall_seconds, 3),
+                 "rtf": round(b.rtf, 3)}
+                for b in list(self.batches)[-20:]
+            ],
+            "recent": [
+                {"model": r.model, "queue_wait_ms": round(r.queue_wait_ms, 2), "queue_depth": r.queue_depth,
+                 "stt_ms": round(r.stt_ms, 2), "degraded": r.degraded, "batch_size": r.batch_size}
+                for r in recent[-20:]
+            ],
+        }
@@ -1,40 +1,191 @@
-from faster_whisper import WhisperModel
-import time
 import os
+import sys
+import json
+import time
+import socket
+import argparse
+import subprocess
+import urllib.error
+import urllib.request
+from datetime import datetime
+
+from model_registry import MODELS, memory_mb
+
+# Două moduri:
+#   python test_whisper.py                          -> încărcare Whisper + test.wav (timp + RAM), ca înainte
+#   python test_whisper.py startup --workers 2      -> pornește uvicorn și măsoară time-to-ready + RSS per worker
+#   python test_whisper.py startup --app server_vosk:app --env MODEL_PREFETCH=0 --label no-prefetch
 
-# Alegem modelul. 
+# Alegem modelul.
 # Optiuni: "tiny", "base", "small", "medium", "large-v3"
 # "tiny" e cel mai rapid (aproape instant). "base" e un balans bun. "small" e deja lent pe CPU.
-MODEL_SIZE = "base.en" # .en = model specific pt engleza (mai rapid decat cel multilingv)
-
-print(f"⏳ Încărcare model '{MODEL_SIZE}'...")
-start_load = time.time()
-
-# device="cpu" pentru ca esti pe WSL fara GPU passthrough probabil. 
-# compute_type="int8" face magia de viteza.
-model = WhisperModel(MODEL_SIZE, device="cpu", compute_type="int8")
-
-end_load = time.time()
-print(f"✅ Model încărcat în {end_load - start_load:.2f} secunde!")
-
-print("-" * 30)
-print("Pentru test, ai nevoie de un fișier audio 'test.wav' în folder.")
-print("Dacă nu ai, scriptul se va opri aici.")
-
-# Verificăm dacă ai un fișier de test (opțional)
-if os.path.exists("test.wav"):
-    print("🎤 Încep transcrierea...")
-    start_transcribe = time.time()
-    
-    segments, info = model.transcribe("test.wav", beam_size=5)
-    
-    full_text = ""
-    for segment in segments:
-        full_text += segment.text + " "
-        
-    end_transcribe = time.time()
-    
-    print(f"📝 Text: {full_text}")
-    print(f"⏱️ Timp transcriere: {end_transcribe - start_transcribe:.2f} secunde")
-else:
-    print("⚠️ Pune un fișier 'test.wav' scurt aici ca să testezi viteza de transcriere.")
+MODEL_SIZE = os.getenv('WHISPER_MODEL', 'base.en')  # .en = model specific pt engleza (mai rapid decat cel multilingv)
+RESULTS_DIR = os.getenv('BENCH_RESULTS_DIR', 'bench_results')
+
+
+def load_test():
+    from faster_whisper import WhisperModel
+
+    # device="cpu" pentru ca esti pe WSL fara GPU passthrough probabil.
+    # compute_type="int8" face magia de viteza.
+    MODELS.register("whisper", lambda: WhisperModel(MODEL_SIZE, device="cpu", compute_type="int8"))
+    print(f"⏳ Încărcare model '{MODEL_SIZE}'...")
+    model = MODELS.load("whisper")
+    status = MODELS.status()
+    print(f"✅ Model încărcat în {status['models']['whisper']['load_ms'] / 1000:.2f} secunde! "
+          f"(la {status['uptime_ms'] / 1000:.2f}s de la pornirea procesului, RSS {status['memory'].get('rss_mb')} MB)")
+
+    print("-" * 30)
+    # Verificăm dacă ai un fișier de test (opțional)
+    if os.path.exists("test.wav"):
+        print("🎤 Încep transcrierea...")
+        start_transcribe = time.time()
+        segments, info = model.transcribe("test.wav", beam_size=5)
+        full_text = " ".join(segment.text for segment in segments)
+        print(f"📝 Text: {full_text}")
+        print(f"⏱️ Timp transcriere: {time.time() - start_transcribe:.2f} secunde")
+    else:
+        print("⚠️ Pune un fișier 'test.wav' scurt aici ca să testezi viteza de transcriere.")
+
+
+# ---------------- Benchmark de pornire ----------------
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _get_ready(url: str, timeout: float = 1.0):
+    """(status HTTP, JSON) de la /ready; None dacă încă nu ascultă nimeni pe port."""
+    try:
+        with urllib.request.urlopen(url, timeout=timeout) as resp:
+            return resp.status, json.loads(resp.read())
+    except urllib.error.HTTPError as e:
+        try:
+            return e.code, json.loads(e.read())
+        except ValueError:
+            return e.code, {}
+    except (urllib.error.URLError, OSError, ValueError):
+        return None
+
+
+def _workers(pid: int):
+    """Procesele copil ale supervisorului uvicorn, fără resource_tracker-ul din multiprocessing."""
+    try:
+        with open(f"/proc/{pid}/task/{pid}/children") as f:
+            children = [int(p) for p in f.read().split()]
+    except OSError:
+        return []
+    workers = []
+    for child in children:
+        try:
+            with open(f"/proc/{child}/cmdline", "rb") as f:
+                if b"resource_tracker" in f.read():
+                    continue
+        except OSError:
+            continue
+        workers.append(child)
+    return workers
+
+
+def startup_run(app: str, workers: int, env: dict, timeout: float) -> dict:
+    port = _free_port()
+    cmd = [sys.executable, "-m", "uvicorn", app, "--host", "127.0.0.1", "--port", str(port),
+           "--workers", str(workers), "--log-level", "warning"]
+    url = f"http://127.0.0.1:{port}/ready"
+    started = time.perf_counter()
+    proc = subprocess.Popen(cmd, env={**os.environ, **env}, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    listening_ms = None
+    ready = {}  # pid -> ce a raportat /ready (fiecare conexiune nouă poate ajunge la alt worker)
+    try:
+        while time.perf_counter() - started < timeout and len(ready) < workers:
+            if proc.poll() is not None:
+                raise RuntimeError(f"procesul s-a oprit cu codul {proc.returncode}")
+            answer = _get_ready(url)
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            if answer is not None:
+                status, data = answer
+                if listening_ms is None:
+                    listening_ms = round(elapsed_ms, 1)
+                if status == 200 and data.get("pid") not in ready:
+                    ready[data["pid"]] = {"observed_ms": round(elapsed_ms, 1),
+                                          "time_to_ready_ms": data.get("time_to_ready_ms"),
+                                          "models": {name: {k: m.get(k) for k in ("load_ms", "warmup_ms", "rss_delta_mb")}
+                                                     for name, m in data.get("models", {}).items()
+                                                     if m.get("state") == "ready"}}
+            time.sleep(0.05)
+
+        # Memoria se citește cu procesele încă pornite; PSS arată ce e cu adevărat per worker
+        # Cu --workers > 1 uvicorn e doar supervisor, modelele stau în procesele copil
+        pids = _workers(proc.pid) if workers > 1 else [proc.pid]
+        for pid in pids:
+            ready.setdefault(pid, {"observed_ms": None, "time_to_ready_ms": None})["memory"] = memory_mb(pid)
+    finally:
+        proc.terminate()
+        try:
+            proc.wait(10)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+
+    return {"listening_ms": listening_ms, "all_ready": len([w for w in ready.values() if w.get("observed_ms")]) >= workers,
+            "workers": {str(pid): info for pid, info in ready.items()}}
+
+
+def _mean(values):
+    values = [v for v in values if v is not None]
+    return round(sum(values) / len(values), 1) if values else None
+
+
+def startup_bench(args):
+    env = dict(item.split("=", 1) for item in args.env)
+    runs = []
+    for i in range(args.runs):
+        run = startup_run(args.app, args.workers, env, args.timeout)
+        runs.append(run)
+        workers = run["workers"].values()
+        print(f"🏁 Rularea {i + 1}: ascultă după {run['listening_ms']} ms, gata: "
+              f"{[w.get('time_to_ready_ms') for w in workers]} ms, "
+              f"RSS {[w.get('memory', {}).get('rss_mb') for w in workers]} MB, "
+              f"PSS {[w.get('memory', {}).get('pss_mb') for w in workers]} MB")
+
+    workers = [w for run in runs for w in run["workers"].values()]
+    summary = {
+        "listening_ms": _mean(run["listening_ms"] for run in runs),
+        "time_to_ready_ms": _mean(w.get("time_to_ready_ms") for w in workers),
+        "time_to_ready_ms_max": max((w["time_to_ready_ms"] for w in workers if w.get("time_to_ready_ms")), default=None),
+        "rss_mb_per_worker": _mean(w.get("memory", {}).get("rss_mb") for w in workers),
+        "pss_mb_per_worker": _mean(w.get("memory", {}).get("pss_mb") for w in workers),
+        "failed_runs": sum(1 for run in runs if not run["all_ready"]),
+    }
+    print(f"📊 {json.dumps(summary)}")
+
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    label = args.label or f"{args.app.replace(':', '-')}-w{args.workers}"
+    path = os.path.join(RESULTS_DIR, f"startup-{datetime.now():%Y%m%d-%H%M%S}-{label}.json")
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"app": args.app, "workers": args.workers, "env": env, "summary": summary, "runs": runs}, f, indent=2)
+    print(f"💾 {path}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Timp de încărcare Whisper / benchmark de pornire")
+    sub = parser.add_subparsers(dest="cmd")
+    p_start = sub.add_parser("startup", help="time-to-ready și RSS per worker pentru servere")
+    p_start.add_argument("--app", default="server:app", help="server:app, server_vosk:app sau toxicity_server:app")
+    p_start.add_argument("--workers", type=int, default=1)
+    p_start.add_argument("--runs", type=int, default=3)
+    p_start.add_argument("--timeout", type=float, default=180)
+    p_start.add_argument("--env", action="append", default=[], help="VAR=valoare pentru procesul pornit")
+    p_start.add_argument("--label", default="")
+    args = parser.parse_args()
+
+    if args.cmd == "startup":
+        startup_bench(args)
+    else:
+        load_test()
+
+
+if __name__ == "__main__":
+    main()
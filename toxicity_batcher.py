@@ -0,0 +1,167 @@
+import time
+import asyncio
+from collections import Counter, deque
+from typing import Awaitable, Callable, Dict, List, Optional, Set
+
+
+class BatchMetrics:
+    """Statistici pentru reglarea ferestrei: mărimea batch-urilor și cât stau textele la coadă."""
+
+    def __init__(self, window: int = 1000):
+        self.batches = 0
+        self.items = 0
+        self.size_histogram: Counter = Counter()
+        self.queue_wait_ms: deque = deque(maxlen=window)
+        self.upstream_ms: deque = deque(maxlen=window)
+
+    def record(self, size: int, waits_ms: List[float], upstream_ms: float):
+        self.batches += 1
+        self.items += size
+        self.size_histogram[size] += 1
+        self.queue_wait_ms.extend(waits_ms)
+        self.upstream_ms.append(upstream_ms)
+
+    @staticmethod
+    def _percentile(values, p):
+        if not values:
+            return 0.0
+        ordered = sorted(values)
+        return ordered[min(len(ordered) - 1, int(p / 100 * len(ordered)))]
+
+    def snapshot(self) -> dict:
+        return {
+            "batches": self.batches,
+            "items": self.items,
+            "avg_batch_size": round(self.items / self.batches, 2) if self.batches else 0.0,
+            "batch_size_histogram": dict(sorted(self.size_histogram.items())),
+            "queue_wait_ms_p50": round(self._percentile(self.queue_wait_ms, 50), 2),
+            "queue_wait_ms_p95": round(self._percentile(self.queue_wait_ms, 95), 2),
+            "queue_wait_ms_max": round(max(self.queue_wait_ms, default=0.0), 2),
+            "upstream_ms_p50": round(self._percentile(self.upstream_ms, 50), 2),
+        }
+
+
+class ToxicityBatcher:
+    """
+    Strânge textele de la toți userii conectați câteva ms (sau până la max_batch_size)
+    și le trimite la BERT într-un singur POST {"texts": [...], "threshold": x}.
+    Răspunsul așteptat: {"results": [[labels text 1], [labels text 2], ...]}.
+    """
+
+    def __init__(self, session_factory: Callable, url: str, window_ms: float = 10,
+                 max_batch_size: int = 32,
+                 fallback: Optional[Callable[[str, float], Awaitable[Optional[List[dict]]]]] = None):
+        self.session_factory = session_factory
+        self.url = url
+        self.window = window_ms / 1000
+        self.max_batch_size = max_batch_size
+        # Dacă serviciul nu are endpoint de batch, trimitem textele unul câte unul
+        self.fallback = fallback
+        self.batch_supported = True
+        self.metrics = BatchMetrics()
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+        # Batch-urile trimise pe fundal: loop-ul ține doar referințe slabe la task-uri
+        self._dispatches: Set[asyncio.Task] = set()
+
+    def _ensure_worker(self):
+        if self._worker is None or self._worker.done():
+            # Ce a rămas în coada unui worker mort nu mai pleacă nicăieri: eliberăm apelanții
+            self._drain()
+            self._queue = asyncio.Queue()
+            self._worker = asyncio.get_running_loop().create_task(self._collect())
+
+    async def submit(self, text: str, threshold: float) -> Optional[List[dict]]:
+        if not self.batch_supported and self.fallback is not None:
+            return await self.fallback(text, threshold)
+        self._ensure_worker()
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((text, threshold, future, time.perf_counter()))
+        return await future
+
+    async def _collect(self):
+        loop = asyncio.get_running_loop()
+        batch: list = []
+        try:
+            await self._collect_forever(loop, batch)
+        finally:
+            # Anulat (sau căzut) în mijlocul ferestrei: textele strânse deja primesc None
+            self._resolve(batch)
+
+    async def _collect_forever(self, loop, batch: list):
+        while True:
+            batch.clear()
+            batch.append(await self._queue.get())
+            deadline = loop.time() + self.window
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+                except asyncio.TimeoutError:
+                    break
+            # Trimitem pe fundal ca fereastra următoare să înceapă imediat
+            by_threshold: Dict[float, list] = {}
+            for item in batch:
+                by_threshold.setdefault(item[1], []).append(item)
+            for threshold, items in by_threshold.items():
+                task = loop.create_task(self._dispatch(threshold, items))
+                self._dispatches.add(task)
+                task.add_done_callback(self._dispatches.discard)
+            batch.clear()
+
+    async def _dispatch(self, threshold: float, items: list):
+        sent_at = time.perf_counter()
+        waits_ms = [(sent_at - queued_at) * 1000 for _, _, _, queued_at in items]
+        results: Optional[List[List[dict]]] = None
+        try:
+            payload = {"texts": [text for text, _, _, _ in items], "threshold": threshold}
+            async with self.session_factory().post(self.url, json=payload) as resp:
+                if resp.status == 200:
+                    data = await resp.json()
+                    results = data.get("results")
+                elif resp.status in (404, 405) and self.fallback is not None:
+                    print(f"⚠️ {self.url} nu suportă batch ({resp.status}), revin la cereri individuale.")
+                    self.batch_supported = False
+        except Exception as e:
+            print(f"⚠️ Eroare API (batch): {e}")
+
+        if not self.batch_supported:
+            results = await asyncio.gather(*[self.fallback(text, threshold) for text, _, _, _ in items])
+        if not isinstance(results, list) or len(results) != len(items):
+            # None = eroare, clientul nu pune rezultatul în cache
+            results = [None for _ in items]
+
+        self.metrics.record(len(items), waits_ms, (time.perf_counter() - sent_at) * 1000)
+        for (_, _, future, _), labels in zip(items, results):
+            if not future.done():
+                future.set_result(labels)
+
+    @staticmethod
+    def _resolve(items: list):
+        # None = eroare (ca la un API căzut): clientul nu pune nimic în cache
+        for _, _, future, _ in items:
+            if not future.done():
+                future.set_result(None)
+
+    def _drain(self):
+        if self._queue is None:
+            return
+        pending = []
+        while not self._queue.empty():
+            pending.append(self._queue.get_nowait())
+        self._resolve(pending)
+
+    async def close(self):
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+        self._drain()
+        # Batch-urile deja trimise își primesc răspunsul (sau None la eroare) înainte de închiderea sesiunii
+        if self._dispatches:
+            await asyncio.gather(*self._dispatches, return_exceptions=True)
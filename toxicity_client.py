@@ -0,0 +1,183 @@
+import os
+import asyncio
+import aiohttp
+from typing import Dict, List, Optional, Tuple
+from toxicity_batcher import ToxicityBatcher
+from verdict_cache import VerdictCache, normalize_text
+from prefilter import PREFILTER_ENABLED, Prefilter
+
+# --- CONFIGURARE ---
+TOXICITY_API_URL = os.getenv('TOXICITY_API_URL', 'http://127.0.0.1:8000/check')  # "inprocess" = toxicity_server.py în proces
+INPROCESS = 'inprocess'
+DEFAULT_THRESHOLD = 0.5
+
+# Pool-ul de conexiuni (keep-alive) - se poate regla din .env
+POOL_LIMIT = int(os.getenv('TOXICITY_POOL_LIMIT', '100'))
+POOL_LIMIT_PER_HOST = int(os.getenv('TOXICITY_POOL_LIMIT_PER_HOST', '32'))
+KEEPALIVE_TIMEOUT = float(os.getenv('TOXICITY_KEEPALIVE_TIMEOUT', '60'))
+REQUEST_TIMEOUT = float(os.getenv('TOXICITY_TIMEOUT', '2'))
+CONNECT_TIMEOUT = float(os.getenv('TOXICITY_CONNECT_TIMEOUT', '0.5'))
+
+# Micro-batching între useri (0 = dezactivat, fiecare text pleacă separat)
+TOXICITY_BATCH_URL = os.getenv('TOXICITY_BATCH_URL', TOXICITY_API_URL + '_batch')
+BATCH_WINDOW_MS = float(os.getenv('TOXICITY_BATCH_WINDOW_MS', '0'))
+MAX_BATCH_SIZE = int(os.getenv('TOXICITY_MAX_BATCH_SIZE', '32'))
+
+# Cache de verdicte pe textul normalizat (0 intrări = dezactivat)
+CACHE_MAX_ENTRIES = int(os.getenv('TOXICITY_CACHE_SIZE', '10000'))
+CACHE_MAX_BYTES = int(os.getenv('TOXICITY_CACHE_MAX_BYTES', str(16 * 1024 * 1024)))
+CACHE_TTL = float(os.getenv('TOXICITY_CACHE_TTL', '3600'))
+
+
+class ToxicityClient:
+    """Client partajat: o singură sesiune aiohttp, conexiuni refolosite, cereri identice comasate."""
+
+    def __init__(self, url: str = TOXICITY_API_URL, limit: int = POOL_LIMIT,
+                 limit_per_host: int = POOL_LIMIT_PER_HOST, keepalive_timeout: float = KEEPALIVE_TIMEOUT,
+                 timeout: float = REQUEST_TIMEOUT, connect_timeout: float = CONNECT_TIMEOUT,
+                 batch_url: str = TOXICITY_BATCH_URL, batch_window_ms: float = BATCH_WINDOW_MS,
+                 max_batch_size: int = MAX_BATCH_SIZE,
+                 cache: Optional[VerdictCache] = None, prefilter: Optional[Prefilter] = None):
+        self.url = url
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.keepalive_timeout = keepalive_timeout
+        self.timeout = aiohttp.ClientTimeout(total=timeout, connect=connect_timeout)
+        self._session: Optional[aiohttp.ClientSession] = None
+        self.cache = cache
+        self.prefilter = prefilter
+        # Cereri aflate "în zbor": (text normalizat, threshold) -> Future cu rezultatul
+        self._inflight: Dict[Tuple[str, float], asyncio.Future] = {}
+        self.upstream_calls = 0
+        self.coalesced_calls = 0
+        self.batcher: Optional[ToxicityBatcher] = None
+        # Modelul rulează în același proces: fără HTTP/JSON, batching-ul îl face serviciul
+        self.local = None
+        if url == INPROCESS:
+            from toxicity_server import get_service
+            self.local = get_service()
+        elif batch_window_ms > 0:
+            self.batcher = ToxicityBatcher(self.get_session, batch_url, batch_window_ms,
+                                           max_batch_size, fallback=self._post)
+
+    def get_session(self) -> aiohttp.ClientSession:
+        # Sesiunea se creează leneș, în event loop-ul care o folosește (uvicorn / discord)
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self.limit,
+                limit_per_host=self.limit_per_host,
+                keepalive_timeout=self.keepalive_timeout,
+                ttl_dns_cache=300,
+            )
+            self._session = aiohttp.ClientSession(connector=connector, timeout=self.timeout)
+        return self._session
+
+    async def _post(self, text: str, threshold: float) -> Optional[List[dict]]:
+        # None = eroare (nu intră în cache), [] = text curat
+        if self.local is not None:
+            try:
+                return await self.local.check(text, threshold)
+            except Exception as e:
+                print(f"⚠️ Eroare model local: {e}")
+                return None
+        try:
+            payload = {"text": text, "threshold": threshold}
+            async with self.get_session().post(self.url, json=payload) as resp:
+                if resp.status == 200:
+                    data = await resp.json()
+                    return data.get("toxic_labels", [])
+        except Exception as e:
+            print(f"⚠️ Eroare API: {e}")
+        return None
+
+    async def check(self, text: str, threshold: float = DEFAULT_THRESHOLD) -> List[dict]:
+        if self.prefilter is not None and threshold == DEFAULT_THRESHOLD:
+            # Cazurile clare (lexicon / model liniar) nu mai ajung deloc la BERT.
+            # Benzile sunt reglate pe pragul implicit; alt prag (ex. rescore cu 0) merge direct la BERT.
+            decided = self.prefilter.decide(text, threshold)
+            if decided is not None:
+                return decided
+
+        key = (normalize_text(text), threshold)
+        if self.cache is not None:
+            cached = self.cache.get(key)
+            if cached is not None:
+                return cached
+
+        pending = self._inflight.get(key)
+        if pending is not None:
+            # Același text e deja trimis -> așteptăm același răspuns
+            self.coalesced_calls += 1
+            return await asyncio.shield(pending)
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        self.upstream_calls += 1
+        try:
+            if self.batcher is not None:
+                labels = await self.batcher.submit(text, threshold)
+            else:
+                labels = await self._post(text, threshold)
+            if labels is None:
+                labels = []
+            elif self.cache is not None:
+                self.cache.put(key, labels)
+            future.set_result(labels)
+            return labels
+        finally:
+            # Dacă am fost anulați, ceilalți care așteaptă primesc "safe" (ca înainte la eroare)
+            if not future.done():
+                future.set_result([])
+            self._inflight.pop(key, None)
+
+    def stats(self) -> dict:
+        data = {"upstream_calls": self.upstream_calls, "coalesced_calls": self.coalesced_calls}
+        if self.batcher is not None:
+            data["batching"] = self.batcher.metrics.snapshot()
+        if self.cache is not None:
+            data["cache"] = self.cache.stats()
+        if self.prefilter is not None:
+            data["prefilter"] = self.prefilter.stats()
+        if self.local is not None:
+            data["local_model"] = self.local.stats()
+        return data
+
+    def warm_up(self):
+        # În modul in-process modelul se încarcă pe fundal de la pornire, nu la prima frază
+        if self.local is not None:
+            self.local.warm_up()
+
+    async def close(self):
+        if self.batcher is not None:
+            await self.batcher.close()
+        if self.local is not None:
+            await self.local.close()
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+
+_client: Optional[ToxicityClient] = None
+
+
+def get_client() -> ToxicityClient:
+    global _client
+    if _client is None:
+        cache = None
+        if CACHE_MAX_ENTRIES > 0:
+            cache = VerdictCache(CACHE_MAX_ENTRIES, CACHE_MAX_BYTES, CACHE_TTL)
+        prefilter = Prefilter.load() if PREFILTER_ENABLED else None
+        _client = ToxicityClient(cache=cache, prefilter=prefilter)
+    return _client
+
+
+async def check_toxicity(text: str, threshold: float = DEFAULT_THRESHOLD) -> List[dict]:
+    """Apel HTTP către microserviciu (prin clientul partajat)."""
+    return await get_client().check(text, threshold)
+
+
+async def close_client():
+    global _client
+    if _client is not None:
+        await _client.close()
+        _client = None
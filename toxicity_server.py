@@ -0,0 +1,370 @@
+import os
+import json
+import time
+import asyncio
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from typing import List, Optional, Tuple
+
+import numpy as np
+from fastapi import FastAPI
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+
+from model_registry import MODELS
+from toxicity_batcher import BatchMetrics
+
+# Serviciul de toxicitate al proiectului (același contract ca vechiul BERT extern):
+#   POST /check        {"text": "...", "threshold": 0.5}      -> {"toxic_labels": [{"label", "score"}]}
+#   POST /check_batch  {"texts": [...], "threshold": 0.5}     -> {"results": [[...], [...]]}
+# Separat:      uvicorn toxicity_server:app --port 8000
+# În proces:    TOXICITY_API_URL=inprocess în .env (server.py / server_vosk.py / bot.py, fără HTTP)
+# Modelul:      python toxicity_server.py export --model unitary/toxic-bert
+
+# --- CONFIGURARE ---
+TOXICITY_MODEL_DIR = os.getenv('TOXICITY_MODEL_DIR', 'toxicity_model')        # model_int8.onnx + tokenizer.json + config.json
+TOXICITY_MODEL_FILE = os.getenv('TOXICITY_MODEL_FILE', 'model_int8.onnx')
+TOXICITY_MAX_LENGTH = int(os.getenv('TOXICITY_MAX_LENGTH', '128'))           # tokeni; frazele din voce sunt scurte
+TOXICITY_THREADS = int(os.getenv('TOXICITY_THREADS', '0'))                   # thread-uri onnxruntime (0 = automat)
+TOXICITY_MODEL_BATCH_MS = float(os.getenv('TOXICITY_MODEL_BATCH_MS', '5'))   # cât strângem texte înainte de inferență
+TOXICITY_MODEL_MAX_BATCH = int(os.getenv('TOXICITY_MODEL_MAX_BATCH', '32'))
+TOXICITY_TOKEN_CACHE = int(os.getenv('TOXICITY_TOKEN_CACHE', '4096'))        # texte tokenizate ținute în memorie
+TOXICITY_IGNORE_LABELS = {l.strip().lower() for l in
+                          os.getenv('TOXICITY_IGNORE_LABELS', 'non-toxic,non_toxic,not_toxic,neutral').split(',')}
+
+
+class ToxicityModel:
+    """Transformer cuantizat int8 (ONNX) pe CPU + tokenizer rapid cu cache pe text."""
+
+    def __init__(self, model_dir: str = TOXICITY_MODEL_DIR, model_file: str = TOXICITY_MODEL_FILE,
+                 max_length: int = TOXICITY_MAX_LENGTH, threads: int = TOXICITY_THREADS,
+                 token_cache: int = TOXICITY_TOKEN_CACHE):
+        import onnxruntime as ort
+        from tokenizers import Tokenizer
+
+        path = os.path.join(model_dir, model_file)
+        if not os.path.exists(path):
+            # Nu SystemExit: în modul in-process ar opri botul / serverul care ne-a încărcat
+            raise FileNotFoundError(f"Nu găsesc {path}. Rulează: python toxicity_server.py export --out {model_dir}")
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads > 0:
+            options.intra_op_num_threads = threads
+        self.session = ort.InferenceSession(path, options, providers=["CPUExecutionProvider"])
+        self.input_names = {i.name for i in self.session.get_inputs()}
+
+        self.tokenizer = Tokenizer.from_file(os.path.join(model_dir, "tokenizer.json"))
+        self.tokenizer.no_padding()
+        self.tokenizer.enable_truncation(max_length)
+        self.pad_id = next((self.tokenizer.token_to_id(t) for t in ("[PAD]", "<pad>")
+                            if self.tokenizer.token_to_id(t) is not None), 0)
+
+        with open(os.path.join(model_dir, "config.json"), encoding="utf-8") as f:
+            config = json.load(f)
+        id2label = config.get("id2label") or {}
+        self.labels = [id2label.get(str(i), f"LABEL_{i}") for i in range(len(id2label))]
+        # toxic-bert e multi-label (sigmoid pe fiecare clasă); modelele binare folosesc softmax
+        self.multi_label = config.get("problem_type") == "multi_label_classification" or len(self.labels) > 2
+        self.model_file = path
+        self.inferences = 0
+
+        # Aceleași fraze revin des ("shut up", "gg") -> tokenizăm o singură dată
+        self._encode = lru_cache(maxsize=token_cache)(self._encode_uncached)
+
+    def _encode_uncached(self, text: str) -> Tuple[Tuple[int, ...], Tuple[int, ...]]:
+        encoding = self.tokenizer.encode(text)
+        return tuple(encoding.ids), tuple(encoding.type_ids)
+
+    def predict(self, texts: List[str]) -> np.ndarray:
+        """Probabilități [len(texts), nr. etichete]; un singur apel onnxruntime pentru tot batch-ul."""
+        encoded = [self._encode(text.strip()) for text in texts]
+        width = max(len(ids) for ids, _ in encoded)
+        input_ids = np.full((len(encoded), width), self.pad_id, dtype=np.int64)
+        type_ids = np.zeros((len(encoded), width), dtype=np.int64)
+        mask = np.zeros((len(encoded), width), dtype=np.int64)
+        for row, (ids, types) in enumerate(encoded):
+            input_ids[row, :len(ids)] = ids
+            type_ids[row, :len(types)] = types
+            mask[row, :len(ids)] = 1
+
+        feeds = {"input_ids": input_ids, "attention_mask": mask, "token_type_ids": type_ids}
+        logits = self.session.run(None, {k: v for k, v in feeds.items() if k in self.input_names})[0]
+        self.inferences += 1
+        if self.multi_label:
+            return 1.0 / (1.0 + np.exp(-logits))
+        exp = np.exp(logits - logits.max(axis=1, keepdims=True))
+        return exp / exp.sum(axis=1, keepdims=True)
+
+    def labels_for(self, probs: np.ndarray, threshold: float) -> List[dict]:
+        found = [{"label": label, "score": round(float(score), 4)}
+                 for label, score in zip(self.labels, probs)
+                 if score >= threshold and label.lower() not in TOXICITY_IGNORE_LABELS]
+        return sorted(found, key=lambda l: l["score"], reverse=True)
+
+    def stats(self) -> dict:
+        info = self._encode.cache_info()
+        lookups = info.hits + info.misses
+        return {"model": self.model_file, "labels": self.labels, "inferences": self.inferences,
+                "token_cache": {"entries": info.currsize, "hits": info.hits, "misses": info.misses,
+                                "hit_rate": round(info.hits / lookups, 4) if lookups else 0.0}}
+
+
+class ToxicityService:
+    """
+    Micro-batching în fața modelului: textele venite în aceeași fereastră (de la /check, /check_batch
+    sau din proces) intră într-o singură inferență. Inferența rulează pe un thread dedicat,
+    ca event loop-ul (websocket-uri, Discord) să nu se blocheze.
+    """
+
+    def __init__(self, window_ms: float = TOXICITY_MODEL_BATCH_MS, max_batch: int = TOXICITY_MODEL_MAX_BATCH):
+        self.window = window_ms / 1000
+        self.max_batch = max_batch
+        self.model: Optional[ToxicityModel] = None
+        self.metrics = BatchMetrics()
+        # Un singur worker: batch-urile se execută pe rând, onnxruntime își folosește singur nucleele
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="toxicity")
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+        MODELS.register("toxicity", ToxicityModel, warmup=lambda model: model.predict(["warm up"]),
+                        files=lambda: [TOXICITY_MODEL_DIR])
+
+    def warm_up(self):
+        # Pe fundal: serverul răspunde imediat, /ready spune când modelul e gata
+        MODELS.warm_up(["toxicity"])
+
+    async def start(self):
+        # Primul apel înainte de warm-up așteaptă încărcarea (pe thread, o singură dată)
+        if self.model is None:
+            self.model = await MODELS.get("toxicity")
+        if self._worker is None or self._worker.done():
+            self._drain()
+            self._queue = asyncio.Queue()
+            self._worker = asyncio.get_running_loop().create_task(self._collect())
+
+    async def check(self, text: str, threshold: float = 0.5) -> List[dict]:
+        return (await self.check_batch([text], threshold))[0]
+
+    async def check_batch(self, texts: List[str], threshold: float = 0.5) -> List[List[dict]]:
+        if not texts:
+            return []
+        await self.start()
+        loop = asyncio.get_running_loop()
+        futures = []
+        for text in texts:
+            if not text.strip():
+                futures.append(None)
+                continue
+            future = loop.create_future()
+            self._queue.put_nowait((text, future, time.perf_counter()))
+            futures.append(future)
+        # gather: dacă un batch eșuează, erorile celorlalte texte nu rămân necitite
+        done = iter(await asyncio.gather(*[f for f in futures if f is not None]))
+        probs = [next(done) if f is not None else None for f in futures]
+        return [self.model.labels_for(p, threshold) if p is not None else [] for p in probs]
+
+    async def _collect(self):
+        loop = asyncio.get_running_loop()
+        batch: list = []
+        try:
+            await self._collect_forever(loop, batch)
+        finally:
+            # Oprit în mijlocul unui batch: apelanții primesc eroare, nu așteaptă la nesfârșit
+            self._fail(batch)
+
+    async def _collect_forever(self, loop, batch: list):
+        while True:
+            batch.clear()
+            batch.append(await self._queue.get())
+            deadline = loop.time() + self.window
+            while len(batch) < self.max_batch:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+                except asyncio.TimeoutError:
+                    break
+            started = time.perf_counter()
+            waits_ms = [(started - queued_at) * 1000 for _, _, queued_at in batch]
+            try:
+                probs = await loop.run_in_executor(self._executor, self.model.predict,
+                                                   [text for text, _, _ in batch])
+            except Exception as e:
+                print(f"⚠️ Eroare inferență toxicitate: {e}")
+                self._fail(batch, e)
+                batch.clear()
+                continue
+            self.metrics.record(len(batch), waits_ms, (time.perf_counter() - started) * 1000)
+            for (_, future, _), row in zip(batch, probs):
+                if not future.done():
+                    future.set_result(row)
+            batch.clear()
+
+    @staticmethod
+    def _fail(items: list, error: Optional[BaseException] = None):
+        for _, future, _ in items:
+            if not future.done():
+                future.set_exception(error or RuntimeError("serviciul de toxicitate s-a oprit"))
+
+    def _drain(self):
+        if self._queue is None:
+            return
+        pending = []
+        while not self._queue.empty():
+            pending.append(self._queue.get_nowait())
+        self._fail(pending)
+
+    def stats(self) -> dict:
+        data = {"window_ms": self.window * 1000, "max_batch": self.max_batch,
+                "batching": self.metrics.snapshot()}
+        if self.model is not None:
+            data.update(self.model.stats())
+        return data
+
+    async def close(self):
+        # Modelul rămâne încărcat (singleton); doar colectorul se oprește, start() îl repornește
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+        self._drain()
+
+
+_service: Optional[ToxicityService] = None
+
+
+def get_service() -> ToxicityService:
+    global _service
+    if _service is None:
+        _service = ToxicityService()
+    return _service
+
+
+# ---------------- HTTP ----------------
+
+app = FastAPI()
+
+
+class CheckRequest(BaseModel):
+    text: str
+    threshold: float = 0.5
+
+
+class CheckBatchRequest(BaseModel):
+    texts: List[str]
+    threshold: float = 0.5
+
+
+@app.on_event("startup")
+async def load_model():
+    get_service().warm_up()
+
+
+@app.on_event("shutdown")
+async def close_service():
+    await get_service().close()
+
+
+@app.post("/check")
+async def check(request: CheckRequest):
+    return {"toxic_labels": await get_service().check(request.text, request.threshold)}
+
+
+@app.post("/check_batch")
+async def check_batch(request: CheckBatchRequest):
+    return {"results": await get_service().check_batch(request.texts, request.threshold)}
+
+
+@app.get("/stats")
+async def get_stats():
+    return JSONResponse(get_service().stats())
+
+
+@app.get("/ready")
+async def get_ready():
+    return JSONResponse(MODELS.status(), status_code=200 if MODELS.ready() else 503)
+
+
+# ---------------- CLI ----------------
+
+def _onnx_size(path: str) -> int:
+    """Mărimea modelului pe disc: graful .onnx + fișierele external data la care trimite."""
+    import onnx
+
+    model = onnx.load(path, load_external_data=False)
+    locations = {entry.value for tensor in model.graph.initializer
+                 if tensor.data_location == onnx.TensorProto.EXTERNAL
+                 for entry in tensor.external_data if entry.key == "location"}
+    directory = os.path.dirname(path)
+    return os.path.getsize(path) + sum(os.path.getsize(os.path.join(directory, location))
+                                       for location in locations)
+
+
+def export_model(model_name: str, out_dir: str, max_length: int = TOXICITY_MAX_LENGTH):
+    """HF -> ONNX (fp32) -> int8 dinamic. Are nevoie de torch + transformers + onnx (doar la export)."""
+    import torch
+    from transformers import AutoModelForSequenceClassification, AutoTokenizer
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    os.makedirs(out_dir, exist_ok=True)
+    tokenizer = AutoTokenizer.from_pretrained(model_name)
+    model = AutoModelForSequenceClassification.from_pretrained(model_name).eval()
+    tokenizer.save_pretrained(out_dir)   # tokenizer.json (tokenizer rapid)
+    model.config.save_pretrained(out_dir)  # config.json cu id2label / problem_type
+
+    sample = tokenizer(["you are an idiot", "good game everyone"], padding=True,
+                       truncation=True, max_length=max_length, return_tensors="pt")
+    names = [n for n in ("input_ids", "attention_mask", "token_type_ids") if n in sample]
+    fp32_path = os.path.join(out_dir, "model.onnx")
+    with torch.no_grad():
+        torch.onnx.export(model, tuple(sample[n] for n in names), fp32_path,
+                          input_names=names, output_names=["logits"],
+                          dynamic_axes={**{n: {0: "batch", 1: "tokens"} for n in names}, "logits": {0: "batch"}},
+                          opset_version=17)
+    int8_path = os.path.join(out_dir, TOXICITY_MODEL_FILE)
+    # Greutățile int8 în fișier separat (external data): onnxruntime le mapează (mmap) în loc
+    # să le copieze în heap, deci workerii uvicorn / procesele bot + server împart aceleași pagini
+    quantize_dynamic(fp32_path, int8_path, weight_type=QuantType.QInt8, use_external_data_format=True)
+    fp32_mb, int8_mb = (_onnx_size(p) / 1024 / 1024 for p in (fp32_path, int8_path))
+    print(f"✅ {model_name} -> {int8_path} ({fp32_mb:.0f} MB fp32 -> {int8_mb:.0f} MB int8)")
+
+
+async def _check_cli(texts: List[str], threshold: float):
+    service = get_service()
+    start = time.perf_counter()
+    await service.start()
+    print(f"⏱️ Încărcare: {(time.perf_counter() - start) * 1000:.0f} ms")
+    for text in texts:
+        start = time.perf_counter()
+        labels = await service.check(text, threshold)
+        print(f"{(time.perf_counter() - start) * 1000:6.1f} ms  {text!r} -> {labels}")
+    await service.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serviciul local de toxicitate (ONNX int8)")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    p_export = sub.add_parser("export", help="exportă și cuantizează un model HuggingFace")
+    p_export.add_argument("--model", default="unitary/toxic-bert")
+    p_export.add_argument("--out", default=TOXICITY_MODEL_DIR)
+    p_check = sub.add_parser("check", help="verdicte pentru câteva texte, fără server")
+    p_check.add_argument("texts", nargs="+")
+    p_check.add_argument("--threshold", type=float, default=0.5)
+    args = parser.parse_args()
+
+    if args.cmd == "export":
+        export_model(args.model, args.out)
+    else:
+        try:
+            asyncio.run(_check_cli(args.texts, args.threshold))
+        except FileNotFoundError as e:
+            raise SystemExit(f"❌ {e}")
+
+
+if __name__ == "__main__":
+    main()
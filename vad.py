@@ -0,0 +1,96 @@
+import os
+import time
+import threading
+import numpy as np
+from typing import Optional
+
+# --- CONFIGURARE ---
+VAD_FRAME_MS = int(os.getenv('VAD_FRAME_MS', '30'))
+VAD_MIN_DB = float(os.getenv('VAD_MIN_DB', '-45'))          # sub atât e liniște oricum
+VAD_MARGIN_DB = float(os.getenv('VAD_MARGIN_DB', '12'))     # cât peste zgomotul de fond e vorbire
+VAD_SPEECH_DB = float(os.getenv('VAD_SPEECH_DB', '-35'))    # peste atât e sigur vorbire
+VAD_MIN_SPEECH_MS = int(os.getenv('VAD_MIN_SPEECH_MS', '200'))
+VAD_PADDING_MS = int(os.getenv('VAD_PADDING_MS', '150'))    # păstrăm puțin context la capete
+
+
+class VadGate:
+    """
+    VAD pe energie, vectorizat pe cadre de ~30ms. Înainte de STT:
+    aruncă ferestrele fără vorbire și taie liniștea de la început/sfârșit.
+    Primește float32 [-1, 1] sau int16 și întoarce o felie (view) din același buffer.
+    """
+
+    def __init__(self, sample_rate: int = 16000, frame_ms: int = VAD_FRAME_MS, min_db: float = VAD_MIN_DB,
+                 margin_db: float = VAD_MARGIN_DB, speech_db: float = VAD_SPEECH_DB,
+                 min_speech_ms: int = VAD_MIN_SPEECH_MS, padding_ms: int = VAD_PADDING_MS):
+        self.sample_rate = sample_rate
+        self.frame = int(sample_rate * frame_ms / 1000)
+        self.min_db = min_db
+        self.margin_db = margin_db
+        self.speech_db = speech_db
+        self.min_speech_frames = max(1, min_speech_ms // frame_ms)
+        self.padding_frames = padding_ms // frame_ms
+        self._lock = threading.Lock()
+        self.segments_in = 0
+        self.segments_dropped = 0
+        self.audio_in_s = 0.0
+        self.audio_out_s = 0.0
+        self.vad_cpu_s = 0.0
+        # Cost mediu STT (secunde CPU per secundă de audio), raportat de cine face transcrierea
+        self._stt_cost_audio_s = 0.0
+        self._stt_cost_cpu_s = 0.0
+
+    def frame_db(self, samples: np.ndarray) -> np.ndarray:
+        frames = samples[: len(samples) - len(samples) % self.frame].reshape(-1, self.frame)
+        scale = 32768.0 if samples.dtype == np.int16 else 1.0
+        power = np.mean(np.square(frames, dtype=np.float32), axis=1) / (scale * scale)
+        return 10.0 * np.log10(power + 1e-10)
+
+    def speech_mask(self, samples: np.ndarray) -> np.ndarray:
+        db = self.frame_db(samples)
+        if db.size == 0:
+            return np.zeros(0, dtype=bool)
+        # Pragul se adaptează la zgomotul de fond, dar nu urcă peste nivelul normal de vorbire
+        noise_floor = np.percentile(db, 10)
+        return db > max(self.min_db, min(noise_floor + self.margin_db, self.speech_db))
+
+    def process(self, samples: np.ndarray) -> Optional[np.ndarray]:
+        """None = doar liniște (nu mai chemăm modelul), altfel audio tăiat la capete."""
+        # CPU-ul thread-ului curent: process_time ar număra și STT-ul / Discord de pe alte thread-uri
+        started = time.thread_time()
+        speech = np.flatnonzero(self.speech_mask(samples))
+        if speech.size < self.min_speech_frames:
+            result = None
+        else:
+            # Păstrăm câteva cadre de context în jurul vorbirii
+            start = max(0, speech[0] - self.padding_frames) * self.frame
+            end = min(len(samples), (speech[-1] + 1 + self.padding_frames) * self.frame)
+            result = samples[start:end]
+        with self._lock:
+            self.segments_in += 1
+            self.audio_in_s += len(samples) / self.sample_rate
+            if result is None:
+                self.segments_dropped += 1
+            else:
+                self.audio_out_s += len(result) / self.sample_rate
+            self.vad_cpu_s += time.thread_time() - started
+        return result
+
+    def record_stt(self, audio_s: float, cpu_s: float):
+        """Pentru estimarea CPU-ului economisit: cât a costat STT-ul pe audio-ul lăsat să treacă."""
+        with self._lock:
+            self._stt_cost_audio_s += audio_s
+            self._stt_cost_cpu_s += cpu_s
+
+    def stats(self) -> dict:
+        saved_audio = self.audio_in_s - self.audio_out_s
+        cost = self._stt_cost_cpu_s / self._stt_cost_audio_s if self._stt_cost_audio_s else 0.0
+        return {
+            "segments_in": self.segments_in,
+            "segments_dropped": self.segments_dropped,
+            "audio_in_s": round(self.audio_in_s, 2),
+            "audio_out_s": round(self.audio_out_s, 2),
+            "audio_saved_s": round(saved_audio, 2),
+            "stt_cpu_saved_s_est": round(saved_audio * cost, 2),
+            "vad_cpu_s": round(self.vad_cpu_s, 3),
+        }
@@ -0,0 +1,101 @@
+import re
+import sys
+import time
+import threading
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Hashable, Optional
+
+_PUNCTUATION = re.compile(r"[^\w\s]", re.UNICODE)
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_text(text: str) -> str:
+    """'Youth football.' (Whisper) și 'youth football' (Vosk) -> aceeași cheie."""
+    text = unicodedata.normalize("NFKC", text).casefold()
+    text = _PUNCTUATION.sub(" ", text).replace("_", " ")
+    return _WHITESPACE.sub(" ", text).strip()
+
+
+def _estimate_size(value: Any) -> int:
+    # Aproximare ieftină a memoriei ocupate (liste de dict-uri {"label", "score"})
+    size = sys.getsizeof(value)
+    if isinstance(value, (list, tuple)):
+        size += sum(_estimate_size(v) for v in value)
+    elif isinstance(value, dict):
+        size += sum(sys.getsizeof(k) + _estimate_size(v) for k, v in value.items())
+    return size
+
+
+class VerdictCache:
+    """Cache LRU + TTL pentru verdictele BERT, limitat la număr de intrări și la memorie."""
+
+    def __init__(self, max_entries: int = 10000, max_bytes: int = 16 * 1024 * 1024,
+                 ttl_seconds: float = 3600):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl_seconds
+        # cheie -> (valoare, expiră_la, mărime)
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._bytes = 0
+        # bot.py transcrie pe thread-uri, deci protejăm structura
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            value, expires_at, size = entry
+            if expires_at < time.monotonic():
+                self._remove(key, size)
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key: Hashable, value: Any):
+        size = _estimate_size(key) + _estimate_size(value)
+        if size > self.max_bytes or self.max_entries <= 0:
+            return
+        with self._lock:
+            old = self._data.pop(key, None)
+            if old is not None:
+                self._bytes -= old[2]
+            self._data[key] = (value, time.monotonic() + self.ttl, size)
+            self._bytes += size
+            while len(self._data) > self.max_entries or self._bytes > self.max_bytes:
+                old_key, (_, _, old_size) = self._data.popitem(last=False)
+                self._bytes -= old_size
+                self.evictions += 1
+
+    def _remove(self, key: Hashable, size: int):
+        del self._data[key]
+        self._bytes -= size
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._bytes = 0
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._data),
+            "bytes": self._bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }